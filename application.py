@@ -1,14 +1,46 @@
-from flask import Flask,request,render_template
-import numpy as np
-import pandas as pd
+import os
 
-from sklearn.preprocessing import StandardScaler
+from flask import Flask,Response,request,render_template,jsonify
+
+## Only what scoring needs is imported here: with the lite model (see model_export.py) a worker
+## never loads pandas, sklearn or the boosting libraries
 from src.pipeline.predict_pipeline import CustomData,PredictPipeline
+from src.pipeline.schema import SchemaError
+from src.pipeline.model_registry import get_model_registry
+from src.pipeline.batcher import PredictionBatcher,PredictionBatcherConfig
+from src.pipeline.metrics import get_metrics
+from src.pipeline.prediction_cache import PredictionCache,PredictionCacheConfig
 
 application=Flask(__name__)
 
+## Upper limit on records per /predict call, keeps one request from holding a worker too long
+MAX_BATCH_RECORDS=10000
+
 app=application
 
+## Request timings, batch sizes, errors and model loads, served at /metrics (PREDICT_METRICS=0 disables them)
+metrics=get_metrics()
+
+## Load the model and preprocessor once when the worker starts instead of on every request
+model_registry=get_model_registry()
+model_registry.load()
+
+## Repeated inputs are answered from a cache tied to the model version (PREDICT_CACHE=0 disables it,
+## PREDICT_CACHE_DIR=<folder> shares the results between the workers of this machine)
+prediction_cache_config=PredictionCacheConfig()
+prediction_cache=PredictionCache(prediction_cache_config,metrics=metrics) if prediction_cache_config.enabled else None
+
+## Opt-in micro-batching of concurrent /predictdata requests, enabled with PREDICT_BATCHING=1
+prediction_batcher=None
+if os.environ.get('PREDICT_BATCHING')=='1':
+    prediction_batcher=PredictionBatcher(
+        predict_fn=PredictPipeline(registry=model_registry).predict_rows,
+        config=PredictionBatcherConfig(
+            max_batch_size=int(os.environ.get('PREDICT_BATCH_MAX_SIZE',32)),
+            max_wait_ms=float(os.environ.get('PREDICT_BATCH_MAX_WAIT_MS',5)),
+        )
+    )
+
 ## Route for a home page
 
 @app.route('/')
@@ -20,25 +52,53 @@ def predict_datapoint():
     if request.method=='GET':
         return render_template('home.html')
     else:
-        data=CustomData(
-            gender=request.form.get('gender'),
-            race_ethnicity=request.form.get('ethnicity'),
-            parental_level_of_education=request.form.get('parental_level_of_education'),
-            lunch=request.form.get('lunch'),
-            test_preparation_course=request.form.get('test_preparation_course'),
-            reading_score=float(request.form.get('writing_score')),
-            writing_score=float(request.form.get('reading_score'))
+        with metrics.time_request('predictdata'):
+            try:
+                with metrics.time_phase('parse'):
+                    ## Validates and coerces every field, the form's field names are mapped in the schema
+                    data=CustomData.from_form(request.form)
+            except SchemaError as e:
+                metrics.count_error('predictdata','bad_request')
+                return Response(f'Invalid input: {e}',status=400,mimetype='text/plain')
+            try:
+                with metrics.time_phase('frame_build'):
+                    row=data.get_data_as_row()
 
-        )
-        pred_df=data.get_data_as_data_frame()
-        print(pred_df)
-        print("Before Prediction")
-
-        predict_pipeline=PredictPipeline()
-        print("Mid Prediction")
-        results=predict_pipeline.predict(pred_df)
-        print("after Prediction")
-        return render_template('home.html',results=results[0])
+                predict_pipeline=PredictPipeline(registry=model_registry,batcher=prediction_batcher,metrics=metrics,cache=prediction_cache)
+                results=predict_pipeline.predict_row(row)
+            except Exception:
+                metrics.count_error('predictdata','exception')
+                raise
+            return render_template('home.html',results=results)
+
+## JSON route for bulk scoring, accepts {"records": [...]} or a plain list of records
+@app.route('/predict',methods=['POST'])
+def predict_batch():
+    with metrics.time_request('predict'):
+        with metrics.time_phase('parse'):
+            payload=request.get_json(silent=True)
+            records=payload.get('records') if isinstance(payload,dict) else payload
+        if not isinstance(records,list):
+            metrics.count_error('predict','bad_request')
+            return jsonify(error='Request body must be a JSON list of records or {"records": [...]}'),400
+        if len(records)>MAX_BATCH_RECORDS:
+            metrics.count_error('predict','too_large')
+            return jsonify(error=f'At most {MAX_BATCH_RECORDS} records per request'),413
+
+        try:
+            predict_pipeline=PredictPipeline(registry=model_registry,metrics=metrics,cache=prediction_cache)
+            predictions,errors=predict_pipeline.predict_batch(records)
+        except Exception:
+            metrics.count_error('predict','exception')
+            raise
+        if errors:
+            metrics.count_error('predict','invalid_record',amount=len(errors))
+        return jsonify(predictions=predictions,errors=errors)
+
+## Prometheus scrape endpoint, numbers are per worker process
+@app.route('/metrics',methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(),mimetype='text/plain; version=0.0.4')
     
 
 if __name__=="__main__":
@@ -0,0 +1,187 @@
+## Async (ASGI) version of application.py, for serving with many concurrent connections:
+##     uvicorn asgi_app:app --host 0.0.0.0 --port 8000
+## Same routes and responses as the Flask app. Requests are parsed on the event loop and the
+## transform + predict work is handed to a bounded worker pool (src/pipeline/async_scorer.py),
+## so a slow prediction never blocks other connections. When too many requests are waiting for
+## the pool the server answers 503 right away (PREDICT_MAX_PENDING, PREDICT_POOL_WORKERS and
+## PREDICT_POOL_BACKEND=thread|process configure the pool).
+## It is a plain ASGI callable, only uvicorn (or any other ASGI server) is needed to run it.
+
+import json
+import os
+from urllib.parse import parse_qs
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from src.logger import logging
+from src.pipeline.predict_pipeline import CustomData,PredictPipeline
+from src.pipeline.schema import SchemaError
+from src.pipeline.model_registry import get_model_registry
+from src.pipeline.metrics import get_metrics
+from src.pipeline.prediction_cache import PredictionCache,PredictionCacheConfig
+from src.pipeline.async_scorer import AsyncScorer,ScorerBusyError
+
+## Same limit as application.py
+MAX_BATCH_RECORDS=10000
+## Larger request bodies are rejected before they are read completely
+MAX_BODY_BYTES=8*1024*1024
+
+## The Flask templates, url_for is the only Flask helper they use
+ROUTES={'index':'/','predict_datapoint':'/predictdata'}
+templates=Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(os.path.abspath(__file__)),'templates')),
+    autoescape=select_autoescape(),
+)
+templates.globals['url_for']=lambda endpoint,**kwargs: ROUTES[endpoint]
+
+metrics=get_metrics()
+model_registry=get_model_registry()
+prediction_cache_config=PredictionCacheConfig()
+prediction_cache=PredictionCache(prediction_cache_config,metrics=metrics) if prediction_cache_config.enabled else None
+scorer=AsyncScorer(
+    pipeline=PredictPipeline(registry=model_registry,metrics=metrics,cache=prediction_cache),
+    metrics=metrics,
+)
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+async def read_body(receive):
+    body=b''
+    more_body=True
+    while more_body:
+        message=await receive()
+        body+=message.get('body',b'')
+        more_body=message.get('more_body',False)
+        if len(body)>MAX_BODY_BYTES:
+            raise BodyTooLarge()
+    return body
+
+
+async def send_response(send,status,body,content_type,headers=()):
+    if isinstance(body,str):
+        body=body.encode('utf-8')
+    await send({
+        'type':'http.response.start',
+        'status':status,
+        'headers':[(b'content-type',content_type.encode()),(b'content-length',str(len(body)).encode()),*headers],
+    })
+    await send({'type':'http.response.body','body':body})
+
+
+async def send_json(send,status,data,headers=()):
+    await send_response(send,status,json.dumps(data),'application/json',headers)
+
+
+async def send_html(send,template_name,**context):
+    html=templates.get_template(template_name).render(**context)
+    await send_response(send,200,html,'text/html; charset=utf-8')
+
+
+## Route handlers, same behaviour as the Flask routes
+
+async def predict_datapoint(receive,send):
+    with metrics.time_request('predictdata'):
+        with metrics.time_phase('parse'):
+            form={key:values[0] for key,values in parse_qs((await read_body(receive)).decode('utf-8')).items()}
+            try:
+                data=CustomData.from_form(form)
+            except SchemaError as e:
+                metrics.count_error('predictdata','bad_request')
+                await send_response(send,400,f'Invalid input: {e}','text/plain; charset=utf-8')
+                return
+        with metrics.time_phase('frame_build'):
+            row=data.get_data_as_row()
+        try:
+            results=await scorer.predict_row(row)
+        except ScorerBusyError:
+            metrics.count_error('predictdata','overloaded')
+            raise
+        except Exception:
+            metrics.count_error('predictdata','exception')
+            raise
+        await send_html(send,'home.html',results=results)
+
+
+async def predict_batch(receive,send):
+    with metrics.time_request('predict'):
+        with metrics.time_phase('parse'):
+            try:
+                payload=json.loads(await read_body(receive))
+            except ValueError:
+                payload=None
+            records=payload.get('records') if isinstance(payload,dict) else payload
+        if not isinstance(records,list):
+            metrics.count_error('predict','bad_request')
+            await send_json(send,400,{'error':'Request body must be a JSON list of records or {"records": [...]}'})
+            return
+        if len(records)>MAX_BATCH_RECORDS:
+            metrics.count_error('predict','too_large')
+            await send_json(send,413,{'error':f'At most {MAX_BATCH_RECORDS} records per request'})
+            return
+
+        try:
+            predictions,errors=await scorer.predict_batch(records)
+        except ScorerBusyError:
+            metrics.count_error('predict','overloaded')
+            raise
+        except Exception:
+            metrics.count_error('predict','exception')
+            raise
+        if errors:
+            metrics.count_error('predict','invalid_record',amount=len(errors))
+        await send_json(send,200,{'predictions':predictions,'errors':errors})
+
+
+async def lifespan(receive,send):
+    while True:
+        message=await receive()
+        if message['type']=='lifespan.startup':
+            try:
+                ## Load the model before the pool starts, forked process workers inherit it
+                model_registry.load()
+                scorer.start()
+            except Exception as e:
+                logging.error(f"Startup failed: {e}")
+                await send({'type':'lifespan.startup.failed','message':str(e)})
+                return
+            await send({'type':'lifespan.startup.complete'})
+        elif message['type']=='lifespan.shutdown':
+            scorer.close()
+            await send({'type':'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope,receive,send):
+    if scope['type']=='lifespan':
+        await lifespan(receive,send)
+        return
+    if scope['type']!='http':
+        return
+
+    method,path=scope['method'],scope['path']
+    try:
+        if path=='/' and method=='GET':
+            await send_html(send,'index.html')
+        elif path=='/predictdata' and method=='GET':
+            await send_html(send,'home.html')
+        elif path=='/predictdata' and method=='POST':
+            await predict_datapoint(receive,send)
+        elif path=='/predict' and method=='POST':
+            await predict_batch(receive,send)
+        elif path=='/metrics' and method=='GET':
+            await send_response(send,200,metrics.render(),'text/plain; version=0.0.4')
+        elif path in ('/','/predictdata','/predict','/metrics'):
+            await send_response(send,405,'Method Not Allowed','text/plain')
+        else:
+            await send_response(send,404,'Not Found','text/plain')
+    except BodyTooLarge:
+        await send_json(send,413,{'error':f'Request body larger than {MAX_BODY_BYTES} bytes'})
+    except ScorerBusyError:
+        ## Backpressure: tell the client to come back instead of queueing without limit
+        await send_json(send,503,{'error':'Server busy, retry later'},headers=[(b'retry-after',b'1')])
+    except Exception as e:
+        logging.exception(f"Request {method} {path} failed: {e}")
+        await send_response(send,500,'Internal Server Error','text/plain')
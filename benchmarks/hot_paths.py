@@ -0,0 +1,359 @@
+## Benchmark suite for the training and inference hot paths:
+##   data_ingestion       DataIngestion.initiate_data_ingestion
+##   data_transformation  DataTransformation.initiate_data_transformation
+##   models               per candidate model: fit and predict as timed inside evaluate_model
+##                        (fit_and_score_model), then load_object of the pickled model, with
+##                        and without memory-mapping its arrays
+##   predict              PredictPipeline.predict on one row and on the whole dataset, plus the
+##                        row/column paths the web app uses, for every way the registry can serve
+##                        (pickled model, lite model, precomputed prediction table)
+## The data is synthetic: rows of notebook/data/stud.csv drawn with replacement and their scores
+## jittered, so it keeps the schema and the relations between the columns at any size.
+## Every case runs in a fresh interpreter inside its own temporary working directory (the real
+## artifacts/ folder is never touched) and reports the median time of --repeat runs plus the
+## peak memory allocated by one extra, traced run (tracemalloc, NumPy arrays included; memory
+## allocated inside xgboost / catboost is not traced, case_max_rss_mb has the peak of the process).
+## Results are saved as JSON together with the git commit, so two runs can be compared.
+##
+## Usage: python -m benchmarks.hot_paths [--sizes 1000 10000 100000] [--cases models predict]
+##        [--repeat 3] [--output baseline.json] [--compare baseline.json --fail-on-regression]
+## Sizes go up to 10_000_000 rows, the models case is skipped above --fit-max-rows.
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DATA_PATH = os.path.join(REPO_ROOT, "notebook", "data", "stud.csv")
+SCORE_COLUMNS = ["math_score", "reading_score", "writing_score"]
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+CASES = ["data_ingestion", "data_transformation", "models", "predict"]
+## Calls per measurement of the single-row cases, their time is reported per call
+SINGLE_ROW_CALLS = 200
+## Memory is only compared against a baseline for cases that allocate at least this much
+MIN_COMPARED_MB = 1.0
+
+
+def make_dataset(n_rows, file_path, seed=42):
+    """Writes n_rows synthetic student records with the schema of stud.csv to file_path."""
+    import numpy as np
+    import pandas as pd
+
+    source = pd.read_csv(SOURCE_DATA_PATH)
+    rng = np.random.default_rng(seed)
+    data = source.iloc[rng.integers(0, len(source), size=n_rows)].reset_index(drop=True)
+    ## Shift the three scores of a row together, so they stay correlated like in the real data
+    jitter = rng.integers(-3, 4, size=n_rows)
+    for column in SCORE_COLUMNS:
+        data[column] = np.clip(data[column].to_numpy() + jitter, 0, 100)
+    data.to_csv(file_path, index=False)
+
+
+def measure(func, repeat, setup=None, calls=1):
+    """Traced peak memory of one run, then median / min seconds of `repeat` timed runs (per call)."""
+    ## Warm-up run first, so lazy imports and first-call caches count neither as time nor as memory
+    if setup is not None:
+        setup()
+    func()
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        times.append((time.perf_counter() - start) / calls)
+    return {"seconds": statistics.median(times), "seconds_min": min(times), "peak_mb": peak / 2 ** 20}
+
+
+def _reset_artifacts():
+    ## Also drops the stage cache, otherwise every repeat after the first would be a cache hit
+    shutil.rmtree("artifacts", ignore_errors=True)
+
+
+def _ingest():
+    from src.components.data_ingestion import DataIngestion
+
+    train_path, test_path, _ = DataIngestion().initiate_data_ingestion()
+    return train_path, test_path
+
+
+def _transformed_data():
+    from src.components.data_transformation import DataTransformation
+
+    train_path, test_path = _ingest()
+    return DataTransformation().initiate_data_transformation_xy(train_path, test_path)
+
+
+## Cases, each returns a list of result records. They run inside the child interpreter
+
+def bench_data_ingestion(args):
+    return [dict(case="data_ingestion", **measure(_ingest, args.repeat, setup=_reset_artifacts))]
+
+
+def bench_data_transformation(args):
+    from src.components.data_transformation import DataTransformation
+
+    train_path, test_path = _ingest()
+
+    def setup():
+        shutil.rmtree(os.path.join("artifacts", "cache"), ignore_errors=True)
+
+    def transform():
+        DataTransformation().initiate_data_transformation(train_path, test_path)
+
+    return [dict(case="data_transformation", **measure(transform, args.repeat, setup=setup))]
+
+
+def bench_models(args):
+    from sklearn.base import clone
+
+    from src.components.model_trainer import ModelTrainer
+    from src.components.data_transformation import DataTransformationConfig
+    from src.utils import fit_and_score_model, load_object, save_object
+
+    X_train, y_train, X_test, y_test = _transformed_data()
+    models = ModelTrainer().get_models()
+    if args.models:
+        models = {name: model for name, model in models.items() if name in args.models}
+
+    records = []
+    for model_name, model in models.items():
+        ## Traced fit + predict first, it also warms up the model's library
+        tracemalloc.start()
+        try:
+            fitted_model = clone(model).fit(X_train, y_train)
+            fit_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+            fitted_model.predict(X_test)
+            predict_peak = tracemalloc.get_traced_memory()[1]
+        except Exception as e:
+            records.append({"case": f"fit:{model_name}", "error": str(e)})
+            continue
+        finally:
+            tracemalloc.stop()
+
+        ## fit_and_score_model times the fit and the predict itself, exactly like evaluate_model
+        runs = [fit_and_score_model(clone(model), X_train, y_train, X_test, y_test)[1] for _ in range(args.repeat)]
+
+        for step, peak in (("fit", fit_peak), ("predict", predict_peak)):
+            times = [run[f"{step}_time"] for run in runs]
+            records.append({
+                "case": f"{step}:{model_name}", "seconds": statistics.median(times),
+                "seconds_min": min(times), "peak_mb": peak / 2 ** 20,
+            })
+
+        model_path = os.path.join("artifacts", f"bench_{model_name}.pkl")
+        save_object(model_path, fitted_model)
+        for mmap in (False, True):
+            record = measure(lambda: load_object(model_path, mmap=mmap), args.repeat)
+            case = f"load_object{'_mmap' if mmap else ''}:{model_name}"
+            records.append(dict(case=case, file_mb=os.path.getsize(model_path) / 2 ** 20, **record))
+
+    preprocessor_path = DataTransformationConfig().preprocessor_obj_file_path
+    record = measure(lambda: load_object(preprocessor_path), args.repeat)
+    records.append(dict(case="load_object:preprocessor", file_mb=os.path.getsize(preprocessor_path) / 2 ** 20, **record))
+    return records
+
+
+def bench_predict(args):
+    import pandas as pd
+    from sklearn.linear_model import LinearRegression
+
+    from src.components.model_trainer import ModelTrainer
+    from src.pipeline.model_registry import ModelRegistry, ModelRegistryConfig
+    from src.pipeline.predict_pipeline import FEATURE_COLUMNS, PredictPipeline
+
+    ## The artifacts a real training run leaves behind: model.pkl, lite model, table, manifest
+    X_train, y_train, X_test, y_test = _transformed_data()
+    model = LinearRegression().fit(X_train, y_train)
+    report = {"LinearRegression": {"r2_score": model.score(X_test, y_test), "error": None, "best_params": {}, "cv": None}}
+    ModelTrainer().save_best_model({"LinearRegression": model}, report, X_test, y_test)
+
+    data = pd.read_csv(os.path.join("notebook", "data", "stud.csv"))[FEATURE_COLUMNS]
+    one_row = data.head(1)
+    row = data.iloc[0].tolist()
+    columns = {column: data[column].tolist() for column in FEATURE_COLUMNS}
+
+    ## The three ways the registry can serve, from the original path to the fastest one
+    variants = {
+        "pickle": ModelRegistryConfig(prefer_lite_model=False, use_prediction_table=False, compile_fast_encoder=False),
+        "lite": ModelRegistryConfig(use_prediction_table=False),
+        "table": ModelRegistryConfig(),
+    }
+    records = []
+    for variant, config in variants.items():
+        pipeline = PredictPipeline(registry=ModelRegistry(config))
+        pipeline.registry.load()
+        cases = {
+            "predict_single": (lambda: pipeline.predict(one_row), SINGLE_ROW_CALLS),
+            "predict_row": (lambda: pipeline.predict_row(row), SINGLE_ROW_CALLS),
+            "predict_batch": (lambda: pipeline.predict(data), 1),
+            "predict_columns": (lambda: pipeline.predict_columns(columns), 1),
+        }
+        for case, (func, calls) in cases.items():
+            records.append(dict(case=f"{case}:{variant}", calls=calls, **measure(func, args.repeat, calls=calls)))
+    return records
+
+
+CASE_FUNCTIONS = {
+    "data_ingestion": bench_data_ingestion,
+    "data_transformation": bench_data_transformation,
+    "models": bench_models,
+    "predict": bench_predict,
+}
+
+
+def run_child(args):
+    ## Runs one case in the current (temporary) directory and prints its records as JSON
+    import resource
+
+    records = CASE_FUNCTIONS[args.child](args)
+    ## Peak resident memory of the whole case, imports and setup included (KB on Linux, bytes on macOS)
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    max_rss_mb = max_rss / 2 ** 20 if sys.platform == "darwin" else max_rss / 2 ** 10
+    for record in records:
+        record["case_max_rss_mb"] = max_rss_mb
+    print(json.dumps(records))
+
+
+def run_case(case, n_rows, data_path, args):
+    """Runs one case in a fresh interpreter and temporary directory, returns its records."""
+    with tempfile.TemporaryDirectory(prefix=f"bench_{case}_") as workdir:
+        os.makedirs(os.path.join(workdir, "notebook", "data"))
+        os.symlink(data_path, os.path.join(workdir, "notebook", "data", "stud.csv"))
+        command = [sys.executable, "-m", "benchmarks.hot_paths", "--child", case, "--repeat", str(args.repeat)]
+        if args.models:
+            command += ["--models", *args.models]
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+        completed = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            error = completed.stderr.strip().splitlines()
+            return [{"case": case, "rows": n_rows, "error": error[-1] if error else "failed"}]
+        records = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    for record in records:
+        record["rows"] = n_rows
+    return records
+
+
+def environment():
+    import importlib
+
+    packages = {}
+    for name in ("numpy", "pandas", "sklearn", "scipy", "xgboost", "catboost", "dill"):
+        try:
+            packages[name] = importlib.import_module(name).__version__
+        except ImportError:
+            packages[name] = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": packages,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Prints time and memory ratios against a baseline file, returns the regressed keys."""
+    old = {(record["case"], record["rows"]): record for record in baseline["results"] if "seconds" in record}
+    regressions = []
+    print(f"\nCompared with {baseline['environment'].get('commit') or 'baseline'} (threshold {threshold:g}x)")
+    print(f"{'case':<44}{'rows':>10}{'time x':>9}{'memory x':>10}")
+    for record in results:
+        key = (record["case"], record["rows"])
+        if key not in old or "seconds" not in record:
+            continue
+        time_ratio = record["seconds"] / old[key]["seconds"] if old[key]["seconds"] else float("inf")
+        ## Peaks below MIN_COMPARED_MB are mostly allocator noise, their ratio means nothing
+        memory_ratio = 1.0
+        if max(record["peak_mb"], old[key]["peak_mb"]) >= MIN_COMPARED_MB:
+            memory_ratio = record["peak_mb"] / max(old[key]["peak_mb"], 1e-9)
+        regressed = time_ratio > threshold or memory_ratio > threshold
+        if regressed:
+            regressions.append(key)
+        print(f"{record['case']:<44}{record['rows']:>10}{time_ratio:>9.2f}{memory_ratio:>10.2f}"
+              f"{'  <-- regression' if regressed else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the training and inference hot paths")
+    parser.add_argument("--sizes", nargs="*", type=int, default=DEFAULT_SIZES, help="dataset rows, up to 10_000_000")
+    parser.add_argument("--cases", nargs="*", default=CASES, choices=CASES)
+    parser.add_argument("--models", nargs="*", help="only these candidate models in the models case")
+    parser.add_argument("--fit-max-rows", type=int, default=1_000_000,
+                        help="skip the models case above this size, fitting every candidate takes too long")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per measurement")
+    parser.add_argument("--output", help="write the results (a baseline) to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare the results with")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown / memory growth that counts as regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 on a regression")
+    parser.add_argument("--child", choices=CASES, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        return run_child(args)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_data_") as data_dir:
+        for n_rows in args.sizes:
+            data_path = os.path.join(data_dir, f"stud_{n_rows}.csv")
+            make_dataset(n_rows, data_path)
+            for case in args.cases:
+                if case == "models" and n_rows > args.fit_max_rows:
+                    continue
+                start = time.perf_counter()
+                records = run_case(case, n_rows, data_path, args)
+                results.extend(records)
+                print(f"{case} on {n_rows} rows done in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    print(f"{'case':<44}{'rows':>10}{'seconds':>12}{'min':>12}{'peak MB':>10}")
+    for record in results:
+        if "seconds" in record:
+            print(f"{record['case']:<44}{record['rows']:>10}{record['seconds']:>12.6f}"
+                  f"{record['seconds_min']:>12.6f}{record['peak_mb']:>10.1f}")
+        else:
+            print(f"{record['case']:<44}{record['rows']:>10}  error: {record.get('error')}")
+
+    report = {"environment": environment(), "repeat": args.repeat, "results": results}
+    if args.output:
+        with open(args.output, "w") as file_obj:
+            json.dump(report, file_obj, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file_obj:
+            regressions = compare(results, json.load(file_obj), args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+    return report
+
+
+if __name__ == "__main__":
+    main()
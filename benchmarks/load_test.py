@@ -0,0 +1,240 @@
+## Load test for the prediction servers: the Flask app (application.py, started the way
+## `python application.py` does, with app.run) and the async app (asgi_app.py under uvicorn).
+## Each server is started in its own process on a free local port, then `concurrency`
+## keep-alive connections send requests as fast as the server answers them. Reported per
+## server: throughput, p50 / p90 / p99 / max latency, and how many requests were rejected
+## (503, backpressure) or failed.
+## The client runs on the same machine, so compare servers within one run only.
+##
+## Usage: python -m benchmarks.load_test [--servers flask asgi] [--endpoint predictdata]
+##        [--concurrency 32] [--requests 3000] [--batch-size 100] [--output load.json]
+##        python -m benchmarks.load_test --url mine=http://127.0.0.1:8000   (already running)
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from urllib.parse import urlencode, urlsplit
+
+## Name -> command that serves the app on the port given as {port}
+SERVERS = {
+    "flask": [sys.executable, "-c", "from application import app; app.run(host='127.0.0.1', port={port})"],
+    "asgi": [sys.executable, "-m", "uvicorn", "asgi_app:app", "--host", "127.0.0.1", "--port", "{port}",
+             "--log-level", "warning", "--no-access-log"],
+}
+
+## Values of the input fields, requests are drawn from them at random
+CATEGORIES = {
+    "gender": ["female", "male"],
+    "race_ethnicity": ["group A", "group B", "group C", "group D", "group E"],
+    "parental_level_of_education": ["associate's degree", "bachelor's degree", "high school",
+                                    "master's degree", "some college", "some high school"],
+    "lunch": ["free/reduced", "standard"],
+    "test_preparation_course": ["completed", "none"],
+}
+
+
+def random_record(rng):
+    record = {field: rng.choice(values) for field, values in CATEGORIES.items()}
+    record["reading_score"] = rng.randint(0, 100)
+    record["writing_score"] = rng.randint(0, 100)
+    return record
+
+
+def build_requests(endpoint, n_requests, batch_size, seed=42):
+    """Returns the (path, content type, body) of every request, same for every server."""
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(n_requests):
+        if endpoint == "predictdata":
+            record = random_record(rng)
+            ## The HTML form calls the ethnicity field "ethnicity"
+            record["ethnicity"] = record.pop("race_ethnicity")
+            requests.append(("/predictdata", "application/x-www-form-urlencoded", urlencode(record).encode()))
+        else:
+            records = [random_record(rng) for _ in range(batch_size)]
+            requests.append(("/predict", "application/json", json.dumps({"records": records}).encode()))
+    return requests
+
+
+class HttpConnection:
+    """Minimal HTTP/1.1 client on asyncio streams, reconnects when the server closes the connection."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, content_type, body):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n")
+        self.writer.write(head.encode() + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection")
+        version, status = status_line.split()[:2]
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if "content-length" in headers:
+            await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            await self.reader.read()  # No length: the body ends when the connection closes
+        if (version == b"HTTP/1.0" and headers.get("connection", "").lower() != "keep-alive") \
+                or headers.get("connection", "").lower() == "close" or "content-length" not in headers:
+            await self.close()
+        return int(status)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+            self.reader = self.writer = None
+
+
+async def run_load(base_url, requests, concurrency):
+    """Sends every request over `concurrency` connections, returns the latencies and status counts."""
+    url = urlsplit(base_url)
+    pending = list(reversed(requests))
+    latencies, statuses = [], {}
+
+    async def client():
+        connection = HttpConnection(url.hostname, url.port or 80)
+        while pending:
+            path, content_type, body = pending.pop()
+            start = time.perf_counter()
+            try:
+                status = await connection.request("POST", path, content_type, body)
+            except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                status = "connection_error"
+                await connection.close()
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+        await connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - start
+
+
+def summarize(latencies, statuses, seconds):
+    ordered = sorted(latencies)
+
+    def percentile(q):
+        return 1000 * ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else None
+
+    n_ok = statuses.get(200, 0)
+    return {
+        "requests": len(latencies),
+        "ok": n_ok,
+        "rejected": statuses.get(503, 0),
+        "failed": len(latencies) - n_ok - statuses.get(503, 0),
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "seconds": seconds,
+        "throughput_rps": len(latencies) / seconds if seconds else None,
+        "ok_throughput_rps": n_ok / seconds if seconds else None,
+        "p50_ms": percentile(0.50),
+        "p90_ms": percentile(0.90),
+        "p99_ms": percentile(0.99),
+        "max_ms": 1000 * ordered[-1] if ordered else None,
+        "mean_ms": 1000 * statistics.fmean(ordered) if ordered else None,
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(base_url, process, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"{base_url}/metrics", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"{base_url} did not start within {timeout}s")
+
+
+def load_test(name, base_url, requests, concurrency, warmup, command=None):
+    process = None
+    if command is not None:
+        process = subprocess.Popen(command, cwd=os.getcwd(), stdout=subprocess.DEVNULL)
+    try:
+        wait_until_ready(base_url, process)
+        if warmup:
+            asyncio.run(run_load(base_url, requests[:warmup], min(concurrency, warmup)))
+        result = summarize(*asyncio.run(run_load(base_url, requests, concurrency)))
+        result.update(server=name, url=base_url, concurrency=concurrency)
+        return result
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test for the prediction servers")
+    parser.add_argument("--servers", nargs="*", default=list(SERVERS), choices=list(SERVERS))
+    parser.add_argument("--url", action="append", default=[],
+                        help="name=base URL of an already running server, can be repeated")
+    parser.add_argument("--endpoint", choices=["predictdata", "predict"], default="predictdata")
+    parser.add_argument("--concurrency", type=int, default=32, help="open connections")
+    parser.add_argument("--requests", type=int, default=3000, help="requests per server")
+    parser.add_argument("--batch-size", type=int, default=100, help="records per /predict request")
+    parser.add_argument("--warmup", type=int, default=100, help="requests sent before measuring")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    requests = build_requests(args.endpoint, args.requests, args.batch_size)
+    results = {}
+    for name in args.servers:
+        port = free_port()
+        command = [part.format(port=port) for part in SERVERS[name]]
+        results[name] = load_test(name, f"http://127.0.0.1:{port}", requests, args.concurrency, args.warmup, command)
+    for name_url in args.url:
+        name, _, base_url = name_url.partition("=")
+        results[name] = load_test(name, base_url.rstrip("/"), requests, args.concurrency, args.warmup)
+
+    print(f"{'server':<10}{'req/s':>9}{'ok':>8}{'503':>7}{'failed':>8}{'p50 ms':>9}{'p90 ms':>9}"
+          f"{'p99 ms':>9}{'max ms':>9}")
+    for name, result in results.items():
+        print(f"{name:<10}{result['throughput_rps']:>9.1f}{result['ok']:>8}{result['rejected']:>7}"
+              f"{result['failed']:>8}{result['p50_ms']:>9.2f}{result['p90_ms']:>9.2f}"
+              f"{result['p99_ms']:>9.2f}{result['max_ms']:>9.2f}")
+
+    if args.output:
+        with open(args.output, "w") as file_obj:
+            json.dump({"endpoint": args.endpoint, "results": results}, file_obj, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
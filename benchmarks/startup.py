@@ -0,0 +1,101 @@
+## Startup benchmark: how long a fresh process takes to import the web app and the
+## training entry point, how much memory it holds afterwards and which heavy libraries
+## got loaded on the way. Every measurement runs in its own interpreter, so nothing is
+## already cached in sys.modules.
+##
+## Usage: python -m benchmarks.startup [--repeat 5] [--output startup.json]
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+## Name -> module imported by that entry point
+TARGETS = {
+    "web_app": "application",
+    "asgi_app": "asgi_app",
+    "predict_pipeline": "src.pipeline.predict_pipeline",
+    "training": "src.components.data_ingestion",
+    "model_trainer": "src.components.model_trainer",
+}
+
+## Libraries the serving path should not need
+HEAVY_MODULES = ("pandas", "scipy", "sklearn", "xgboost", "catboost", "dill")
+
+## Runs inside the child interpreter, prints one JSON line
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import importlib
+importlib.import_module(sys.argv[1])
+elapsed = time.perf_counter() - start
+rss_kb = None
+try:
+    with open("/proc/self/status") as file_obj:
+        for line in file_obj:
+            if line.startswith("VmRSS:"):
+                rss_kb = int(line.split()[1])
+except OSError:
+    pass
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    peak_kb //= 1024  # bytes on macOS
+print(json.dumps({
+    "import_seconds": elapsed,
+    "rss_mb": rss_kb / 1024 if rss_kb is not None else None,
+    "peak_rss_mb": peak_kb / 1024,
+    "heavy_modules": [name for name in json.loads(sys.argv[2]) if name in sys.modules],
+}))
+"""
+
+
+def measure(module, repeat=3):
+    """Imports module in `repeat` fresh interpreters, returns the median timings and memory."""
+    runs = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, "-c", PROBE, module, json.dumps(HEAVY_MODULES)],
+            capture_output=True, text=True, check=True, cwd=os.getcwd(),
+        )
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    def median(key):
+        values = [run[key] for run in runs if run[key] is not None]
+        return statistics.median(values) if values else None
+
+    return {
+        "module": module,
+        "import_seconds": median("import_seconds"),
+        "import_seconds_min": min(run["import_seconds"] for run in runs),
+        "rss_mb": median("rss_mb"),
+        "peak_rss_mb": median("peak_rss_mb"),
+        "heavy_modules": runs[-1]["heavy_modules"],
+        "repeat": repeat,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters per target")
+    parser.add_argument("--targets", nargs="*", default=list(TARGETS), choices=list(TARGETS))
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = {name: measure(TARGETS[name], args.repeat) for name in args.targets}
+
+    print(f"{'target':<18}{'import s':>10}{'rss MB':>10}{'peak MB':>10}  heavy modules")
+    for name, result in results.items():
+        rss = f"{result['rss_mb']:.1f}" if result["rss_mb"] is not None else "n/a"
+        print(f"{name:<18}{result['import_seconds']:>10.3f}{rss:>10}{result['peak_rss_mb']:>10.1f}  "
+              f"{', '.join(result['heavy_modules']) or '-'}")
+
+    if args.output:
+        with open(args.output, "w") as file_obj:
+            json.dump(results, file_obj, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
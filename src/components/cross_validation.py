@@ -0,0 +1,113 @@
+## K-fold cross-validation on the training data with shared, cached folds.
+## The fold indices are computed once and the preprocessor is fitted once per fold (on that
+## fold's training part only, so the validation part never leaks into the scaling).
+## The transformed fold matrices are saved as .npy/.npz files and memory-mapped by every
+## model and hyperparameter setting that is scored on them, so the preprocessing cost is
+## paid once per fold instead of once per fit.
+
+import os
+import sys
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.exception import CustomException
+from src.utils import load_features
+
+
+@dataclass
+class CrossValidationConfig:
+    """Configuration class for k-fold cross-validation."""
+    n_splits: int = 5
+    shuffle: bool = True
+    random_state: int = 42
+    # Transformed fold matrices: fold_<k>_{train,val}_{X,y}.npy (X is .npz when sparse)
+    folds_dir: str = os.path.join("artifacts", "folds")
+
+
+class CrossValidationFolds:
+    """The transformed (X_fit, y_fit, X_val, y_val) of every fold, loaded from disk on first use.
+
+    Only the file paths are pickled, so sending the folds to a process pool is cheap and
+    every worker memory-maps the same files instead of getting its own copy.
+    """
+
+    def __init__(self, fold_files, mmap=True):
+        # One dict per fold: {"train_X", "train_y", "val_X", "val_y"} -> path
+        self.fold_files = [dict(files) for files in fold_files]
+        self.mmap = mmap
+        self._loaded = {}
+
+    def __len__(self):
+        return len(self.fold_files)
+
+    def __getitem__(self, k):
+        if k not in self._loaded:
+            files = self.fold_files[k]
+            mmap_mode = "r" if self.mmap else None
+            self._loaded[k] = (
+                load_features(files["train_X"], mmap_mode=mmap_mode),
+                np.load(files["train_y"], mmap_mode=mmap_mode),
+                load_features(files["val_X"], mmap_mode=mmap_mode),
+                np.load(files["val_y"], mmap_mode=mmap_mode),
+            )
+        return self._loaded[k]
+
+    def __iter__(self):
+        return (self[k] for k in range(len(self)))
+
+    def file_paths(self):
+        return [path for files in self.fold_files for path in files.values()]
+
+    def __getstate__(self):
+        return {"fold_files": self.fold_files, "mmap": self.mmap}
+
+    def __setstate__(self, state):
+        self.__init__(state["fold_files"], state["mmap"])
+
+
+def fold_file_paths(folds_dir, k, is_sparse=False):
+    features_extension = ".npz" if is_sparse else ".npy"
+    return {
+        "train_X": os.path.join(folds_dir, f"fold_{k}_train_X{features_extension}"),
+        "train_y": os.path.join(folds_dir, f"fold_{k}_train_y.npy"),
+        "val_X": os.path.join(folds_dir, f"fold_{k}_val_X{features_extension}"),
+        "val_y": os.path.join(folds_dir, f"fold_{k}_val_y.npy"),
+    }
+
+
+def cross_validate(model, folds, densify=False):
+    """
+    Fits a fresh copy of model on every fold and scores it on the fold's validation part.
+    Returns {"scores", "r2_mean", "r2_std", "fit_time", "predict_time"}, times are per-fold means.
+    """
+    try:
+        from scipy import sparse
+        from sklearn.base import clone
+        from sklearn.metrics import r2_score
+
+        scores, fit_times, predict_times = [], [], []
+        for X_fit, y_fit, X_val, y_val in folds:
+            if densify and sparse.issparse(X_fit):
+                X_fit, X_val = X_fit.toarray(), X_val.toarray()
+            estimator = clone(model)
+
+            start = time.perf_counter()
+            estimator.fit(X_fit, y_fit)
+            fit_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            y_pred = estimator.predict(X_val)
+            predict_times.append(time.perf_counter() - start)
+            scores.append(float(r2_score(y_val, y_pred)))
+
+        return {
+            "scores": scores,
+            "r2_mean": float(np.mean(scores)),
+            "r2_std": float(np.std(scores)),
+            "fit_time": float(np.mean(fit_times)),
+            "predict_time": float(np.mean(predict_times)),
+        }
+    except Exception as e:
+        raise CustomException(e, sys)
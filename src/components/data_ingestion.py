@@ -7,69 +7,187 @@ from src.logger import logging
 
 import pandas as pd
 
-from src.components.data_transformation import DataTransformationConfig
-from src.components.data_transformation import DataTransformation
-
-from src.components.model_trainer import ModelTrainerConfig
-from src.components.model_trainer import ModelTrainer
-
-from sklearn.model_selection import train_test_split
 from dataclasses import dataclass # For simple configuration class
 
+from src.stage_cache import StageCache
+from src.utils import path_for_format, save_dataframe
+
 ## Configuration class for storing file paths for raw, train, and test data
 @dataclass ##decorator to automatically generate special methods like __init__ and __repr__
 class DataIngestionConfig:
     train_data_path: str = os.path.join('artifacts', 'train.csv')
     test_data_path: str = os.path.join('artifacts', 'test.csv')
     raw_data_path: str = os.path.join('artifacts', 'data.csv')
+    source_data_path: str = os.path.join('notebook', 'data', 'stud.csv')
+    test_size: float = 0.2
+    random_state: int = 42
+    # Streaming mode reads the source in chunks and splits rows by a hash of their values,
+    # so memory use is bounded by chunk_size instead of the size of the dataset
+    streaming: bool = False
+    chunk_size: int = 100_000
+    # "csv", or "parquet" / "feather" for typed columnar files (needs pyarrow).
+    # The extension of the three paths above is replaced to match, streaming mode writes CSV only
+    artifact_format: str = 'csv'
+
+def hash_split_mask(chunk, test_size, random_state, n_buckets=10_000):
+    """
+    Boolean mask of the rows of chunk that belong to the test set.
+    A row goes to the test set when the hash of its values (salted with random_state) falls in
+    the lowest test_size share of the hash range, so the split of a row never depends on which
+    chunk it is in. Read the rows with dtype=str so the hash does not depend on inferred types.
+    """
+    salt = str(random_state).rjust(16, '0')[-16:]
+    row_hashes = pd.util.hash_pandas_object(chunk, index=False, hash_key=salt).to_numpy()
+    return (row_hashes % n_buckets) < int(test_size * n_buckets)
 
 ## Main class to perform data ingestion
 ## not using @dataclass here because we want to define methods in this class
 class DataIngestion:
     def __init__(self):
         self.ingestion_config = DataIngestionConfig()  # Load file paths
+        self.stage_cache = StageCache()
+
+    def output_paths(self):
+        """Returns the (train, test, raw) paths with the extension of the configured artifact format."""
+        artifact_format = self.ingestion_config.artifact_format
+        if self.ingestion_config.streaming and artifact_format != 'csv':
+            raise ValueError("Streaming ingestion only writes CSV files")
+        return (
+            path_for_format(self.ingestion_config.train_data_path, artifact_format),
+            path_for_format(self.ingestion_config.test_data_path, artifact_format),
+            path_for_format(self.ingestion_config.raw_data_path, artifact_format),
+        )
 
     def initiate_data_ingestion(self):
         logging.info("Data Ingestion Method Started")
         try:
+            train_data_path, test_data_path, raw_data_path = self.output_paths()
+            output_files = {
+                'train': train_data_path,
+                'test': test_data_path,
+                'raw': raw_data_path,
+            }
+
+            # Step 0: Skip the stage if the same source data, config and code were ingested before
+            fingerprint = self.stage_cache.fingerprint(
+                'data_ingestion',
+                inputs=[self.ingestion_config.source_data_path],
+                config=self.ingestion_config,
+                code=[DataIngestion],
+            )
+            cached = self.stage_cache.lookup('data_ingestion', fingerprint)
+            if cached is not None:
+                self.stage_cache.restore_files(cached, output_files)
+                logging.info('Ingestion skipped, reused cached train and test data')
+                return (
+                    train_data_path,
+                    test_data_path,
+                    raw_data_path
+                )
+
+            if self.ingestion_config.streaming:
+                self.split_in_chunks()
+                self.stage_cache.store('data_ingestion', fingerprint, files=output_files)
+                logging.info('Streaming ingestion of data is completed')
+                return (
+                    train_data_path,
+                    test_data_path,
+                    raw_data_path
+                )
+
             # Step 1: Read the CSV file containing the data
-            df = pd.read_csv('notebook/data/stud.csv')
+            df = pd.read_csv(self.ingestion_config.source_data_path)
             logging.info('Read the dataset as dataframe')
 
             # Step 2: Create the folder for saving files, if it doesn't already exist
-            os.makedirs(os.path.dirname(self.ingestion_config.train_data_path), exist_ok=True)
+            os.makedirs(os.path.dirname(train_data_path), exist_ok=True)
 
             # Step 3: Save the raw data for backup
-            df.to_csv(self.ingestion_config.raw_data_path, index=False, header=True)
+            save_dataframe(df, raw_data_path)
 
             # Step 4: Split the data into train and test (80-20 split)
+            from sklearn.model_selection import train_test_split
+
             logging.info('Train test split initiated')
-            train_set, test_set = train_test_split(df, test_size=0.2, random_state=42)
+            train_set, test_set = train_test_split(
+                df,
+                test_size=self.ingestion_config.test_size,
+                random_state=self.ingestion_config.random_state
+            )
 
             # Step 5: Save the train and test datasets
-            train_set.to_csv(self.ingestion_config.train_data_path, index=False, header=True)
-            test_set.to_csv(self.ingestion_config.test_data_path, index=False, header=True)
+            save_dataframe(train_set, train_data_path)
+            save_dataframe(test_set, test_data_path)
 
+            self.stage_cache.store('data_ingestion', fingerprint, files=output_files)
             logging.info('Ingestion of data is completed')
 
             # Step 6: Return file paths for further processing
             return (
+                train_data_path,
+                test_data_path,
+                raw_data_path
+            )
+
+        except Exception as e:
+            raise CustomException(e, sys)  # Handle any errors
+
+    def split_in_chunks(self):
+        """
+        Streams the source CSV chunk by chunk into the raw, train and test files.
+        Rows are split with hash_split_mask, so the split is deterministic and does not
+        depend on chunk_size or on the order of the rows.
+        """
+        try:
+            os.makedirs(os.path.dirname(self.ingestion_config.train_data_path), exist_ok=True)
+            output_paths = (
+                self.ingestion_config.raw_data_path,
                 self.ingestion_config.train_data_path,
                 self.ingestion_config.test_data_path,
-                self.ingestion_config.raw_data_path
             )
+            ## Write to temporary files and rename at the end, a failed run leaves no partial split
+            tmp_paths = [f"{path}.{os.getpid()}.tmp" for path in output_paths]
+
+            n_train = n_test = 0
+            ## Rows are read as plain text, so the hash of a row never depends on the types
+            ## pandas happens to infer for the chunk it is in
+            chunks = pd.read_csv(
+                self.ingestion_config.source_data_path,
+                chunksize=self.ingestion_config.chunk_size,
+                dtype=str,
+                keep_default_na=False
+            )
+            for i, chunk in enumerate(chunks):
+                is_test = hash_split_mask(chunk, self.ingestion_config.test_size, self.ingestion_config.random_state)
+
+                mode = 'w' if i == 0 else 'a'
+                for path, part in zip(tmp_paths, (chunk, chunk[~is_test], chunk[is_test])):
+                    part.to_csv(path, mode=mode, index=False, header=(i == 0))
+                n_test += int(is_test.sum())
+                n_train += len(chunk) - int(is_test.sum())
+
+            for tmp_path, path in zip(tmp_paths, output_paths):
+                os.replace(tmp_path, path)
+            logging.info(f'Streamed {n_train} train rows and {n_test} test rows')
 
         except Exception as e:
-            raise CustomException(e, sys)  # Handle any errors
+            raise CustomException(e, sys)
 
 # If this file is run directly, start the ingestion process
 if __name__ == "__main__":
+    ## Imported here so importing this module does not load the transformation and training code
+    from src.components.data_transformation import DataTransformation
+    from src.components.model_trainer import ModelTrainer
+
     obj = DataIngestion()
     train_data,test_data,_ = obj.initiate_data_ingestion()
     print("Data Ingestion Completed")
 
     data_transformation = DataTransformation()
-    train_arr,test_arr = data_transformation.initiate_data_transformation(train_data, test_data)
+    X_train,y_train,X_test,y_test = data_transformation.initiate_data_transformation_xy(train_data, test_data)
 
     modeltrainer= ModelTrainer()
-    print(modeltrainer.initiate_model_trainer(train_arr,test_arr))
\ No newline at end of file
+    folds = None
+    if modeltrainer.model_trainer_config.evaluation == "kfold":
+        folds = data_transformation.initiate_cv_folds(train_data)
+    print(modeltrainer.initiate_model_trainer_xy(X_train,y_train,X_test,y_test,folds=folds))
\ No newline at end of file
@@ -2,18 +2,29 @@
 
 import sys
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 import numpy as np
 import pandas as pd
+from scipy import sparse
 from sklearn.compose import ColumnTransformer
 from sklearn.impute import SimpleImputer
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
 
+from src.components.cross_validation import CrossValidationConfig, CrossValidationFolds, fold_file_paths
+from src.components.incremental_preprocessor import IncrementalPreprocessor
 from src.exception import CustomException
 from src.logger import logging
-from src.utils import save_object
+from src.stage_cache import StageCache
+from src.utils import (
+    load_dataframe,
+    load_features,
+    remove_other_feature_format,
+    save_array,
+    save_features,
+    save_object,
+)
 
 # This config class is used to store important settings or paths needed during the data transformation process.
 # Right now, it holds the file path where we will save the preprocessor object (a trained pipeline that handles
@@ -23,10 +34,35 @@ from src.utils import save_object
 # This helps keep our code clean and organized, because instead of hardcoding file paths in multiple places,
 # we define them in one place (config class), which makes the code easier to manage, especially in bigger projects.
 
+## Columns of the student performance dataset
+TARGET_COLUMN = 'math_score'
+NUMERICAL_FEATURES = ['writing_score', 'reading_score']
+CATEGORICAL_FEATURES = [
+    'gender',
+    'race_ethnicity',
+    'parental_level_of_education',
+    'lunch',
+    'test_preparation_course'
+]
+
 @dataclass
 class DataTransformationConfig:
     """Configuration class for data transformation."""
     preprocessor_obj_file_path: str = os.path.join('artifacts','preprocessor.pkl')
+    # Rows read at a time by the streaming methods
+    chunk_size: int = 100_000
+    # Transformed features (.npy when dense, .npz when sparse CSR) and targets (.npy)
+    train_features_file_path: str = os.path.join('artifacts','train_X.npy')
+    test_features_file_path: str = os.path.join('artifacts','test_X.npy')
+    train_target_file_path: str = os.path.join('artifacts','train_y.npy')
+    test_target_file_path: str = os.path.join('artifacts','test_y.npy')
+    # Reuse of saved dense matrices memory-maps them instead of reading them into memory
+    mmap_arrays: bool = True
+    # The features stay a sparse CSR matrix when their density is below this threshold
+    # (ColumnTransformer's sparse_threshold), which happens as the one-hot width grows
+    sparse_threshold: float = 0.3
+    # Folds built by initiate_cv_folds for k-fold model evaluation
+    cv_config: CrossValidationConfig = field(default_factory=CrossValidationConfig)
 
 class DataTransformation:
     """Main class to perform data transformation.
@@ -36,6 +72,7 @@ class DataTransformation:
     
     def __init__(self):
         self.data_transformation_config = DataTransformationConfig()  # Load configuration
+        self.stage_cache = StageCache()
 
     def get_data_transformer_object(self):
         """Creates a preprocessor object for transforming the data."""
@@ -43,14 +80,8 @@ class DataTransformation:
         try:
             logging.info("Data Transformation initiated")
             ## Define numerical and categorical features
-            numerical_features = ['writing_score', 'reading_score']
-            categorical_features = [
-                'gender',
-                'race_ethnicity',
-                'parental_level_of_education',
-                'lunch',
-                'test_preparation_course'
-            ]
+            numerical_features = NUMERICAL_FEATURES
+            categorical_features = CATEGORICAL_FEATURES
             logging.info("Numerical and categorical features identified")
 
             ## Create a pipeline for numerical features
@@ -71,7 +102,8 @@ class DataTransformation:
                 transformers=[
                     ('num', num_pipeline, numerical_features),
                     ('cat', cat_pipeline, categorical_features)
-                ]
+                ],
+                sparse_threshold=self.data_transformation_config.sparse_threshold
             )
 
             logging.info("ColumnTransformer created with numerical and categorical pipelines")
@@ -81,15 +113,68 @@ class DataTransformation:
             raise CustomException(e, sys)  # Handle any errors 
     
     def initiate_data_transformation(self, train_path, test_path):
+        """
+        Returns (train_arr, test_arr): dense feature matrices with the target as last column.
+        Kept for callers that expect a single array, initiate_data_transformation_xy keeps
+        sparse features sparse and should be preferred.
+        """
+        try:
+            X_train, y_train, X_test, y_test = self.initiate_data_transformation_xy(train_path, test_path)
+            if sparse.issparse(X_train):
+                X_train, X_test = X_train.toarray(), X_test.toarray()
+            train_arr = np.c_[X_train, y_train]
+            test_arr = np.c_[X_test, y_test]
+            return (
+                train_arr,
+                test_arr, 
+                #self.data_transformation_config.preprocessor_obj_file_path,
+            )
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _output_files(self, is_sparse):
+        features_extension = '.npz' if is_sparse else '.npy'
+        config = self.data_transformation_config
+        return {
+            'preprocessor': config.preprocessor_obj_file_path,
+            'train_X': os.path.splitext(config.train_features_file_path)[0] + features_extension,
+            'test_X': os.path.splitext(config.test_features_file_path)[0] + features_extension,
+            'train_y': config.train_target_file_path,
+            'test_y': config.test_target_file_path,
+        }
+
+    def initiate_data_transformation_xy(self, train_path, test_path):
+        """
+        Fits the preprocessor and returns (X_train, y_train, X_test, y_test).
+        X stays a scipy CSR matrix when the encoded features are sparse enough
+        (see sparse_threshold), otherwise it is a dense array.
+        """
         try:
-            train_df= pd.read_csv(train_path)
-            test_df= pd.read_csv(test_path)
+            ## Skip the stage if the same train/test data, config and code were transformed before
+            fingerprint = self.stage_cache.fingerprint(
+                'data_transformation',
+                inputs=[train_path, test_path],
+                config=self.data_transformation_config,
+                code=[DataTransformation],
+            )
+            cached = self.stage_cache.lookup('data_transformation', fingerprint)
+            if cached is not None:
+                output_files = self._output_files(cached['metadata']['sparse'])
+                self.stage_cache.restore_files(cached, output_files)
+                ## A matrix of the other format left by an earlier run would be loaded instead
+                remove_other_feature_format(output_files['train_X'])
+                remove_other_feature_format(output_files['test_X'])
+                logging.info("Transformation skipped, reused cached preprocessor and arrays")
+                return self.load_transformed_data()
+
+            ## CSV, Parquet or Feather, depending on what ingestion wrote
+            train_df= load_dataframe(train_path)
+            test_df= load_dataframe(test_path)
             logging.info("Read train and test data successfully for transformation")
             logging.info("Obtaining preprocessor object")
             preprocessor_obj = self.get_data_transformer_object()
 
-            target_column_name = 'math_score'
-            numerical_columns = ['writing_score', 'reading_score']
+            target_column_name = TARGET_COLUMN
 
             input_feature_train_df = train_df.drop(columns=[target_column_name], axis=1)
             target_feature_train_df = train_df[target_column_name]
@@ -99,21 +184,136 @@ class DataTransformation:
 
             logging.info("Applying preprocessor on training and testing dataframes")
 
-            input_feature_train_arr = preprocessor_obj.fit_transform(input_feature_train_df)
-            input_feature_test_arr = preprocessor_obj.transform(input_feature_test_df)
+            X_train = preprocessor_obj.fit_transform(input_feature_train_df)
+            X_test = preprocessor_obj.transform(input_feature_test_df)
+            y_train = target_feature_train_df.to_numpy(dtype=np.float64)
+            y_test = target_feature_test_df.to_numpy(dtype=np.float64)
 
-            train_arr = np.c_[input_feature_train_arr, np.array(target_feature_train_df)]
-            test_arr = np.c_[input_feature_test_arr, np.array(target_feature_test_df)]
-            logging.info("Data transformation completed successfully")
+            is_sparse = sparse.issparse(X_train)
+            if is_sparse:
+                X_train, X_test = X_train.tocsr(), X_test.tocsr()
+            logging.info(f"Data transformation completed successfully, {X_train.shape[1]} features, "
+                         f"{'sparse' if is_sparse else 'dense'}")
             
             save_object(
                 file_path=self.data_transformation_config.preprocessor_obj_file_path,
                 obj=preprocessor_obj
             )
+            ## Persist the matrices so later stages and experiments can load them without redoing the transform
+            output_files = self._output_files(is_sparse)
+            save_features(output_files['train_X'], X_train)
+            save_features(output_files['test_X'], X_test)
+            save_array(output_files['train_y'], y_train)
+            save_array(output_files['test_y'], y_test)
+
+            self.stage_cache.store('data_transformation', fingerprint, files=output_files,
+                                   metadata={'sparse': is_sparse})
+            return X_train, y_train, X_test, y_test
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def load_transformed_data(self):
+        """
+        Loads the saved (X_train, y_train, X_test, y_test).
+        Dense matrices are memory-mapped read-only unless mmap_arrays is off.
+        """
+        try:
+            config = self.data_transformation_config
+            mmap_mode = 'r' if config.mmap_arrays else None
             return (
-                train_arr,
-                test_arr, 
-                #self.data_transformation_config.preprocessor_obj_file_path,
+                load_features(config.train_features_file_path, mmap_mode=mmap_mode),
+                np.load(config.train_target_file_path, mmap_mode=mmap_mode),
+                load_features(config.test_features_file_path, mmap_mode=mmap_mode),
+                np.load(config.test_target_file_path, mmap_mode=mmap_mode),
             )
         except Exception as e:
-            raise CustomException(e, sys) 
\ No newline at end of file
+            raise CustomException(e, sys)
+
+    def initiate_cv_folds(self, train_path):
+        """
+        Splits the training data into k folds and fits a fresh preprocessor on the training
+        part of every fold. Returns CrossValidationFolds whose transformed matrices are shared
+        by every model and hyperparameter setting scored on them.
+        """
+        try:
+            from sklearn.model_selection import KFold
+
+            cv_config = self.data_transformation_config.cv_config
+            fingerprint = self.stage_cache.fingerprint(
+                'cv_folds',
+                inputs=[train_path],
+                config=self.data_transformation_config,
+                code=[DataTransformation],
+            )
+            cached = self.stage_cache.lookup('cv_folds', fingerprint)
+            if cached is not None:
+                fold_files = [fold_file_paths(cv_config.folds_dir, k, cached['metadata']['sparse'])
+                              for k in range(cv_config.n_splits)]
+                self.stage_cache.restore_files(cached, {
+                    f"fold_{k}_{name}": path for k, files in enumerate(fold_files) for name, path in files.items()
+                })
+                for files in fold_files:
+                    remove_other_feature_format(files['train_X'])
+                    remove_other_feature_format(files['val_X'])
+                logging.info("Fold preprocessing skipped, reused cached folds")
+                return CrossValidationFolds(fold_files, mmap=self.data_transformation_config.mmap_arrays)
+
+            train_df = load_dataframe(train_path)
+            input_feature_df = train_df.drop(columns=[TARGET_COLUMN])
+            target = train_df[TARGET_COLUMN].to_numpy(dtype=np.float64)
+
+            ## Fold indices are computed once, every model is scored on exactly the same folds
+            kfold = KFold(n_splits=cv_config.n_splits, shuffle=cv_config.shuffle,
+                          random_state=cv_config.random_state if cv_config.shuffle else None)
+            fold_files = []
+            is_sparse = False
+            for k, (fit_idx, val_idx) in enumerate(kfold.split(input_feature_df)):
+                preprocessor_obj = self.get_data_transformer_object()
+                X_fit = preprocessor_obj.fit_transform(input_feature_df.iloc[fit_idx])
+                X_val = preprocessor_obj.transform(input_feature_df.iloc[val_idx])
+                is_sparse = sparse.issparse(X_fit)
+
+                files = fold_file_paths(cv_config.folds_dir, k, is_sparse)
+                save_features(files['train_X'], X_fit.tocsr() if is_sparse else X_fit)
+                save_features(files['val_X'], X_val.tocsr() if is_sparse else X_val)
+                save_array(files['train_y'], target[fit_idx])
+                save_array(files['val_y'], target[val_idx])
+                fold_files.append(files)
+            logging.info(f"Preprocessed {cv_config.n_splits} cross-validation folds")
+
+            self.stage_cache.store('cv_folds', fingerprint, files={
+                f"fold_{k}_{name}": path for k, files in enumerate(fold_files) for name, path in files.items()
+            }, metadata={'sparse': is_sparse})
+            return CrossValidationFolds(fold_files, mmap=self.data_transformation_config.mmap_arrays)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def initiate_data_transformation_streaming(self, train_path):
+        """
+        Streaming version of initiate_data_transformation for datasets larger than memory.
+        Fits an IncrementalPreprocessor one chunk of the training data at a time and saves it.
+        The transformed data is not materialized, use iter_transformed_batches to read it.
+        """
+        try:
+            logging.info("Fitting the preprocessor incrementally")
+            preprocessor_obj = IncrementalPreprocessor(NUMERICAL_FEATURES, CATEGORICAL_FEATURES)
+            for chunk in pd.read_csv(train_path, chunksize=self.data_transformation_config.chunk_size):
+                preprocessor_obj.partial_fit(chunk.drop(columns=[TARGET_COLUMN]))
+            logging.info(f"Preprocessor fitted on {preprocessor_obj.n_samples_seen_} rows")
+
+            save_object(
+                file_path=self.data_transformation_config.preprocessor_obj_file_path,
+                obj=preprocessor_obj
+            )
+            return preprocessor_obj
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def iter_transformed_batches(self, data_path, preprocessor_obj):
+        """Yields (X, y) for one chunk of data_path at a time, so memory is bounded by chunk_size."""
+        try:
+            for chunk in pd.read_csv(data_path, chunksize=self.data_transformation_config.chunk_size):
+                X = preprocessor_obj.transform(chunk.drop(columns=[TARGET_COLUMN]))
+                yield X, chunk[TARGET_COLUMN].to_numpy(dtype=np.float64)
+        except Exception as e:
+            raise CustomException(e, sys)
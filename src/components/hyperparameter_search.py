@@ -0,0 +1,268 @@
+## Hyperparameter search for the candidate models in ModelTrainer.
+## Supports exhaustive grid search, randomized search and successive halving, all with a
+## time budget per model and early pruning of configurations that are clearly losing.
+
+import math
+import sys
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.metrics import r2_score
+from sklearn.model_selection import ParameterGrid, ParameterSampler
+
+from src.exception import CustomException
+from src.logger import logging
+
+
+@dataclass
+class HyperparameterSearchConfig:
+    """Configuration class for the hyperparameter search."""
+    # "grid" tries every combination, "random" samples n_iter of them, "halving" runs
+    # successive halving over the training data, "none" keeps the default parameters
+    strategy: str = "halving"
+    n_iter: int = 20                 # Configurations sampled per model by "random"
+    time_budget: float = 120.0       # Seconds per model, the best result so far is used after that
+    validation_size: float = 0.2     # Part of the training data held out to score configurations
+    halving_factor: int = 3          # Halving keeps the best 1/halving_factor at every rung
+    min_resource_fraction: float = 0.1  # Training data used by the first, cheapest rung
+    # "grid"/"random": a configuration whose score on min_resource_fraction of the data is
+    # more than prune_margin below the best such score is dropped without a full fit
+    prune_margin: float = 0.05
+    random_state: int = 42
+
+
+def resolve_param_grids(models, params):
+    """Returns model name -> grid for every model, warning about grids that match no model."""
+    unknown = set(params) - set(models)
+    if unknown:
+        logging.warning(f"Hyperparameter grids without a matching model are ignored: {sorted(unknown)}")
+    return {model_name: params.get(model_name, {}) for model_name in models}
+
+
+def _score_candidate(model, candidate, X_fit, y_fit, X_val, y_val):
+    try:
+        estimator = clone(model)
+        estimator.set_params(**candidate)
+        estimator.fit(X_fit, y_fit)
+        return r2_score(y_val, estimator.predict(X_val))
+    except Exception as e:
+        logging.info(f"Candidate {candidate} failed: {e}")
+        return -math.inf
+
+
+class HyperparameterSearch:
+    """Finds the best parameters for one model on a validation split of the training data."""
+
+    def __init__(self, config=None):
+        self.search_config = config or HyperparameterSearchConfig()
+
+    def search(self, model, param_grid, X_train, y_train):
+        """
+        Returns {"best_params", "best_score", "n_candidates", "n_evaluated", "n_pruned", "search_time"}.
+        best_score is the R2 on the validation split, None (with empty best_params) when nothing
+        was searched or no candidate produced a finite score.
+        """
+        try:
+            config = self.search_config
+            result = {
+                "best_params": {}, "best_score": None, "n_candidates": 0,
+                "n_evaluated": 0, "n_pruned": 0, "search_time": 0.0,
+            }
+            if config.strategy == "none" or not param_grid:
+                return result
+
+            candidates = list(ParameterGrid(param_grid))
+            if config.strategy == "random" and len(candidates) > config.n_iter:
+                candidates = list(ParameterSampler(param_grid, n_iter=config.n_iter, random_state=config.random_state))
+            result["n_candidates"] = len(candidates)
+
+            ## Hold out part of the training data, the test data stays untouched for evaluate_model.
+            ## The rows are shuffled once, so every prefix of `order` is a random subsample
+            rng = np.random.RandomState(config.random_state)
+            order = rng.permutation(X_train.shape[0])
+            n_val = max(1, int(len(order) * config.validation_size))
+            val_idx, fit_order = order[:n_val], order[n_val:]
+            data = (X_train[fit_order], y_train[fit_order], X_train[val_idx], y_train[val_idx])
+
+            start = time.perf_counter()
+            if config.strategy == "halving":
+                best = self._successive_halving(model, candidates, data, start, result)
+            elif config.strategy in ("grid", "random"):
+                best = self._pruned_search(model, candidates, data, start, result)
+            else:
+                raise ValueError(f"Unknown search strategy '{config.strategy}'")
+            result["search_time"] = time.perf_counter() - start
+
+            self._set_best(result, best)
+            return result
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def search_folds(self, model, param_grid, folds, densify=False):
+        """
+        Like search, but a configuration is scored by its mean R2 over the cross-validation
+        folds (see CrossValidationFolds), which are preprocessed once and shared by every
+        configuration. The cheap early look at a configuration uses the first folds instead of
+        a subsample: halving gives the surviving candidates more folds at every rung, "grid"
+        and "random" drop a configuration whose first-fold score is clearly losing.
+        densify converts sparse folds to dense arrays for models that cannot take sparse input.
+        """
+        try:
+            config = self.search_config
+            result = {
+                "best_params": {}, "best_score": None, "n_candidates": 0,
+                "n_evaluated": 0, "n_pruned": 0, "search_time": 0.0,
+            }
+            if config.strategy == "none" or not param_grid:
+                return result
+
+            candidates = list(ParameterGrid(param_grid))
+            if config.strategy == "random" and len(candidates) > config.n_iter:
+                candidates = list(ParameterSampler(param_grid, n_iter=config.n_iter, random_state=config.random_state))
+            result["n_candidates"] = len(candidates)
+
+            start = time.perf_counter()
+            ## Fold scores per candidate, so moving to more folds only fits the new ones
+            fold_scores = [[] for _ in candidates]
+            dense_folds = {}
+
+            def fold(k):
+                X_fit, y_fit, X_val, y_val = folds[k]
+                if not (densify and sparse.issparse(X_fit)):
+                    return X_fit, y_fit, X_val, y_val
+                ## Converted once per fold and shared by every candidate scored on it
+                if k not in dense_folds:
+                    dense_folds[k] = (X_fit.toarray(), y_fit, X_val.toarray(), y_val)
+                return dense_folds[k]
+
+            def mean_score(i, n_folds):
+                while len(fold_scores[i]) < n_folds:
+                    X_fit, y_fit, X_val, y_val = fold(len(fold_scores[i]))
+                    fold_scores[i].append(_score_candidate(model, candidates[i], X_fit, y_fit, X_val, y_val))
+                    result["n_evaluated"] += 1
+                return float(np.mean(fold_scores[i][:n_folds]))
+
+            best = None
+            if config.strategy == "halving":
+                alive = list(range(len(candidates)))
+                n_folds = 1
+                while alive:
+                    n_folds = min(n_folds, len(folds))
+                    scored = []
+                    for i in alive:
+                        if self._out_of_time(start):
+                            break
+                        scored.append((i, mean_score(i, n_folds)))
+                    if scored:
+                        scored.sort(key=lambda item: item[1], reverse=True)
+                        best = (candidates[scored[0][0]], scored[0][1])
+                    if len(scored) < len(alive) or n_folds >= len(folds) or len(alive) == 1:
+                        break
+                    n_keep = max(1, len(scored) // config.halving_factor)
+                    result["n_pruned"] += len(scored) - n_keep
+                    alive = [i for i, _ in scored[:n_keep]]
+                    n_folds *= config.halving_factor
+            elif config.strategy in ("grid", "random"):
+                best_first_score = -math.inf
+                for i, candidate in enumerate(candidates):
+                    if self._out_of_time(start):
+                        logging.info(f"Search time budget used up after {i} candidates")
+                        break
+                    first_score = mean_score(i, 1)
+                    best_first_score = max(best_first_score, first_score)
+                    if first_score < best_first_score - config.prune_margin:
+                        result["n_pruned"] += 1
+                        continue
+                    score = mean_score(i, len(folds))
+                    if best is None or score > best[1]:
+                        best = (candidate, score)
+            else:
+                raise ValueError(f"Unknown search strategy '{config.strategy}'")
+            result["search_time"] = time.perf_counter() - start
+
+            self._set_best(result, best)
+            return result
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    @staticmethod
+    def _set_best(result, best):
+        ## A failed candidate scores -inf: when nothing scored better the defaults are kept,
+        ## the parameters of a failing candidate are never returned as the best ones
+        if best is not None and math.isfinite(best[1]):
+            result["best_params"], result["best_score"] = best
+        elif result["n_evaluated"]:
+            logging.warning("No hyperparameter candidate produced a finite score, keeping the default parameters")
+
+    def _out_of_time(self, start):
+        return time.perf_counter() - start > self.search_config.time_budget
+
+    def _pruned_search(self, model, candidates, data, start, result):
+        X_fit, y_fit, X_val, y_val = data
+        n_low = max(2, int(len(y_fit) * self.search_config.min_resource_fraction))
+        best = None
+        best_low_score = -math.inf
+        for candidate in candidates:
+            if self._out_of_time(start):
+                logging.info(f"Search time budget used up after {result['n_evaluated']} candidates")
+                break
+
+            ## Cheap fit on a small subsample first, full fit only for promising candidates
+            low_score = _score_candidate(model, candidate, X_fit[:n_low], y_fit[:n_low], X_val, y_val)
+            result["n_evaluated"] += 1
+            best_low_score = max(best_low_score, low_score)
+            if low_score < best_low_score - self.search_config.prune_margin:
+                result["n_pruned"] += 1
+                continue
+
+            score = _score_candidate(model, candidate, X_fit, y_fit, X_val, y_val)
+            if best is None or score > best[1]:
+                best = (candidate, score)
+        return best
+
+    def _successive_halving(self, model, candidates, data, start, result):
+        X_fit, y_fit, X_val, y_val = data
+        factor = self.search_config.halving_factor
+        n_samples = len(y_fit)
+
+        ## Choose the first rung size so the surviving candidates reach the full data
+        n_rungs = max(1, math.ceil(math.log(len(candidates), factor)) + 1)
+        n_resource = max(
+            int(n_samples * self.search_config.min_resource_fraction),
+            n_samples // factor ** (n_rungs - 1),
+            2,
+        )
+
+        best = None
+        while candidates:
+            n_resource = min(n_resource, n_samples)
+            scored = []
+            for candidate in candidates:
+                if self._out_of_time(start):
+                    break
+                score = _score_candidate(model, candidate, X_fit[:n_resource], y_fit[:n_resource], X_val, y_val)
+                result["n_evaluated"] += 1
+                scored.append((candidate, score))
+
+            if scored:
+                scored.sort(key=lambda item: item[1], reverse=True)
+                ## Results on more data are more reliable than a lucky score on a small rung
+                best = scored[0]
+            if len(scored) < len(candidates):
+                logging.info(f"Search time budget used up at {n_resource} samples")
+                break
+            if n_resource >= n_samples or len(candidates) == 1:
+                break
+
+            ## Keep the best 1/factor of the candidates and give them factor times more data
+            n_keep = max(1, len(scored) // factor)
+            result["n_pruned"] += len(scored) - n_keep
+            candidates = [candidate for candidate, _ in scored[:n_keep]]
+            n_resource *= factor
+
+        return best
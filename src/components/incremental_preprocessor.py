@@ -0,0 +1,123 @@
+## Preprocessor that is fitted one chunk at a time, for datasets that do not fit in memory.
+## It produces the same feature layout as the ColumnTransformer from
+## DataTransformation.get_data_transformer_object, but only keeps running statistics:
+## value counts for the numerical columns (scores are bounded, so these stay tiny) and
+## category counts for the categorical columns.
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+from src.exception import CustomException
+from src.pipeline.fast_encoder import FastEncoder
+
+
+class IncrementalPreprocessor:
+    """partial_fit-style replacement for the median/most-frequent imputers, OneHotEncoder and scalers."""
+
+    def __init__(self, numerical_features, categorical_features):
+        self.numerical_features = list(numerical_features)
+        self.categorical_features = list(categorical_features)
+        self.input_columns = None
+        self.n_samples_seen_ = 0
+        # Column -> {value: count} of the observed (non-missing) values, and missing counts
+        self.numerical_counts_ = {column: {} for column in self.numerical_features}
+        self.categorical_counts_ = {column: {} for column in self.categorical_features}
+        self.missing_counts_ = {column: 0 for column in self.numerical_features + self.categorical_features}
+        self._encoder = None
+
+    def partial_fit(self, df):
+        """Adds one chunk of data to the running statistics."""
+        try:
+            if self.input_columns is None:
+                features = set(self.numerical_features + self.categorical_features)
+                self.input_columns = [column for column in df.columns if column in features]
+
+            for column in self.numerical_features + self.categorical_features:
+                values = df[column]
+                missing = values.isna()
+                self.missing_counts_[column] += int(missing.sum())
+                counts = self.numerical_counts_ if column in self.numerical_counts_ else self.categorical_counts_
+                for value, count in values[~missing].value_counts(sort=False).items():
+                    counts[column][value] = counts[column].get(value, 0) + int(count)
+
+            self.n_samples_seen_ += len(df)
+            self._encoder = None  # Statistics changed, rebuild the encoder on next use
+            return self
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def fit(self, df):
+        return self.partial_fit(df)
+
+    def _numerical_stats(self, column):
+        counts = self.numerical_counts_[column]
+        if not counts:
+            raise ValueError(f"Column '{column}' has no values to fit on")
+        values = np.array(sorted(counts), dtype=np.float64)
+        weights = np.array([counts[value] for value in sorted(counts)], dtype=np.float64)
+
+        ## Median of the observed values, the average of the two middle ones for an even count
+        cumulative = np.cumsum(weights)
+        n_observed = cumulative[-1]
+        lower = values[np.searchsorted(cumulative, (n_observed - 1) // 2 + 1)]
+        upper = values[np.searchsorted(cumulative, n_observed // 2 + 1)]
+        median = (lower + upper) / 2
+
+        ## In the batch pipeline the scaler is fitted after imputation, so missing values
+        ## count as extra copies of the median
+        n_missing = self.missing_counts_[column]
+        if n_missing:
+            position = np.searchsorted(values, median)
+            if position < len(values) and values[position] == median:
+                weights[position] += n_missing
+            else:
+                values = np.insert(values, position, median)
+                weights = np.insert(weights, position, n_missing)
+
+        mean = np.average(values, weights=weights)
+        variance = np.average((values - mean) ** 2, weights=weights)
+        return median, mean, np.sqrt(variance) if variance > 0 else 1.0
+
+    def _categorical_stats(self, column):
+        counts = dict(self.categorical_counts_[column])
+        if not counts:
+            raise ValueError(f"Column '{column}' has no values to fit on")
+        categories = sorted(counts)
+        ## Most frequent value, the smallest one on ties (same rule as SimpleImputer)
+        fill = min(categories, key=lambda value: (-counts[value], value))
+        counts[fill] += self.missing_counts_[column]
+
+        ## One-hot columns are 0/1, so their variance is p * (1 - p)
+        p = np.array([counts[value] for value in categories], dtype=np.float64) / self.n_samples_seen_
+        variance = p * (1 - p)
+        scale = np.where(variance > 0, np.sqrt(variance), 1.0)
+        return fill, categories, scale
+
+    def to_fast_encoder(self):
+        """Builds the encoder that applies the fitted statistics."""
+        if self._encoder is None:
+            numerical = [self._numerical_stats(column) for column in self.numerical_features]
+            categorical = [self._categorical_stats(column) for column in self.categorical_features]
+            self._encoder = FastEncoder(
+                numerical_columns=self.numerical_features,
+                numerical_fill=[stats[0] for stats in numerical],
+                numerical_mean=[stats[1] for stats in numerical],
+                numerical_scale=[stats[2] for stats in numerical],
+                categorical_columns=self.categorical_features,
+                categorical_fill=[stats[0] for stats in categorical],
+                categories=[stats[1] for stats in categorical],
+                categorical_scale=np.concatenate([stats[2] for stats in categorical]),
+                input_columns=self.input_columns,
+            )
+        return self._encoder
+
+    def transform(self, df):
+        """Same output layout as the fitted ColumnTransformer: scaled numericals, then scaled one-hots."""
+        try:
+            if isinstance(df, pd.DataFrame):
+                return self.to_fast_encoder().transform(df)
+            return self.to_fast_encoder().transform_records(df)
+        except Exception as e:
+            raise CustomException(e, sys)
@@ -0,0 +1,416 @@
+## Incremental update of the trained model with rows appended to the source data.
+## A full run (DataIngestion -> DataTransformation -> ModelTrainer, through TrainPipeline)
+## rereads the whole source and refits every candidate. Here only the rows appended since the
+## last run are read (from a saved byte offset into the source CSV) and warm-start the selected
+## model, so the cost of a refresh follows the amount of new data. Only a linear model also
+## takes them into the preprocessor's scaler statistics: it is re-solved exactly in the new
+## scaling, while fitted trees keep split thresholds learned on the old one, so for them the
+## preprocessor stays frozen.
+## The full run still happens when there is no previous run to continue from, when the source
+## was rewritten instead of appended to, when the new rows drift away from the data the model
+## was trained on (see IncrementalUpdateConfig), or when the updated model scores badly on the
+## new test rows.
+
+import hashlib
+import io
+import json
+import math
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from src.components.data_ingestion import DataIngestion, DataIngestionConfig, hash_split_mask
+from src.components.data_transformation import (
+    CATEGORICAL_FEATURES,
+    NUMERICAL_FEATURES,
+    TARGET_COLUMN,
+    DataTransformationConfig,
+)
+from src.components.model_trainer import ModelTrainer
+from src.exception import CustomException
+from src.logger import logging
+from src.pipeline.model_registry import compile_encoder
+from src.utils import load_dataframe, load_object, save_object
+
+## Columns whose mean and spread are watched for drift, the target included
+DRIFT_COLUMNS = NUMERICAL_FEATURES + [TARGET_COLUMN]
+## Bytes before the saved offset that must be unchanged for the source to count as appended to.
+## Only the tail is checked so an update never rereads the whole file: an edit further back
+## goes unnoticed until the next full run
+TAIL_CHECK_BYTES = 4096
+
+
+@dataclass
+class IncrementalUpdateConfig:
+    """Configuration class for incremental updates."""
+    # Offset into the source, running statistics and update history of the current model
+    state_file_path: str = os.path.join("artifacts", "incremental_state.json")
+    source_data_path: str = field(default_factory=lambda: DataIngestionConfig().source_data_path)
+    # New rows are split between training and evaluation like streaming ingestion does
+    test_size: float = 0.2
+    random_state: int = 42
+    # Full re-selection when more rows were appended than this share of the rows trained on
+    max_new_fraction: float = 0.5
+    # Drift checks only run once this many rows were appended (means of a few rows are noise)
+    min_drift_rows: int = 30
+    # Full re-selection when the mean of a DRIFT_COLUMNS column moved by more than this many
+    # standard deviations, or its standard deviation changed by more than this factor
+    max_mean_shift: float = 0.5
+    max_std_ratio: float = 1.5
+    # Full re-selection when the population stability index of a categorical column exceeds this
+    # (0.1 is usually read as a small shift, 0.25 as a large one)
+    max_category_psi: float = 0.2
+    # Full re-selection when the updated model's R2 on the new test rows is this much below the
+    # R2 of the last full run, checked once there are min_test_rows new test rows
+    max_r2_drop: float = 0.05
+    min_test_rows: int = 50
+    # Boosting rounds / trees added by a warm start: the same share of the current ensemble as
+    # the share of new rows, at least min_warm_start_estimators
+    min_warm_start_estimators: int = 8
+    # Tree ensembles are only warm-started once this many new training rows were appended,
+    # fewer rows stay in the source for the next update (new trees fitted on a handful of rows
+    # would pull the whole ensemble towards them)
+    min_warm_start_rows: int = 50
+    # Updates kept in the state's history
+    history_size: int = 50
+
+
+def _merge_moments(moments, values):
+    """Adds values to running (count, mean, M2) moments (Chan et al. parallel update)."""
+    values = values[~np.isnan(values)]
+    n_a, mean_a, m2_a = moments
+    n_b = len(values)
+    if n_b == 0:
+        return moments
+    mean_b = float(values.mean())
+    m2_b = float(((values - mean_b) ** 2).sum())
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    return [n, mean_a + delta * n_b / n, m2_a + m2_b + delta ** 2 * n_a * n_b / n]
+
+
+def _category_psi(old_counts, new_counts):
+    """Population stability index between two {value: count} distributions."""
+    values = set(old_counts) | set(new_counts)
+    old_total = sum(old_counts.values()) or 1
+    new_total = sum(new_counts.values()) or 1
+    psi = 0.0
+    for value in values:
+        ## Small floor so a value missing from one side does not give an infinite index
+        p_old = max(old_counts.get(value, 0) / old_total, 1e-4)
+        p_new = max(new_counts.get(value, 0) / new_total, 1e-4)
+        psi += (p_new - p_old) * math.log(p_new / p_old)
+    return psi
+
+
+def _raw_features(encoder, df):
+    """Encoded features before scaling (imputed scores and 0/1 one-hots) plus an intercept column."""
+    X = encoder.transform(df)
+    X *= np.concatenate([encoder.numerical_scale, encoder.categorical_scale])
+    X[:, :len(encoder.numerical_columns)] += encoder.numerical_mean
+    return np.c_[X, np.ones(len(X))]
+
+
+def update_preprocessor(preprocessor, df):
+    """
+    Adds the rows of df to the scaler statistics of a fitted preprocessor, in place.
+    The imputer fill values and the one-hot categories stay as they are: a new category
+    changes the feature layout, which the caller treats as drift.
+    Only for models that are refitted in the new scaling (the linear model), a fitted tree
+    ensemble would score the rescaled features against thresholds of the old scaling.
+    """
+    ## The streaming IncrementalPreprocessor keeps every statistic as running counts
+    if hasattr(preprocessor, "partial_fit"):
+        return preprocessor.partial_fit(df)
+
+    for name, pipeline, columns in preprocessor.transformers_:
+        if name == "remainder":
+            continue
+        ## Everything before the scaler is fixed, the scaler moments take the new rows
+        scaler = pipeline.steps[-1][1]
+        scaler.partial_fit(pipeline[:-1].transform(df[columns]))
+    return preprocessor
+
+
+class IncrementalUpdater:
+    """Refreshes the model with appended rows, or falls back to a full TrainPipeline run."""
+
+    def __init__(self, config=None):
+        self.update_config = config or IncrementalUpdateConfig()
+        self.trainer = ModelTrainer()
+
+    def _load_state(self):
+        state_path = self.update_config.state_file_path
+        if not os.path.exists(state_path):
+            return None
+        with open(state_path) as file_obj:
+            return json.load(file_obj)
+
+    def _save_state(self, state):
+        state_path = self.update_config.state_file_path
+        os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+        tmp_path = f"{state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file_obj:
+            json.dump(state, file_obj, indent=2)
+        os.replace(tmp_path, state_path)
+
+    def _tail_hash(self, offset):
+        with open(self.update_config.source_data_path, "rb") as file_obj:
+            file_obj.seek(max(0, offset - TAIL_CHECK_BYTES))
+            return hashlib.sha256(file_obj.read(offset - max(0, offset - TAIL_CHECK_BYTES))).hexdigest()
+
+    def read_appended_rows(self, state):
+        """
+        Returns (rows appended since the state's offset, new offset), or None when the source
+        was rewritten. Rows are read as text, a last line without its newline is left for later.
+        """
+        source_path = self.update_config.source_data_path
+        offset = state["source_offset"]
+        if os.path.getsize(source_path) < offset or self._tail_hash(offset) != state["source_tail_hash"]:
+            return None
+        with open(source_path, "rb") as file_obj:
+            file_obj.seek(offset)
+            data = file_obj.read()
+        data = data[:data.rfind(b"\n") + 1]
+        rows = pd.read_csv(io.BytesIO(data), header=None, names=state["columns"], dtype=str,
+                           keep_default_na=False) if data.strip() else pd.DataFrame(columns=state["columns"])
+        return rows, offset + len(data)
+
+    def detect_drift(self, state, rows):
+        """Returns why the new rows need a full re-selection, or None."""
+        config = self.update_config
+        if len(rows) > config.max_new_fraction * state["n_train_rows"]:
+            return f"{len(rows)} new rows, more than {config.max_new_fraction:.0%} of the {state['n_train_rows']} trained on"
+
+        for column in CATEGORICAL_FEATURES:
+            new_values = set(rows[column].dropna()) - set(state["category_counts"][column])
+            if new_values:
+                return f"new categories in {column}: {sorted(new_values)}"
+
+        if len(rows) < config.min_drift_rows:
+            return None
+        for column in DRIFT_COLUMNS:
+            n, mean, m2 = state["moments"][column]
+            std = math.sqrt(m2 / n) if n else 0.0
+            values = rows[column].to_numpy(dtype=np.float64)
+            values = values[~np.isnan(values)]
+            if not len(values) or not std:
+                continue
+            shift = abs(values.mean() - mean) / std
+            ratio = (values.std() or 1e-12) / std
+            if shift > config.max_mean_shift:
+                return f"mean of {column} moved by {shift:.2f} standard deviations"
+            if not 1 / config.max_std_ratio <= ratio <= config.max_std_ratio:
+                return f"standard deviation of {column} changed by a factor {ratio:.2f}"
+        for column in CATEGORICAL_FEATURES:
+            psi = _category_psi(state["category_counts"][column], rows[column].value_counts().to_dict())
+            if psi > config.max_category_psi:
+                return f"distribution of {column} shifted, PSI {psi:.3f}"
+        return None
+
+    def _n_extra_estimators(self, current, n_new, n_seen):
+        return max(self.update_config.min_warm_start_estimators, math.ceil(current * n_new / max(n_seen, 1)))
+
+    def warm_start(self, model, X, y, state, encoder):
+        """
+        Continues training model on the new rows, returns the updated model or None when its
+        type cannot be updated incrementally. encoder is the compiled preprocessor after the update.
+        X must be encoded with the preprocessor the model was trained with: only the linear model
+        is re-expressed in an updated scaling.
+        """
+        model_type = type(model).__name__
+        n_seen = state["n_train_rows"]
+
+        if model_type == "LinearRegression":
+            ## Exact: least squares from the running Gram matrix of the unscaled features, then
+            ## expressed in the updated scaling (x_scaled = (x - mean) / scale)
+            gram, target = np.asarray(state["gram"]), np.asarray(state["gram_target"])
+            weights = np.linalg.lstsq(gram, target, rcond=None)[0]
+            coef, intercept = weights[:-1], weights[-1]
+            scale = np.concatenate([encoder.numerical_scale, encoder.categorical_scale])
+            mean = np.concatenate([encoder.numerical_mean, np.zeros(len(encoder.categorical_scale))])
+            model.coef_ = coef * scale
+            model.intercept_ = float(intercept + coef @ mean)
+            return model
+
+        if model_type == "XGBRegressor":
+            from xgboost import XGBRegressor
+
+            booster = model.get_booster()
+            extra = self._n_extra_estimators(booster.num_boosted_rounds(), len(y), n_seen)
+            updated = XGBRegressor(**dict(model.get_params(), n_estimators=extra))
+            return updated.fit(X, y, xgb_model=booster)
+
+        if model_type == "CatBoostRegressor":
+            from catboost import CatBoostRegressor
+
+            extra = self._n_extra_estimators(model.tree_count_, len(y), n_seen)
+            updated = CatBoostRegressor(**dict(model.get_params(), iterations=extra))
+            return updated.fit(X, y, init_model=model)
+
+        if model_type in ("GradientBoostingRegressor", "RandomForestRegressor"):
+            ## warm_start keeps the fitted stages / trees and only fits the added ones, on the new rows
+            current = len(model.estimators_)
+            model.set_params(warm_start=True, n_estimators=current + self._n_extra_estimators(current, len(y), n_seen))
+            model.fit(X, y)
+            model.set_params(warm_start=False)
+            return model
+
+        return None
+
+    def _running_statistics(self, train_df, encoder, model):
+        """Moments, category counts (and the Gram matrix for a linear model) of the training rows."""
+        statistics = {
+            "n_train_rows": len(train_df),
+            "moments": {
+                column: _merge_moments([0, 0.0, 0.0], train_df[column].to_numpy(dtype=np.float64))
+                for column in DRIFT_COLUMNS
+            },
+            "category_counts": {
+                column: {str(value): int(count) for value, count in train_df[column].value_counts().items()}
+                for column in CATEGORICAL_FEATURES
+            },
+            "gram": None,
+            "gram_target": None,
+        }
+        if type(model).__name__ == "LinearRegression" and encoder is not None:
+            raw = _raw_features(encoder, train_df)
+            statistics["gram"] = (raw.T @ raw).tolist()
+            statistics["gram_target"] = (raw.T @ train_df[TARGET_COLUMN].to_numpy(dtype=np.float64)).tolist()
+        return statistics
+
+    def full_retrain(self, reason, history=()):
+        """Runs the whole TrainPipeline and starts a new state from its result."""
+        from src.pipeline.train_pipeline import TrainPipeline
+
+        logging.info(f"Full re-selection: {reason}")
+        source_path = self.update_config.source_data_path
+        ## The offset is taken before the pipeline reads the source: rows appended while it runs
+        ## may be trained on twice (again by the next update) but are never skipped
+        offset = os.path.getsize(source_path)
+        with open(source_path) as file_obj:
+            columns = pd.read_csv(file_obj, nrows=0).columns.tolist()
+
+        result = TrainPipeline().run()
+
+        train_df = load_dataframe(DataIngestion().output_paths()[0])
+        preprocessor = load_object(DataTransformationConfig().preprocessor_obj_file_path)
+        model = load_object(self.trainer.model_trainer_config.trained_model_file_path)
+        encoder = compile_encoder(preprocessor)
+        state = {
+            "source_path": source_path,
+            "source_offset": offset,
+            "source_tail_hash": self._tail_hash(offset),
+            "columns": columns,
+            "best_model": result["best_model"],
+            "reference_r2": result["r2_score"],
+            **self._running_statistics(train_df, encoder, model),
+            "history": list(history),
+        }
+        summary = {"action": "full", "reason": reason, "best_model": result["best_model"],
+                   "r2_score": result["r2_score"], "time": time.time()}
+        state["history"] = (state["history"] + [summary])[-self.update_config.history_size:]
+        self._save_state(state)
+        return summary
+
+    def initiate_incremental_update(self):
+        """
+        Updates the model with the rows appended since the last run.
+        Returns a summary {"action": "none" | "incremental" | "full", "reason", ...}.
+        """
+        try:
+            config = self.update_config
+            state = self._load_state()
+            if state is None or state.get("source_path") != config.source_data_path:
+                return self.full_retrain("no previous run to continue from")
+            history = state["history"]
+
+            appended = self.read_appended_rows(state)
+            if appended is None:
+                return self.full_retrain("the source was rewritten, not appended to", history)
+            rows, new_offset = appended
+            if rows.empty:
+                logging.info("No new rows since the last run")
+                return {"action": "none", "reason": "no new rows"}
+
+            ## Split on the text of the rows, then give them the types pandas infers for the source
+            is_test = hash_split_mask(rows, config.test_size, config.random_state)
+            rows = rows.replace("", np.nan)
+            for column in DRIFT_COLUMNS:
+                rows[column] = pd.to_numeric(rows[column], errors="coerce")
+            reason = self.detect_drift(state, rows)
+            if reason is not None:
+                return self.full_retrain(reason, history)
+
+            train_rows, test_rows = rows[~is_test], rows[is_test]
+            preprocessor_path = DataTransformationConfig().preprocessor_obj_file_path
+            preprocessor = load_object(preprocessor_path)
+            model = load_object(self.trainer.model_trainer_config.trained_model_file_path)
+            encoder = compile_encoder(preprocessor)
+            is_linear = type(model).__name__ == "LinearRegression"
+            if is_linear and (state["gram"] is None or encoder is None):
+                return self.full_retrain("no running statistics for the linear model", history)
+            if not is_linear and len(train_rows) < config.min_warm_start_rows:
+                ## The offset is not moved, the rows are read again (with more) next time
+                logging.info(f"{len(train_rows)} new training rows, waiting for {config.min_warm_start_rows}")
+                return {"action": "none",
+                        "reason": f"{len(train_rows)} new training rows, fewer than {config.min_warm_start_rows}"}
+
+            start = time.perf_counter()
+            if len(train_rows):
+                if is_linear:
+                    raw = _raw_features(encoder, train_rows)
+                    state["gram"] = (np.asarray(state["gram"]) + raw.T @ raw).tolist()
+                    state["gram_target"] = (np.asarray(state["gram_target"])
+                                            + raw.T @ train_rows[TARGET_COLUMN].to_numpy()).tolist()
+                    ## The linear model is solved again in the updated scaling, see warm_start
+                    update_preprocessor(preprocessor, train_rows)
+                    encoder = compile_encoder(preprocessor)
+                model = self.warm_start(model, preprocessor.transform(train_rows),
+                                        train_rows[TARGET_COLUMN].to_numpy(), state, encoder)
+                if model is None:
+                    return self.full_retrain(f"{state['best_model']} cannot be warm-started", history)
+
+            r2_new = None
+            if len(test_rows) >= config.min_test_rows:
+                from sklearn.metrics import r2_score
+
+                r2_new = float(r2_score(test_rows[TARGET_COLUMN], model.predict(preprocessor.transform(test_rows))))
+                if r2_new < state["reference_r2"] - config.max_r2_drop:
+                    return self.full_retrain(
+                        f"R2 on the new rows {r2_new:.4f}, last full run {state['reference_r2']:.4f}", history
+                    )
+
+            ## Preprocessor first: the lite model and the table are exported with the saved one
+            if is_linear:
+                save_object(file_path=preprocessor_path, obj=preprocessor)
+            self.trainer.save_model(model, state["best_model"], preprocessor.transform(rows))
+
+            for column in DRIFT_COLUMNS:
+                state["moments"][column] = _merge_moments(state["moments"][column], train_rows[column].to_numpy())
+            for column in CATEGORICAL_FEATURES:
+                counts = state["category_counts"][column]
+                for value, count in train_rows[column].value_counts().items():
+                    counts[value] = counts.get(value, 0) + int(count)
+            state["n_train_rows"] += len(train_rows)
+            state["source_offset"] = new_offset
+            state["source_tail_hash"] = self._tail_hash(new_offset)
+
+            summary = {"action": "incremental", "reason": None, "best_model": state["best_model"],
+                       "train_rows": len(train_rows), "test_rows": len(test_rows), "r2_new_rows": r2_new,
+                       "seconds": time.perf_counter() - start, "time": time.time()}
+            state["history"] = (history + [summary])[-config.history_size:]
+            self._save_state(state)
+            logging.info(f"Incremental update of {state['best_model']} with {len(train_rows)} train rows "
+                         f"and {len(test_rows)} test rows done, R2 on the new rows {r2_new}")
+            return summary
+        except Exception as e:
+            raise CustomException(e, sys)
+
+
+if __name__ == "__main__":
+    print(IncrementalUpdater().initiate_incremental_update())
@@ -0,0 +1,291 @@
+## Compiles a fitted regressor into a LiteModel (src/pipeline/lite_model.py).
+## Linear models become a coefficient vector, tree models become flat node arrays.
+## Models whose prediction cannot be written this way (AdaBoost's weighted median,
+## KNeighbors' training set lookup) are not exported and keep being served from model.pkl.
+## export_prediction_table scores every possible input once instead, for any model
+## (src/pipeline/prediction_table.py).
+
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from src.exception import CustomException
+from src.logger import logging
+from src.pipeline.lite_model import LiteModel
+from src.pipeline.prediction_table import PREDICTION_TABLE_FORMAT_VERSION, table_meta_path, table_values_hash
+
+
+def _sklearn_tree_arrays(trees):
+    ## Concatenates the node arrays of fitted sklearn trees, child indices shifted per tree
+    feature, threshold, left, right, value, roots = [], [], [], [], [], []
+    offset = 0
+    for tree in trees:
+        tree = tree.tree_
+        is_leaf = tree.children_left < 0
+        roots.append(offset)
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(tree.threshold)
+        left.append(np.where(is_leaf, -1, tree.children_left + offset))
+        right.append(np.where(is_leaf, -1, tree.children_right + offset))
+        value.append(tree.value[:, 0, 0])
+        offset += tree.node_count
+    max_depth = max(tree.tree_.max_depth for tree in trees)
+    return _tree_arrays(feature, threshold, left, right, value, roots), max_depth
+
+
+def _tree_arrays(feature, threshold, left, right, value, roots):
+    return {
+        "feature": np.concatenate(feature).astype(np.int32),
+        "threshold": np.concatenate(threshold).astype(np.float64),
+        "left": np.concatenate(left).astype(np.int32),
+        "right": np.concatenate(right).astype(np.int32),
+        "value": np.concatenate(value).astype(np.float64),
+        "roots": np.asarray(roots, dtype=np.int32),
+    }
+
+
+def _xgboost_lite(model):
+    booster = model.get_booster()
+    config = json.loads(booster.save_config())["learner"]
+    objective = config["objective"]["name"]
+    if objective != "reg:squarederror":
+        raise ValueError(f"XGBoost objective '{objective}' is not supported")
+    base_score = float(config["learner_model_param"]["base_score"].strip("[]"))
+
+    ## The JSON dump holds one nested dict per tree, x < split_condition goes to "yes"
+    feature, threshold, left, right, value, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for tree_json in booster.get_dump(dump_format="json"):
+        nodes = {}
+        stack = [(json.loads(tree_json), 0)]
+        while stack:
+            node, depth = stack.pop()
+            nodes[node["nodeid"]] = node
+            max_depth = max(max_depth, depth)
+            stack.extend((child, depth + 1) for child in node.get("children", ()))
+        n_nodes = max(nodes) + 1
+        tree_feature = np.zeros(n_nodes, dtype=np.int32)
+        tree_threshold = np.zeros(n_nodes)
+        tree_left = np.full(n_nodes, -1, dtype=np.int32)
+        tree_right = np.full(n_nodes, -1, dtype=np.int32)
+        tree_value = np.zeros(n_nodes)
+        for node_id, node in nodes.items():
+            if "leaf" in node:
+                tree_value[node_id] = node["leaf"]
+                continue
+            tree_feature[node_id] = int(node["split"].lstrip("f"))
+            ## Split conditions are single precision, rounding the dumped decimal back matters
+            ## for features that equal the condition
+            tree_threshold[node_id] = np.float32(node["split_condition"])
+            tree_left[node_id] = node["yes"] + offset
+            tree_right[node_id] = node["no"] + offset
+        roots.append(offset)
+        for part, array in zip((feature, threshold, left, right, value),
+                               (tree_feature, tree_threshold, tree_left, tree_right, tree_value)):
+            part.append(array)
+        offset += n_nodes
+
+    meta = {"base": base_score, "scale": 1.0, "combine": "sum", "split": "lt",
+            "max_depth": max_depth, "float32_features": True}
+    return LiteModel("tree_ensemble", _tree_arrays(feature, threshold, left, right, value, roots), meta)
+
+
+def _catboost_lite(model, tmp_path):
+    model.save_model(tmp_path, format="json")
+    try:
+        with open(tmp_path) as file_obj:
+            dumped = json.load(file_obj)
+    finally:
+        os.remove(tmp_path)
+    if dumped["features_info"].get("categorical_features"):
+        raise ValueError("CatBoost models with categorical features are not supported")
+
+    float_features = {
+        feature["feature_index"]: feature["flat_feature_index"]
+        for feature in dumped["features_info"]["float_features"]
+    }
+    trees = dumped["oblivious_trees"]
+    depth = max(len(tree["splits"]) for tree in trees)
+    split_feature = np.zeros((len(trees), depth), dtype=np.int32)
+    ## Missing levels of shallower trees never set their bit
+    border = np.full((len(trees), depth), np.inf)
+    leaf_value = np.zeros((len(trees), 2 ** depth))
+    for t, tree in enumerate(trees):
+        for d, split in enumerate(tree["splits"]):
+            if split["split_type"] != "FloatFeature":
+                raise ValueError(f"CatBoost split type '{split['split_type']}' is not supported")
+            split_feature[t, d] = float_features[split["float_feature_index"]]
+            border[t, d] = np.float32(split["border"])
+        leaf_value[t, :len(tree["leaf_values"])] = tree["leaf_values"]
+
+    scale, bias = dumped.get("scale_and_bias", [1.0, [0.0]])
+    bias = bias[0] if isinstance(bias, list) else bias
+    meta = {"base": float(bias), "scale": float(scale), "float32_features": True}
+    arrays = {"split_feature": split_feature, "border": border, "leaf_value": leaf_value}
+    return LiteModel("oblivious", arrays, meta)
+
+
+def compile_lite_model(model, tmp_dir="."):
+    """Returns the LiteModel equivalent of a fitted model, raises ValueError if it is not supported."""
+    name = type(model).__name__
+
+    if name in ("LinearRegression", "SGDRegressor", "Ridge", "Lasso", "ElasticNet"):
+        coef = np.ravel(model.coef_).astype(np.float64)
+        intercept = float(np.ravel(model.intercept_)[0]) if np.ndim(model.intercept_) else float(model.intercept_)
+        return LiteModel("linear", {"coef": coef}, {"intercept": intercept})
+
+    if name == "DecisionTreeRegressor":
+        arrays, max_depth = _sklearn_tree_arrays([model])
+        meta = {"base": 0.0, "scale": 1.0, "combine": "sum"}
+    elif name in ("RandomForestRegressor", "ExtraTreesRegressor"):
+        arrays, max_depth = _sklearn_tree_arrays(model.estimators_)
+        meta = {"base": 0.0, "scale": 1.0, "combine": "mean"}
+    elif name == "GradientBoostingRegressor":
+        ## raw prediction = init + learning_rate * sum of the stage trees
+        if model.init_ == "zero":
+            base = 0.0
+        elif hasattr(model.init_, "constant_"):
+            base = float(np.ravel(model.init_.constant_)[0])
+        else:
+            raise ValueError("Only a constant init estimator is supported")
+        if model.loss not in ("squared_error", "absolute_error", "huber", "quantile"):
+            raise ValueError(f"Loss '{model.loss}' is not supported")
+        arrays, max_depth = _sklearn_tree_arrays(model.estimators_[:, 0])
+        meta = {"base": base, "scale": float(model.learning_rate), "combine": "sum"}
+    elif name == "XGBRegressor":
+        return _xgboost_lite(model)
+    elif name == "CatBoostRegressor":
+        return _catboost_lite(model, os.path.join(tmp_dir, f"catboost.{os.getpid()}.json"))
+    else:
+        raise ValueError(f"{name} cannot be exported as a lite model")
+
+    meta.update(split="le", max_depth=int(max_depth), float32_features=True)
+    return LiteModel("tree_ensemble", arrays, meta)
+
+
+def export_lite_model(model, file_path, X_check, encoder=None, tolerance=1e-4, model_name=None):
+    """
+    Compiles model, checks it reproduces model.predict(X_check) within tolerance and saves it
+    to file_path. Returns the saved path, or None (and removes any older file) when the model
+    cannot be exported, so serving never pairs a stale lite model with a new model.pkl.
+    """
+    try:
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        try:
+            lite_model = compile_lite_model(model, tmp_dir=os.path.dirname(file_path) or ".")
+            expected = np.asarray(model.predict(X_check), dtype=np.float64).ravel()
+            max_error = float(np.max(np.abs(lite_model.predict(X_check) - expected))) if len(expected) else 0.0
+            if not max_error <= tolerance:
+                raise ValueError(f"predictions differ by up to {max_error:.3g} (tolerance {tolerance:g})")
+        except ValueError as e:
+            logging.info(f"Lite model not exported: {e}")
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            return None
+
+        lite_model.encoder = encoder
+        lite_model.meta.update(model_name=model_name or type(model).__name__, max_error=max_error)
+        tmp_path = f"{file_path}.{os.getpid()}.tmp"
+        lite_model.save(tmp_path)
+        os.replace(tmp_path, file_path)
+        logging.info(f"Exported lite model to {file_path}, max difference {max_error:.3g}")
+        return file_path
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def _remove_prediction_table(file_path):
+    for path in (file_path, table_meta_path(file_path)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def export_prediction_table(model, encoder, file_path, score_range=(0, 100), dtype="float32",
+                            batch_rows=250_000, max_cells=20_000_000, model_name=None):
+    """
+    Scores every combination of the encoder's categories and whole-number scores in score_range
+    with model and saves the results as a PredictionTable at file_path (+ its .json file).
+    Returns the saved path, or None (and removes any older table) when the grid cannot be built
+    or is larger than max_cells, so serving never answers from a table of another model.
+    """
+    try:
+        if encoder is None:
+            logging.info("Prediction table not exported: no compiled encoder for the preprocessor")
+            _remove_prediction_table(file_path)
+            return None
+
+        score_min, score_max = (int(bound) for bound in score_range)
+        n_numerical = len(encoder.numerical_columns)
+        category_counts = [len(values) for values in encoder.categories]
+        shape = tuple(category_counts) + (score_max - score_min + 1,) * n_numerical
+        n_cells = int(np.prod(shape))
+        if n_cells > max_cells:
+            logging.info(f"Prediction table not exported: {n_cells} cells is more than max_cells={max_cells}")
+            _remove_prediction_table(file_path)
+            return None
+
+        start = time.perf_counter()
+        ## Numerical and categorical features are encoded independently of each other, so the
+        ## score grid and every category combination are encoded once and only combined per batch
+        scores = np.arange(score_min, score_max + 1, dtype=np.float64)
+        score_grid = [axis.ravel() for axis in np.meshgrid(*[scores] * n_numerical, indexing="ij")]
+        first_categories = {column: [values[0]] * len(score_grid[0])
+                            for column, values in zip(encoder.categorical_columns, encoder.categories)}
+        grid_features = encoder.transform_columns(
+            dict(first_categories, **dict(zip(encoder.numerical_columns, score_grid)))
+        )[:, :n_numerical]
+
+        combinations = list(itertools.product(*encoder.categories))
+        combination_features = encoder.transform_columns(dict(
+            {column: [combination[k] for combination in combinations]
+             for k, column in enumerate(encoder.categorical_columns)},
+            **{column: [float(score_min)] * len(combinations) for column in encoder.numerical_columns},
+        ))[:, n_numerical:]
+
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        tmp_path = f"{file_path}.{os.getpid()}.tmp.npy"
+        table = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.dtype(dtype), shape=shape)
+        flat_table = table.reshape(-1)
+        grid_size = len(grid_features)
+        ## itertools.product runs in C order, so combination i fills cells [i * grid_size, (i + 1) * grid_size)
+        combinations_per_batch = max(1, batch_rows // grid_size)
+        for first in range(0, len(combinations), combinations_per_batch):
+            last = min(first + combinations_per_batch, len(combinations))
+            X_batch = np.empty(((last - first) * grid_size, encoder.n_features))
+            X_batch[:, :n_numerical] = np.tile(grid_features, (last - first, 1))
+            X_batch[:, n_numerical:] = np.repeat(combination_features[first:last], grid_size, axis=0)
+            flat_table[first * grid_size:last * grid_size] = np.asarray(model.predict(X_batch)).ravel()
+        table.flush()
+        values_hash = table_values_hash(table)
+        del table, flat_table
+
+        meta = {
+            "format_version": PREDICTION_TABLE_FORMAT_VERSION,
+            "categorical_columns": list(encoder.categorical_columns),
+            "categories": [list(values) for values in encoder.categories],
+            "numerical_columns": list(encoder.numerical_columns),
+            "score_range": [score_min, score_max],
+            "model_name": model_name or type(model).__name__,
+            # Ties the .json file to this table, see PredictionTable.load
+            "values_sha256": values_hash,
+        }
+        ## Both files are replaced atomically, the meta first. A reader in between (or after a
+        ## crash in between) finds a table that does not match values_sha256 and refuses it
+        meta_path = table_meta_path(file_path)
+        tmp_meta_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_meta_path, "w") as file_obj:
+            json.dump(meta, file_obj, indent=2)
+        os.replace(tmp_meta_path, meta_path)
+        os.replace(tmp_path, file_path)
+        logging.info(f"Exported prediction table with {n_cells} cells to {file_path} "
+                     f"in {time.perf_counter() - start:.2f}s")
+        return file_path
+
+    except Exception as e:
+        raise CustomException(e, sys)
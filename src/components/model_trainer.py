@@ -1,24 +1,32 @@
 ## Training a model using the provided dataset and configuration
 
+import dataclasses
 import os
 import sys
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Optional
 
-from catboost import CatBoostClassifier
-from sklearn.ensemble import (
-    AdaBoostRegressor,
-    GradientBoostingRegressor,
-    RandomForestRegressor,
-)
-from sklearn.linear_model import LinearRegression
+import numpy as np
+from scipy import sparse
 from sklearn.metrics import r2_score
-from sklearn.neighbors import KNeighborsRegressor
-from sklearn.tree import DecisionTreeRegressor
-from xgboost import XGBRegressor    
 
 from src.exception import CustomException
 from src.logger import logging
-from src.utils import save_object,evaluate_model
+from src.components.data_transformation import DataTransformationConfig
+from src.components.hyperparameter_search import HyperparameterSearchConfig
+from src.components.hyperparameter_search import HyperparameterSearch
+from src.components.model_export import export_lite_model, export_prediction_table
+from src.components.training_profiler import (
+    ExperimentStore,
+    ResourceUsage,
+    TrainingProfilerConfig,
+    constraint_violations,
+    profile_candidates,
+)
+from src.pipeline.model_registry import compile_encoder
+from src.pipeline.prediction_table import table_meta_path
+from src.stage_cache import StageCache
+from src.utils import save_object,load_object,evaluate_model,fit_and_score_model,write_artifact_manifest
 
 
 @dataclass
@@ -26,12 +34,178 @@ class ModelTrainerConfig:
     trained_model_file_path: str = os.path.join(
         "artifacts", "model.pkl"
     )
+    # Lists the model + preprocessor pair so serving can hot-reload them together
+    manifest_file_path: str = os.path.join(
+        "artifacts", "manifest.json"
+    )
+    # Number of models fitted at the same time, 1 fits them one after another, -1 uses all cores
+    n_jobs: int = 1
+    # "process" or "thread" pool used when n_jobs is not 1
+    parallel_backend: str = "process"
+    # How the `params` grids are searched, see HyperparameterSearchConfig
+    search_config: HyperparameterSearchConfig = field(default_factory=HyperparameterSearchConfig)
+    # Passes over the training batches made by initiate_model_trainer_streaming
+    streaming_epochs: int = 5
+    # Models that need dense input, sparse features are converted with toarray() for them only.
+    # All the default candidates accept scipy CSR matrices
+    dense_input_models: tuple = ()
+    # Pure-NumPy copy of the best model + preprocessor for fast serving, see model_export.py.
+    # It is only written when its predictions match the model's within lite_model_tolerance
+    lite_model_file_path: str = os.path.join(
+        "artifacts", "model_lite.npz"
+    )
+    export_lite_model: bool = True
+    lite_model_tolerance: float = 1e-3
+    # Predictions of the best model for every category combination and whole-number score
+    # (+ a .json file with the axes), served with a direct lookup, see prediction_table.py
+    prediction_table_file_path: str = os.path.join(
+        "artifacts", "prediction_table.npy"
+    )
+    export_prediction_table: bool = True
+    prediction_table_score_range: tuple = (0, 100)
+    # float32 keeps the table at 4 bytes per cell, predictions differ by about 1e-5 at most
+    prediction_table_dtype: str = "float32"
+    # Larger input spaces are not tabulated, the model scores them as usual
+    prediction_table_max_cells: int = 20_000_000
+    # "holdout" selects the model by its R2 on the test split, "kfold" by its mean R2 over the
+    # cross-validation folds from DataTransformation.initiate_cv_folds (passed in as `folds`)
+    evaluation: str = "holdout"
+    # Serving limits for the selected model: the best R2 among the candidates whose single-row
+    # predict p99 latency and pickled size stay under them (None = no limit), e.g. 1ms and 5MB
+    # rather than a 256-tree forest for a 0.002 R2 gain
+    max_p99_latency_ms: Optional[float] = None
+    max_model_size_mb: Optional[float] = None
+    # Latency / size measurements and the experiment store every run is saved to
+    profiler_config: TrainingProfilerConfig = field(default_factory=TrainingProfilerConfig)
 
 class ModelTrainer:
     def __init__(self):
         self.model_trainer_config = ModelTrainerConfig()
+        self.model_report = {}
+        self.stage_cache = StageCache()
+
+    def _write_manifest(self):
+        ## Written last: running web workers pick up the new model + preprocessor pair only after this
+        file_paths = [
+            self.model_trainer_config.trained_model_file_path,
+            DataTransformationConfig().preprocessor_obj_file_path,
+        ]
+        ## The lite model and the prediction table are listed only when they belong to this
+        ## model, see _export_lite_model and _export_prediction_table
+        if os.path.exists(self.model_trainer_config.lite_model_file_path):
+            file_paths.append(self.model_trainer_config.lite_model_file_path)
+        if os.path.exists(self.model_trainer_config.prediction_table_file_path):
+            file_paths.extend(self._prediction_table_files().values())
+        write_artifact_manifest(
+            manifest_path=self.model_trainer_config.manifest_file_path,
+            file_paths=file_paths
+        )
+
+    def _export_lite_model(self, model, model_name, X_check):
+        """Exports the lite model next to model.pkl, removes an older one when that is not possible."""
+        lite_model_file_path = self.model_trainer_config.lite_model_file_path
+        if not self.model_trainer_config.export_lite_model:
+            if os.path.exists(lite_model_file_path):
+                os.remove(lite_model_file_path)
+            return None
+        preprocessor = load_object(DataTransformationConfig().preprocessor_obj_file_path)
+        return export_lite_model(
+            model, lite_model_file_path, X_check,
+            encoder=compile_encoder(preprocessor),
+            tolerance=self.model_trainer_config.lite_model_tolerance,
+            model_name=model_name,
+        )
+
+    def _prediction_table_files(self):
+        table_path = self.model_trainer_config.prediction_table_file_path
+        return {"prediction_table": table_path, "prediction_table_meta": table_meta_path(table_path)}
+
+    def _export_prediction_table(self, model, model_name):
+        """Scores the whole input grid with the best model, removes an older table when that is not possible."""
+        config = self.model_trainer_config
+        encoder = None
+        if config.export_prediction_table:
+            encoder = compile_encoder(load_object(DataTransformationConfig().preprocessor_obj_file_path))
+        ## Without an encoder (disabled or not compilable) only an older table is removed
+        return export_prediction_table(
+            model, encoder, config.prediction_table_file_path,
+            score_range=config.prediction_table_score_range,
+            dtype=config.prediction_table_dtype,
+            max_cells=config.prediction_table_max_cells,
+            model_name=model_name,
+        )
+
+    def get_models(self):
+        """Returns the candidate models, name -> unfitted estimator."""
+        ## The model libraries are imported only when we really train, a cache hit
+        ## (or importing this module) never loads catboost or xgboost
+        from catboost import CatBoostRegressor
+        from sklearn.ensemble import (
+            AdaBoostRegressor,
+            GradientBoostingRegressor,
+            RandomForestRegressor,
+        )
+        from sklearn.linear_model import LinearRegression
+        from sklearn.neighbors import KNeighborsRegressor
+        from sklearn.tree import DecisionTreeRegressor
+        from xgboost import XGBRegressor
+
+        models = {
+            "LinearRegression": LinearRegression(),
+            "DecisionTreeRegressor": DecisionTreeRegressor(),
+            "RandomForestRegressor": RandomForestRegressor(),
+            "GradientBoostingRegressor": GradientBoostingRegressor(),
+            "AdaBoostRegressor": AdaBoostRegressor(),
+            "KNeighborsRegressor": KNeighborsRegressor(),
+            "XGBRegressor": XGBRegressor(),
+            "CatBoostRegressor": CatBoostRegressor(verbose=0),
+        }
+        return models
+
+    def get_params(self):
+        """Returns the hyperparameter grids of the candidate models."""
+        ## Hyperparameter grids, keyed by the same names as `models`
+        params={
+            "DecisionTreeRegressor": {
+                'criterion':['squared_error', 'friedman_mse', 'absolute_error', 'poisson'],
+                # 'splitter':['best','random'],
+                # 'max_features':['sqrt','log2'],
+            },
+            "RandomForestRegressor":{
+                # 'criterion':['squared_error', 'friedman_mse', 'absolute_error', 'poisson'],
+
+                # 'max_features':['sqrt','log2',None],
+                'n_estimators': [8,16,32,64,128,256]
+            },
+            "GradientBoostingRegressor":{
+                # 'loss':['squared_error', 'huber', 'absolute_error', 'quantile'],
+                'learning_rate':[.1,.01,.05,.001],
+                'subsample':[0.6,0.7,0.75,0.8,0.85,0.9],
+                # 'criterion':['squared_error', 'friedman_mse'],
+                # 'max_features':['auto','sqrt','log2'],
+                'n_estimators': [8,16,32,64,128,256]
+            },
+            "LinearRegression":{},
+            "XGBRegressor":{
+                'learning_rate':[.1,.01,.05,.001],
+                'n_estimators': [8,16,32,64,128,256]
+            },
+            "CatBoostRegressor":{
+                'depth': [6,8,10],
+                'learning_rate': [0.01, 0.05, 0.1],
+                'iterations': [30, 50, 100]
+            },
+            "AdaBoostRegressor":{
+                'learning_rate':[.1,.01,0.5,.001],
+                # 'loss':['linear','square','exponential'],
+                'n_estimators': [8,16,32,64,128,256]
+            }
+
+        }
+        return params
 
     def initiate_model_trainer(self, train_array, test_array):
+        """Trains on arrays that hold the features with the target as last column."""
         try:
             logging.info("Splitting training and testing input data")
             X_train, y_train, X_test, y_test = (
@@ -40,80 +214,239 @@ class ModelTrainer:
                 test_array[:, :-1],
                 test_array[:, -1],
             )
-            models = {
-                "LinearRegression": LinearRegression(),
-                "DecisionTreeRegressor": DecisionTreeRegressor(),
-                "RandomForestRegressor": RandomForestRegressor(),
-                "GradientBoostingRegressor": GradientBoostingRegressor(),
-                "AdaBoostRegressor": AdaBoostRegressor(),
-                "KNeighborsRegressor": KNeighborsRegressor(),
-                "XGBRegressor": XGBRegressor(),
-                "CatBoostClassifier": CatBoostClassifier(verbose=0),
-            }
+            return self.initiate_model_trainer_xy(X_train, y_train, X_test, y_test)
+        except Exception as e:
+            raise CustomException(e, sys)
 
-            params={
-                "Decision Tree": {
-                    'criterion':['squared_error', 'friedman_mse', 'absolute_error', 'poisson'],
-                    # 'splitter':['best','random'],
-                    # 'max_features':['sqrt','log2'],
-                },
-                "Random Forest":{
-                    # 'criterion':['squared_error', 'friedman_mse', 'absolute_error', 'poisson'],
-                 
-                    # 'max_features':['sqrt','log2',None],
-                    'n_estimators': [8,16,32,64,128,256]
-                },
-                "Gradient Boosting":{
-                    # 'loss':['squared_error', 'huber', 'absolute_error', 'quantile'],
-                    'learning_rate':[.1,.01,.05,.001],
-                    'subsample':[0.6,0.7,0.75,0.8,0.85,0.9],
-                    # 'criterion':['squared_error', 'friedman_mse'],
-                    # 'max_features':['auto','sqrt','log2'],
-                    'n_estimators': [8,16,32,64,128,256]
-                },
-                "Linear Regression":{},
-                "XGBRegressor":{
-                    'learning_rate':[.1,.01,.05,.001],
-                    'n_estimators': [8,16,32,64,128,256]
-                },
-                "CatBoosting Regressor":{
-                    'depth': [6,8,10],
-                    'learning_rate': [0.01, 0.05, 0.1],
-                    'iterations': [30, 50, 100]
-                },
-                "AdaBoost Regressor":{
-                    'learning_rate':[.1,.01,0.5,.001],
-                    # 'loss':['linear','square','exponential'],
-                    'n_estimators': [8,16,32,64,128,256]
-                }
-                
-            }
+    def initiate_model_trainer_xy(self, X_train, y_train, X_test, y_test, folds=None):
+        """
+        Trains every candidate model and saves the best one, returns its R2 on the test data.
+        X may be a dense array or a scipy CSR matrix, sparse input is passed straight to
+        the models except those listed in dense_input_models.
+        folds (CrossValidationFolds) adds k-fold scores to the report, the model with the best
+        mean fold R2 is then selected. They are required when evaluation is "kfold".
+        """
+        try:
+            ## Skip training if the same arrays, config and code were trained on before.
+            ## n_jobs and parallel_backend only change how fast training runs, not its result
+            cache_config = dataclasses.asdict(self.model_trainer_config)
+            cache_config.pop("n_jobs")
+            cache_config.pop("parallel_backend")
+            if self.model_trainer_config.evaluation == "kfold" and folds is None:
+                raise ValueError("evaluation='kfold' needs the folds from DataTransformation.initiate_cv_folds")
+            fingerprint = self.stage_cache.fingerprint(
+                "model_trainer",
+                inputs=[X_train, y_train, X_test, y_test, *(folds.file_paths() if folds is not None else [])],
+                config=cache_config,
+                code=[ModelTrainer, evaluate_model, fit_and_score_model, HyperparameterSearch, export_lite_model,
+                      export_prediction_table, profile_candidates, constraint_violations],
+            )
+            cached = self.stage_cache.lookup("model_trainer", fingerprint)
+            if cached is not None:
+                restore = {"model": self.model_trainer_config.trained_model_file_path}
+                if "lite_model" in cached["files"]:
+                    restore["lite_model"] = self.model_trainer_config.lite_model_file_path
+                elif os.path.exists(self.model_trainer_config.lite_model_file_path):
+                    os.remove(self.model_trainer_config.lite_model_file_path)
+                table_files = self._prediction_table_files()
+                if "prediction_table" in cached["files"]:
+                    restore.update(table_files)
+                else:
+                    for path in table_files.values():
+                        if os.path.exists(path):
+                            os.remove(path)
+                self.stage_cache.restore_files(cached, restore)
+                self._write_manifest()
+                self.model_report = cached["metadata"]["model_report"]
+                logging.info("Training skipped, reused cached model")
+                return cached["metadata"]["r2_square"]
+
+            models = self.get_models()
+            params = self.get_params()
 
             model_report:dict = evaluate_model(X_train=X_train, y_train=y_train, X_test=X_test,
-                                                y_test=y_test, models=models,param=params)
+                                                y_test=y_test, models=models,param=params,
+                                                n_jobs=self.model_trainer_config.n_jobs,
+                                                backend=self.model_trainer_config.parallel_backend,
+                                                search_config=self.model_trainer_config.search_config,
+                                                dense_models=self.model_trainer_config.dense_input_models,
+                                                folds=folds)
 
-            ## To get the best model score from the model report
-            best_model_score = max(model_report.values())
+            best_model_name, r2_square, lite_model_path = self.save_best_model(
+                models, model_report, X_test, y_test
+            )
 
-            ## To get the best model name from the model report
-            best_model_name = max(model_report, key=model_report.get)
+            cache_files = {"model": self.model_trainer_config.trained_model_file_path}
+            if lite_model_path is not None:
+                cache_files["lite_model"] = lite_model_path
+            ## The table only exists when it was exported for this model, see _export_prediction_table
+            if os.path.exists(self.model_trainer_config.prediction_table_file_path):
+                cache_files.update(self._prediction_table_files())
+            self.stage_cache.store(
+                "model_trainer", fingerprint,
+                files=cache_files,
+                metadata={"r2_square": r2_square, "model_report": model_report},
+            )
+            return r2_square
+        
+
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def save_best_model(self, models, model_report, X_test, y_test):
+        """
+        Picks the best fitted model from the report, saves it (plus the lite model and the
+        manifest) and returns (best model name, its R2 on the test data, lite model path or None).
+        """
+        try:
+            best_model_name, best_model_score = self.select_model(models, model_report, X_test)
             best_model = models[best_model_name]
+            logging.info(f"Best model found: {best_model_name} with score: {best_model_score} "
+                         f"and parameters: {model_report[best_model_name]['best_params']}")
+
+            if sparse.issparse(X_test) and best_model_name in self.model_trainer_config.dense_input_models:
+                X_test = X_test.toarray()
+            lite_model_path = self.save_model(best_model, best_model_name, X_test)
 
-            if( best_model_score < 0.6):
-                raise CustomException("No best model found with sufficient accuracy")
-            logging.info(f"Best model found: {best_model_name} with score: {best_model_score}")
+            prediction = best_model.predict(X_test)
+            r2_square = r2_score(y_test, prediction)
+            return best_model_name, r2_square, lite_model_path
+        except Exception as e:
+            raise CustomException(e, sys)
 
+    def select_model(self, models, model_report, X_test, n_test_rows=None):
+        """
+        Profiles the fitted candidates on X_test, saves the run to the experiment store and
+        returns (name, score) of the best model within the latency and size limits.
+        Raises ValueError when no model is selectable or the best one scores below 0.6.
+        """
+        ## Kept on the trainer so callers can inspect scores, timings and best parameters
+        self.model_report = model_report
+
+        config = self.model_trainer_config
+        ## Pickled size and single-row latency of every candidate, for the limits below and the store
+        profile_candidates(models, model_report, X_test, config.dense_input_models, config.profiler_config)
+
+        ## Only models that trained without errors and stay within the serving limits can be selected.
+        ## With cross-validation the mean fold score decides, it is far less noisy than one split
+        violations = {}
+        model_scores = {}
+        for name, result in model_report.items():
+            if result["error"] is not None:
+                continue
+            violations[name] = constraint_violations(result, config.max_p99_latency_ms, config.max_model_size_mb)
+            if violations[name]:
+                logging.info(f"{name} not selectable: {', '.join(violations[name])}")
+                continue
+            model_scores[name] = result["cv"]["r2_mean"] if result.get("cv") else result["r2_score"]
+
+        ## To get the best model name and score from the model report
+        best_model_name = max(model_scores, key=model_scores.get) if model_scores else None
+        self._record_run(model_report, best_model_name, X_test, violations, n_test_rows)
+        if best_model_name is None:
+            if violations:
+                raise ValueError("No model meets the latency and size limits")
+            raise ValueError("All models failed to train")
+        best_model_score = model_scores[best_model_name]
+        if( best_model_score < 0.6):
+            raise ValueError("No best model found with sufficient accuracy")
+        return best_model_name, best_model_score
+
+    def _record_run(self, model_report, best_model_name, X_test, violations, n_test_rows=None):
+        """Saves the run with every candidate's measurements to the experiment store."""
+        config = self.model_trainer_config
+        if not config.profiler_config.record_runs:
+            return None
+        best_result = model_report.get(best_model_name) or {}
+        run_id = ExperimentStore(config.profiler_config.experiment_db_path).record_run(
+            model_report,
+            selected_model=best_model_name,
+            selected_r2=best_result.get("r2_score"),
+            n_test_rows=n_test_rows if n_test_rows is not None else X_test.shape[0],
+            n_features=X_test.shape[1],
+            constraints={"max_p99_latency_ms": config.max_p99_latency_ms,
+                         "max_model_size_mb": config.max_model_size_mb},
+            violations=violations,
+        )
+        logging.info(f"Training run {run_id} saved to {config.profiler_config.experiment_db_path}")
+        return run_id
+
+    def save_model(self, model, model_name, X_check):
+        """
+        Saves model.pkl, the lite model (checked on X_check) and the prediction table, then the
+        manifest. The preprocessor must already be saved. Returns the lite model path or None.
+        """
+        try:
             save_object(
                 file_path=self.model_trainer_config.trained_model_file_path,
-                obj=best_model
+                obj=model
             )
+            lite_model_path = self._export_lite_model(model, model_name, X_check)
+            self._export_prediction_table(model, model_name)
+            self._write_manifest()
+            return lite_model_path
+        except Exception as e:
+            raise CustomException(e, sys)
 
-            prediction = best_model.predict(X_test)
-            r2_square = r2_score(y_test, prediction)
-            return r2_square
-        
+    def initiate_model_trainer_streaming(self, train_batches, test_batches):
+        """
+        Out-of-core version of initiate_model_trainer for data that does not fit in memory.
+        train_batches and test_batches are callables that return a fresh iterator of (X, y)
+        batches, e.g. lambda: DataTransformation().iter_transformed_batches(path, preprocessor).
+        Only models with partial_fit are trained, so peak memory is bounded by the batch size.
+        """
+        try:
+            from sklearn.linear_model import SGDRegressor
+            from sklearn.neural_network import MLPRegressor
 
+            models = {
+                "SGDRegressor": SGDRegressor(random_state=42),
+                "MLPRegressor": MLPRegressor(hidden_layer_sizes=(64,), random_state=42),
+            }
+            ## Summed over the batches: wall time, CPU time and the highest peak memory of one call
+            usage = {model_name: {"fit": [0.0, 0.0, 0.0], "predict": [0.0, 0.0, 0.0]} for model_name in models}
+
+            def measure(totals, call, *args):
+                with ResourceUsage() as batch_usage:
+                    output = call(*args)
+                totals[0] += batch_usage.wall_time
+                totals[1] += batch_usage.cpu_time
+                totals[2] = max(totals[2], batch_usage.peak_memory_mb)
+                return output
+
+            ## Every pass reads the data once and feeds each batch to all models
+            for epoch in range(self.model_trainer_config.streaming_epochs):
+                for X_batch, y_batch in train_batches():
+                    for model_name, model in models.items():
+                        measure(usage[model_name]["fit"], model.partial_fit, X_batch, y_batch)
+                logging.info(f"Streaming training epoch {epoch + 1} done")
+
+            ## R2 from running sums, without keeping the test predictions in memory
+            sums = {model_name: np.zeros(4) for model_name in models}  # n, sum y, sum y^2, SSE
+            for X_batch, y_batch in test_batches():
+                for model_name, model in models.items():
+                    residual = y_batch - measure(usage[model_name]["predict"], model.predict, X_batch)
+                    sums[model_name] += (len(y_batch), y_batch.sum(), (y_batch ** 2).sum(), (residual ** 2).sum())
+
+            model_report = {}
+            for model_name, (n, sum_y, sum_y2, sse) in sums.items():
+                total = sum_y2 - sum_y ** 2 / n
+                fit, predict = usage[model_name]["fit"], usage[model_name]["predict"]
+                model_report[model_name] = {
+                    "r2_score": float(1 - sse / total), "fit_time": fit[0],
+                    "predict_time": predict[0], "error": None, "best_params": {}, "search": None, "cv": None,
+                    "fit_cpu_time": fit[1], "fit_peak_memory_mb": fit[2], "predict_cpu_time": predict[1],
+                    "predict_peak_memory_mb": predict[2],
+                }
+
+            ## One test batch is enough to profile the candidates and to check the lite model
+            X_check, _ = next(iter(test_batches()))
+            n_test_rows = int(next(iter(sums.values()))[0])
+            best_model_name, best_model_score = self.select_model(models, model_report, X_check, n_test_rows)
+            logging.info(f"Best streaming model found: {best_model_name} with score: {best_model_score}")
+            self.save_model(models[best_model_name], best_model_name, X_check)
+            return best_model_score
 
         except Exception as e:
             raise CustomException(e, sys)
-
@@ -0,0 +1,351 @@
+## Resource accounting for the candidate models of a training run, and the experiment store
+## that keeps every run so they can be compared later.
+## fit_and_score_model measures the wall time, CPU time and peak memory of each fit and test
+## predict (ResourceUsage). ModelTrainer.select_model then adds the serialized size and the
+## single-row predict latency of every candidate (profile_candidates), can reject the ones over
+## the latency / size limits of ModelTrainerConfig (constraint_violations) and saves the run
+## with all its candidates to a SQLite file (ExperimentStore).
+
+import json
+import math
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.exception import CustomException
+from src.logger import logging
+
+## Linux keeps the peak resident memory of the process (VmHWM) and lets it be reset, so the
+## peak of one fit includes the memory of native libraries (xgboost, catboost, OpenMP threads).
+## Elsewhere tracemalloc is used, it sees Python and NumPy allocations only
+_CLEAR_REFS_PATH = "/proc/self/clear_refs"
+_STATUS_PATH = "/proc/self/status"
+
+
+def _read_status_mb(key):
+    with open(_STATUS_PATH) as file_obj:
+        for line in file_obj:
+            if line.startswith(key + ":"):
+                return int(line.split()[1]) / 1024  # kB
+    return None
+
+
+def _reset_peak_rss():
+    """Resets VmHWM to the current RSS, returns False when the platform does not support it."""
+    try:
+        with open(_CLEAR_REFS_PATH, "w") as file_obj:
+            file_obj.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class ResourceUsage:
+    """
+    Wall time, CPU time and peak memory of the code in a with block:
+        with ResourceUsage() as usage:
+            model.fit(X, y)
+        usage.wall_time, usage.cpu_time, usage.peak_memory_mb
+    peak_memory_mb is the highest memory use above what the process used when the block started.
+    CPU time and memory are per process, and resetting the peak would wipe the peak of another
+    block: with shared_process=True (other work runs in this process at the same time, e.g. the
+    "thread" backend of evaluate_model) only the wall time is measured, the others are None.
+    """
+
+    def __init__(self, shared_process=False):
+        self.shared_process = shared_process
+        self.wall_time = self.cpu_time = self.peak_memory_mb = None
+
+    def __enter__(self):
+        self._wall_start = time.perf_counter()
+        if self.shared_process:
+            return self
+        self._use_rss = _reset_peak_rss()
+        if self._use_rss:
+            self._baseline_mb = _read_status_mb("VmRSS")
+        else:
+            self._started_tracemalloc = not tracemalloc.is_tracing()
+            if self._started_tracemalloc:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self._baseline_mb = tracemalloc.get_traced_memory()[0] / 2 ** 20
+        self._cpu_start = time.process_time()
+        self._wall_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wall_time = time.perf_counter() - self._wall_start
+        if self.shared_process:
+            return False
+        self.cpu_time = time.process_time() - self._cpu_start
+        if self._use_rss:
+            peak_mb = _read_status_mb("VmHWM")
+        else:
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+        self.peak_memory_mb = max(0.0, peak_mb - self._baseline_mb)
+        return False
+
+
+@dataclass
+class TrainingProfilerConfig:
+    """Configuration class for the training profiler."""
+    # Every training run with the measurements of all its candidates, see ExperimentStore
+    experiment_db_path: str = os.path.join("artifacts", "experiments.sqlite")
+    record_runs: bool = True
+    # Single-row predict calls timed per candidate for the latency percentiles
+    latency_samples: int = 200
+    # Untimed calls first, so lazy initialisation does not end up in the percentiles
+    latency_warmup: int = 5
+
+
+def model_size_bytes(model):
+    """Size of the pickled model, what model.pkl takes for it."""
+    import dill
+
+    return len(dill.dumps(model, protocol=5))
+
+
+def predict_latency_ms(model, X, samples, warmup=5):
+    """Times model.predict on single rows of X (cycled), returns (p50, p99) in milliseconds."""
+    n_rows = X.shape[0]
+    for i in range(warmup):
+        model.predict(X[i % n_rows:i % n_rows + 1])
+    timings = np.empty(samples)
+    for i in range(samples):
+        row = X[i % n_rows:i % n_rows + 1]
+        start = time.perf_counter()
+        model.predict(row)
+        timings[i] = time.perf_counter() - start
+    p50, p99 = np.percentile(timings, [50, 99]) * 1000
+    return float(p50), float(p99)
+
+
+def profile_candidates(models, model_report, X_test, dense_models=(), config=None):
+    """
+    Adds "model_size_bytes", "latency_p50_ms" and "latency_p99_ms" to the report entry of every
+    model that trained. The latency is that of the fitted estimator scoring one row at a time,
+    measured one model after the other so they do not compete for the cores.
+    """
+    try:
+        from scipy import sparse
+
+        config = config or TrainingProfilerConfig()
+        X_dense = None
+        for model_name, result in model_report.items():
+            result.update(model_size_bytes=None, latency_p50_ms=None, latency_p99_ms=None)
+            if result["error"] is not None:
+                continue
+            X = X_test
+            if sparse.issparse(X_test) and model_name in dense_models:
+                if X_dense is None:
+                    X_dense = X_test.toarray()
+                X = X_dense
+            model = models[model_name]
+            result["model_size_bytes"] = model_size_bytes(model)
+            result["latency_p50_ms"], result["latency_p99_ms"] = predict_latency_ms(
+                model, X, config.latency_samples, config.latency_warmup
+            )
+        return model_report
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def constraint_violations(result, max_p99_latency_ms=None, max_model_size_mb=None):
+    """Returns why a profiled report entry breaks the limits (an empty list when it does not)."""
+    violations = []
+    latency = result.get("latency_p99_ms")
+    if max_p99_latency_ms is not None and latency is not None and latency > max_p99_latency_ms:
+        violations.append(f"p99 latency {latency:.3f}ms > {max_p99_latency_ms}ms")
+    size = result.get("model_size_bytes")
+    if max_model_size_mb is not None and size is not None and size > max_model_size_mb * 2 ** 20:
+        violations.append(f"size {size / 2 ** 20:.2f}MB > {max_model_size_mb}MB")
+    return violations
+
+
+## Report fields stored for every candidate, in column order
+CANDIDATE_COLUMNS = {
+    "r2_score": "REAL",
+    "cv_r2_mean": "REAL",
+    "fit_time": "REAL",
+    "fit_cpu_time": "REAL",
+    "fit_peak_memory_mb": "REAL",
+    "predict_time": "REAL",
+    "predict_cpu_time": "REAL",
+    "predict_peak_memory_mb": "REAL",
+    "latency_p50_ms": "REAL",
+    "latency_p99_ms": "REAL",
+    "model_size_bytes": "INTEGER",
+    "best_params": "TEXT",
+    "violations": "TEXT",
+    "error": "TEXT",
+}
+
+
+def _json_or_none(value):
+    return None if value is None else json.dumps(value, sort_keys=True, default=str)
+
+
+def _number_or_none(value):
+    ## NaN (e.g. R2 of a constant prediction) is stored as NULL, SQLite has no NaN
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return float(value)
+
+
+class ExperimentStore:
+    """
+    SQLite file with one row per training run (runs) and one per candidate model of a run
+    (candidates). Query it with the methods below, or with any SQLite client:
+        SELECT model_name, r2_score, latency_p99_ms FROM candidates WHERE run_id = 3
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or TrainingProfilerConfig().experiment_db_path
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        connection = sqlite3.connect(self.db_path)
+        connection.row_factory = sqlite3.Row
+        candidate_columns = ", ".join(f"{name} {kind}" for name, kind in CANDIDATE_COLUMNS.items())
+        connection.executescript(f"""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                selected_model TEXT,
+                selected_r2 REAL,
+                n_test_rows INTEGER,
+                n_features INTEGER,
+                constraints TEXT
+            );
+            CREATE TABLE IF NOT EXISTS candidates (
+                run_id INTEGER NOT NULL REFERENCES runs(run_id),
+                model_name TEXT NOT NULL,
+                {candidate_columns},
+                PRIMARY KEY (run_id, model_name)
+            );
+        """)
+        return connection
+
+    def record_run(self, model_report, selected_model=None, selected_r2=None, n_test_rows=None,
+                   n_features=None, constraints=None, violations=None):
+        """Saves a run and its candidates (a model report), returns the run id."""
+        try:
+            violations = violations or {}
+            connection = self._connect()
+            try:
+                with connection:
+                    cursor = connection.execute(
+                        "INSERT INTO runs (created_at, selected_model, selected_r2, n_test_rows, n_features, "
+                        "constraints) VALUES (?, ?, ?, ?, ?, ?)",
+                        (time.time(), selected_model, _number_or_none(selected_r2), n_test_rows, n_features,
+                         _json_or_none(constraints)),
+                    )
+                    run_id = cursor.lastrowid
+                    rows = []
+                    for model_name, result in model_report.items():
+                        cv = result.get("cv") or {}
+                        values = dict(result, cv_r2_mean=cv.get("r2_mean"),
+                                      best_params=_json_or_none(result.get("best_params")),
+                                      violations=_json_or_none(violations.get(model_name)))
+                        row = [run_id, model_name]
+                        for column, kind in CANDIDATE_COLUMNS.items():
+                            value = values.get(column)
+                            row.append(value if kind != "REAL" else _number_or_none(value))
+                        rows.append(row)
+                    placeholders = ", ".join("?" * (len(CANDIDATE_COLUMNS) + 2))
+                    connection.executemany(
+                        f"INSERT INTO candidates (run_id, model_name, {', '.join(CANDIDATE_COLUMNS)}) "
+                        f"VALUES ({placeholders})",
+                        rows,
+                    )
+            finally:
+                connection.close()
+            return run_id
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _query(self, sql, parameters=()):
+        connection = self._connect()
+        try:
+            return [dict(row) for row in connection.execute(sql, parameters)]
+        finally:
+            connection.close()
+
+    def runs(self, limit=20):
+        """The latest runs, newest first."""
+        return self._query("SELECT * FROM runs ORDER BY run_id DESC LIMIT ?", (limit,))
+
+    def candidates(self, run_id=None, model_name=None):
+        """Candidate rows of one run and / or one model (all of them by default), oldest run first."""
+        conditions, parameters = [], []
+        if run_id is not None:
+            conditions.append("run_id = ?")
+            parameters.append(run_id)
+        if model_name is not None:
+            conditions.append("model_name = ?")
+            parameters.append(model_name)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._query(f"SELECT * FROM candidates {where} ORDER BY run_id, model_name", parameters)
+
+    def best_candidates(self, max_p99_latency_ms=None, max_model_size_mb=None, limit=10):
+        """
+        Candidates of every run with the highest R2 within the limits, e.g. the best model under
+        1ms p99 and 5MB: best_candidates(max_p99_latency_ms=1, max_model_size_mb=5).
+        """
+        conditions, parameters = ["error IS NULL", "r2_score IS NOT NULL"], []
+        if max_p99_latency_ms is not None:
+            conditions.append("latency_p99_ms <= ?")
+            parameters.append(max_p99_latency_ms)
+        if max_model_size_mb is not None:
+            conditions.append("model_size_bytes <= ?")
+            parameters.append(max_model_size_mb * 2 ** 20)
+        parameters.append(limit)
+        return self._query(
+            f"SELECT * FROM candidates WHERE {' AND '.join(conditions)} ORDER BY r2_score DESC LIMIT ?",
+            parameters,
+        )
+
+
+def format_candidates(rows):
+    """Text table of candidate rows, as printed by the command line below."""
+    lines = [f"{'run':>4} {'model':<26}{'r2':>8}{'fit s':>8}{'fit cpu':>8}{'peak MB':>9}"
+             f"{'p50 ms':>8}{'p99 ms':>8}{'size MB':>9}"]
+
+    def cell(value, width, fmt):
+        return f"{'-':>{width}}" if value is None else f"{value:>{width}{fmt}}"
+
+    for row in rows:
+        size = row["model_size_bytes"] / 2 ** 20 if row["model_size_bytes"] is not None else None
+        lines.append(
+            f"{row['run_id']:>4} {row['model_name']:<26}{cell(row['r2_score'], 8, '.4f')}"
+            f"{cell(row['fit_time'], 8, '.3f')}{cell(row['fit_cpu_time'], 8, '.3f')}"
+            f"{cell(row['fit_peak_memory_mb'], 9, '.1f')}{cell(row['latency_p50_ms'], 8, '.3f')}"
+            f"{cell(row['latency_p99_ms'], 8, '.3f')}{cell(size, 9, '.2f')}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Shows the training runs saved in the experiment store")
+    parser.add_argument("--db", default=TrainingProfilerConfig().experiment_db_path)
+    parser.add_argument("--run", type=int, help="candidates of this run (default: the latest run)")
+    parser.add_argument("--max-p99-ms", type=float, help="best candidates of all runs under this p99 latency")
+    parser.add_argument("--max-size-mb", type=float, help="best candidates of all runs under this model size")
+    args = parser.parse_args()
+
+    store = ExperimentStore(args.db)
+    if args.max_p99_ms is not None or args.max_size_mb is not None:
+        print(format_candidates(store.best_candidates(args.max_p99_ms, args.max_size_mb)))
+    else:
+        runs = store.runs(limit=1)
+        run_id = args.run if args.run is not None else (runs[0]["run_id"] if runs else None)
+        print(format_candidates(store.candidates(run_id=run_id) if run_id is not None else []))
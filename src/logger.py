@@ -1,39 +1,273 @@
+import atexit   # To flush the last log records when the program exits
+import copy
+import json     # Log records are written as one JSON object per line
 import logging  # Python's built-in module to create and manage log messages
+import logging.handlers
 import os       # For handling file and directory operations
-from datetime import datetime  # To get current time and date
+import queue    # Hands the records over to the background writer
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone  # To get current time and date
 
-## This file sets up a logger to log messages to a file with a timestamp in its name.
+## This file sets up asynchronous logging for the whole project.
+## logging.info(...) only puts the record on an in-memory queue, a background thread
+## takes the records off the queue in batches, formats them and writes each batch with a
+## single write + flush. So no prediction or training loop ever waits for the disk.
+##
+## Every process of a deployment appends to the same file (logs/app.log by default) instead
+## of creating a new timestamped file per run. The file is rotated when it grows too big or
+## gets too old, keeping backup_count old files next to it (app.log.20250906-134522-123456.<pid>, ...).
 
-# Create a log file name using the current date and time
-# Example output: "06-09-2025_13_45_22.log"
-# This ensures that each time the program runs, it creates a uniquely named log file
-LOG_FILE = f"{datetime.now().strftime('%m-%d-%Y_%H_%M_%S')}.log"
 
-# Get the full path where logs should be stored.
-# os.getcwd() gets the current working directory of your project.
-# This line will create a path like: "current_folder/logs/06-09-2025_13_45_22.log"
-logs_path = os.path.join(os.getcwd(), "logs", LOG_FILE) 
+# Settings for the logger. They can be changed with environment variables,
+# e.g. LOG_DIR=/var/log/student LOG_FORMAT=text python application.py
+@dataclass
+class LoggingConfig:
+    log_dir: str = field(default_factory=lambda: os.environ.get("LOG_DIR", os.path.join(os.getcwd(), "logs")))
+    file_name: str = field(default_factory=lambda: os.environ.get("LOG_FILE", "app.log"))
+    # "json" writes one JSON object per line, "text" the classic "[ time ] line name - LEVEL - message"
+    log_format: str = field(default_factory=lambda: os.environ.get("LOG_FORMAT", "json"))
+    level: str = field(default_factory=lambda: os.environ.get("LOG_LEVEL", "INFO"))
+    max_bytes: int = 50 * 1024 * 1024       # Rotate when the file is bigger than this
+    rotate_interval: float = 24 * 60 * 60   # Or older than this many seconds
+    backup_count: int = 10                  # Rotated files kept
+    batch_size: int = 500                   # Records written per write call at most
+    flush_interval: float = 1.0             # Seconds a record may wait before it is written
+    # Records waiting to be written. When the writer cannot keep up new records are dropped
+    # (and counted) instead of blocking the code that logs
+    queue_size: int = 100_000
 
-# Create the logs folder if it doesn’t already exist.
-# os.makedirs creates all folders in the path if needed.
-# exist_ok=True avoids error if the folder already exists.
-os.makedirs(logs_path, exist_ok=True)  
 
-# Define the full path for the log file
-LOG_FILE_PATH = os.path.join(logs_path, LOG_FILE)
+TEXT_FORMAT = "[ %(asctime)s ] %(lineno)d %(name)s - %(levelname)s - %(message)s"
+# Explanation of format parts:
+# %(asctime)s  → shows the time the log was created
+# %(lineno)d   → line number in the code where the log was generated
+# %(name)s     → name of the logger (default will be "root" unless customized)
+# %(levelname)s → the log level (INFO, ERROR, etc.)
+# %(message)s  → the actual log message you write
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one line of JSON, easy to search and to load into log tools."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue, writer):
+        super().__init__(log_queue)
+        self.writer = writer
+
+    def prepare(self, record):
+        ## Merge the message arguments and format the traceback now, in the logging thread,
+        ## the objects they refer to may change or disappear before the writer gets to them
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self.writer.ensure_running()
+        ## The writer's queue, a forked child gets a new one (see _BatchWriter.after_fork_in_child)
+        log_queue = self.writer.queue
+        try:
+            log_queue.put_nowait(record)
+        except queue.Full:
+            ## Many threads log at once, the count is changed under the queue's own lock
+            with log_queue.mutex:
+                self.writer.dropped += 1
+
+
+class _BatchWriter:
+    """Background thread that writes queued records to the shared, rotated log file."""
+
+    def __init__(self, config, log_queue, formatter):
+        self.logging_config = config
+        self.queue = log_queue
+        self.formatter = formatter
+        self.file_path = os.path.join(config.log_dir, config.file_name)
+        ## Sidecar with the time the current log file was started (its name does not start with
+        ## file_name + "." so it is never taken for a rotated file)
+        self.opened_at_path = os.path.join(config.log_dir, f".{config.file_name}.opened")
+        self.dropped = 0
+        self._file = None
+        self._opened_at = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stop = object()  # Sentinel put on the queue by stop()
+
+    def ensure_running(self):
+        ## Threads do not survive a fork (e.g. gunicorn workers), so every process starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._file = None
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def after_fork_in_child(self):
+        """Gives a forked child a writer of its own, registered with os.register_at_fork."""
+        ## The records queued before the fork are written by the parent, a child keeping the
+        ## inherited queue would write them again. The parent's writer thread may also have
+        ## held the queue's lock (or the start lock) at the moment of the fork
+        self.queue = queue.Queue(maxsize=self.logging_config.queue_size)
+        self.dropped = 0
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        if self._file is not None:
+            try:
+                os.close(self._file)
+            except OSError:
+                pass
+            self._file = None
+
+    def stop(self):
+        """Writes everything still queued, called at exit."""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            self.queue.put(self._stop)
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        config = self.logging_config
+        while True:
+            ## Wait for the first record, then take whatever else is already waiting
+            try:
+                batch = [self.queue.get(timeout=config.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < config.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = any(record is self._stop for record in batch)
+            records = [record for record in batch if record is not self._stop]
+            try:
+                self._write(records)
+            except Exception as e:
+                ## Logging must never crash the program, report the problem on stderr only
+                sys.stderr.write(f"Writing {len(records)} log records failed: {e}\n")
+            if stopping:
+                return
+
+    def _write(self, records):
+        if not records and not self.dropped:
+            return
+        lines = [self.formatter.format(record) for record in records]
+        with self.queue.mutex:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            lines.append(self.formatter.format(logging.makeLogRecord({
+                "name": "src.logger", "levelno": logging.WARNING, "levelname": "WARNING",
+                "msg": f"{dropped} log records dropped, the log queue was full",
+            })))
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+
+        self._open_or_rotate(len(data))
+        ## O_APPEND: every batch is one write at the end of the file, also with other processes writing
+        os.write(self._file, data)
+
+    def _open_or_rotate(self, n_bytes):
+        config = self.logging_config
+        if self._file is not None:
+            try:
+                ## Another process may have rotated the file, then we follow it to the new one
+                rotated_elsewhere = os.stat(self.file_path).st_ino != os.fstat(self._file).st_ino
+            except FileNotFoundError:
+                rotated_elsewhere = True
+            if rotated_elsewhere:
+                os.close(self._file)
+                self._file = None
+        if self._file is not None:
+            size = os.fstat(self._file).st_size
+            too_big = size > 0 and size + n_bytes > config.max_bytes
+            too_old = time.time() - self._opened_at > config.rotate_interval
+            if too_big or too_old:
+                self._rotate()
+        if self._file is None:
+            # Create the logs folder if it doesn’t already exist (only when something is logged)
+            os.makedirs(config.log_dir, exist_ok=True)
+            self._file = os.open(self.file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self._opened_at = self._shared_opened_at(os.fstat(self._file).st_ino)
+
+    def _shared_opened_at(self, inode):
+        ## A shared file's age is counted from when the first process started it, kept in the
+        ## sidecar (the file's ctime changes with every write). The inode tells whether the
+        ## sidecar belongs to this file or to one that was rotated away since
+        try:
+            with open(self.opened_at_path) as file_obj:
+                sidecar = json.load(file_obj)
+            if sidecar["inode"] == inode:
+                return sidecar["opened_at"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        opened_at = time.time()
+        tmp_path = f"{self.opened_at_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file_obj:
+            json.dump({"inode": inode, "opened_at": opened_at}, file_obj)
+        os.replace(tmp_path, self.opened_at_path)
+        return opened_at
+
+    def _rotate(self):
+        config = self.logging_config
+        os.close(self._file)
+        self._file = None
+        rotated_path = f"{self.file_path}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.{os.getpid()}"
+        try:
+            os.rename(self.file_path, rotated_path)
+        except FileNotFoundError:
+            return  # Another process rotated it first
+        backups = sorted(
+            name for name in os.listdir(config.log_dir)
+            if name.startswith(config.file_name + ".")
+        )
+        for name in backups[:max(0, len(backups) - config.backup_count)]:
+            try:
+                os.remove(os.path.join(config.log_dir, name))
+            except FileNotFoundError:
+                pass
+
+
+LOGGING_CONFIG = LoggingConfig()
+
+# Full path of the shared log file, e.g. "current_folder/logs/app.log"
+LOG_FILE_PATH = os.path.join(LOGGING_CONFIG.log_dir, LOGGING_CONFIG.file_name)
+
+_formatter = JsonFormatter() if LOGGING_CONFIG.log_format == "json" else logging.Formatter(TEXT_FORMAT)
+_log_queue = queue.Queue(maxsize=LOGGING_CONFIG.queue_size)
+_writer = _BatchWriter(LOGGING_CONFIG, _log_queue, _formatter)
+atexit.register(_writer.stop)
+if hasattr(os, "register_at_fork"):  # Not on Windows, which never forks
+    os.register_at_fork(after_in_child=_writer.after_fork_in_child)
 
 # Setting up the logger with basic configuration
 logging.basicConfig(
-    filename=LOG_FILE_PATH,  # Save logs to the generated file
-    level=logging.INFO,      # Minimum level of logs to record: DEBUG < INFO < WARNING < ERROR < CRITICAL
-                             # INFO means it will log info, warning, error, critical, but not debug by default.
-    
-    # Format of each log message
-    format="[ %(asctime)s ] %(lineno)d %(name)s - %(levelname)s - %(message)s"
-    # Explanation of format parts:
-    # %(asctime)s  → shows the time the log was created
-    # %(lineno)d   → line number in the code where the log was generated
-    # %(name)s     → name of the logger (default will be "root" unless customized)
-    # %(levelname)s → the log level (INFO, ERROR, etc.)
-    # %(message)s  → the actual log message you write
+    handlers=[_NonBlockingQueueHandler(_log_queue, _writer)],  # Records go to the background writer
+    level=getattr(logging, LOGGING_CONFIG.level.upper(), logging.INFO),
+    # Minimum level of logs to record: DEBUG < INFO < WARNING < ERROR < CRITICAL
+    # INFO means it will log info, warning, error, critical, but not debug by default.
 )
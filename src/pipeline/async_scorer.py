@@ -0,0 +1,110 @@
+## Scoring for the async (ASGI) entry point, asgi_app.py.
+## The event loop only parses requests and writes responses, the transform + predict work
+## runs on a bounded thread or process pool. The number of requests that are being scored or
+## waiting for a worker is limited (max_pending): once the limit is reached new requests are
+## rejected immediately with ScorerBusyError (HTTP 503) instead of queueing up without end,
+## so a traffic spike shows up as fast rejections rather than ever-growing latency.
+
+import asyncio
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from src.exception import CustomException
+from src.logger import logging
+from src.pipeline.metrics import get_metrics
+from src.pipeline.predict_pipeline import PredictPipeline
+
+
+@dataclass
+class AsyncScorerConfig:
+    """Configuration class for the async scorer."""
+    # "thread" shares one model between the pool threads (NumPy releases the GIL for the
+    # heavy parts), "process" gives every worker process its own interpreter
+    backend: str = field(default_factory=lambda: os.environ.get("PREDICT_POOL_BACKEND", "thread"))
+    max_workers: int = field(default_factory=lambda: int(os.environ.get("PREDICT_POOL_WORKERS", os.cpu_count() or 1)))
+    # Requests being scored or waiting for a worker, more are rejected with ScorerBusyError
+    max_pending: int = field(default_factory=lambda: int(os.environ.get("PREDICT_MAX_PENDING", 64)))
+
+
+class ScorerBusyError(Exception):
+    """Raised when max_pending requests are already waiting for the pool."""
+
+
+## Process backend: every worker process builds its own pipeline once, in the initializer
+_worker_pipeline = None
+
+
+def _init_worker():
+    global _worker_pipeline
+    from src.pipeline.prediction_cache import PredictionCache, PredictionCacheConfig
+
+    cache_config = PredictionCacheConfig()
+    _worker_pipeline = PredictPipeline(cache=PredictionCache(cache_config) if cache_config.enabled else None)
+
+
+def _worker_predict_row(row):
+    return _worker_pipeline.predict_row(row)
+
+
+def _worker_predict_batch(records):
+    return _worker_pipeline.predict_batch(records)
+
+
+class AsyncScorer:
+    """Runs PredictPipeline calls on a bounded pool and awaits them without blocking the event loop."""
+
+    def __init__(self, pipeline=None, config=None, metrics=None):
+        self.scorer_config = config or AsyncScorerConfig()
+        self.metrics = metrics or get_metrics()
+        # Used by the thread backend, process workers build their own
+        self.pipeline = pipeline
+        self._executor = None
+        # Only changed from the event loop thread, so no lock is needed
+        self._pending = 0
+
+    def start(self):
+        """Starts the pool, call it once the model is loaded (forked workers inherit it)."""
+        try:
+            config = self.scorer_config
+            if config.backend == "process":
+                self._executor = ProcessPoolExecutor(max_workers=config.max_workers, initializer=_init_worker)
+            elif config.backend == "thread":
+                self.pipeline = self.pipeline or PredictPipeline(metrics=self.metrics)
+                self._executor = ThreadPoolExecutor(max_workers=config.max_workers, thread_name_prefix="scorer")
+            else:
+                raise ValueError(f"Unknown pool backend '{config.backend}'")
+            logging.info(f"Async scorer started: {config.max_workers} {config.backend} workers, "
+                         f"at most {config.max_pending} pending requests")
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def pending(self):
+        return self._pending
+
+    async def _run(self, thread_func, process_func, argument):
+        if self._pending >= self.scorer_config.max_pending:
+            raise ScorerBusyError(f"{self._pending} requests are already waiting to be scored")
+        self._pending += 1
+        self.metrics.set_pending(self._pending)
+        try:
+            func = process_func if self.scorer_config.backend == "process" else thread_func
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, argument)
+        finally:
+            self._pending -= 1
+            self.metrics.set_pending(self._pending)
+
+    async def predict_row(self, row):
+        """Prediction for one row in FEATURE_COLUMNS order."""
+        return await self._run(self.pipeline.predict_row if self.pipeline else None, _worker_predict_row, row)
+
+    async def predict_batch(self, records):
+        """(predictions, errors) for a list of record dicts, like PredictPipeline.predict_batch."""
+        return await self._run(self.pipeline.predict_batch if self.pipeline else None, _worker_predict_batch, records)
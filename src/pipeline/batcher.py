@@ -0,0 +1,149 @@
+## Opt-in request coalescer for single-row predictions.
+## Concurrent requests that arrive within a short window are scored together with one
+## transform + predict call, which removes most of the fixed per-call overhead.
+
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+from src.exception import CustomException
+from src.logger import logging
+
+
+@dataclass
+class PredictionBatcherConfig:
+    """Configuration class for the prediction batcher."""
+    max_batch_size: int = 32     # Score as soon as this many rows are waiting
+    max_wait_ms: float = 5.0     # Or once the oldest waiting row has waited this long
+    log_every_batches: int = 1000  # Write a metrics summary to the log every N batches
+
+
+class BatcherMetrics:
+    """Counters for batch sizes and the extra latency added by the batching window."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.batch_size_counts = {}   # batch size -> number of batches of that size
+        self.total_wait_seconds = 0.0  # Summed over rows: enqueue -> start of scoring
+        self.max_wait_seconds = 0.0
+        self.total_score_seconds = 0.0  # Summed over batches: time spent scoring
+
+    def record(self, batch_size, wait_seconds, score_seconds):
+        with self._lock:
+            self.batches += 1
+            self.rows += batch_size
+            self.batch_size_counts[batch_size] = self.batch_size_counts.get(batch_size, 0) + 1
+            self.total_wait_seconds += sum(wait_seconds)
+            self.max_wait_seconds = max(self.max_wait_seconds, max(wait_seconds))
+            self.total_score_seconds += score_seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "rows": self.rows,
+                "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+                "batch_size_counts": dict(sorted(self.batch_size_counts.items())),
+                "mean_wait_ms": 1000 * self.total_wait_seconds / self.rows if self.rows else 0.0,
+                "max_wait_ms": 1000 * self.max_wait_seconds,
+                "mean_score_ms": 1000 * self.total_score_seconds / self.batches if self.batches else 0.0,
+            }
+
+
+class PredictionBatcher:
+    """Collects single rows from many threads and scores them in batches.
+
+    predict_fn receives a list of rows and must return one prediction per row, in order.
+    Each caller gets a Future that resolves to the prediction for its own row.
+    """
+
+    def __init__(self, predict_fn, config=None):
+        self.batcher_config = config or PredictionBatcherConfig()
+        self.predict_fn = predict_fn
+        self.metrics = BatcherMetrics()
+        self._queue = queue.Queue()
+        self._start_lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+
+    def _ensure_worker(self):
+        ## Threads do not survive a fork (e.g. gunicorn --preload), so the worker is
+        ## started lazily by the process that actually submits requests
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or self._worker_pid != os.getpid() or not self._worker.is_alive():
+                ## A forked child gets a queue of its own: the rows inherited from the parent are
+                ## scored by the parent, and the inherited lock may be held by the parent's worker.
+                ## A worker that died in this process leaves its queue to the new one, which
+                ## scores the rows still waiting in it
+                if self._worker_pid != os.getpid():
+                    self._queue = queue.Queue()
+                self._worker = threading.Thread(target=self._run, name="prediction-batcher", daemon=True)
+                self._worker_pid = os.getpid()
+                self._worker.start()
+
+    def submit(self, row):
+        """Queues one row and returns a Future for its prediction."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((row, future, time.perf_counter()))
+        return future
+
+    def predict_one(self, row, timeout=None):
+        """Queues one row and waits for its prediction."""
+        try:
+            return self.submit(row).result(timeout=timeout)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _collect_batch(self):
+        ## Block until the first row arrives, then keep collecting until the batch
+        ## is full or the first row has waited max_wait_ms
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.batcher_config.max_wait_ms / 1000
+        while len(batch) < self.batcher_config.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            start = time.perf_counter()
+            rows = [row for row, _, _ in batch]
+            try:
+                predictions = list(self.predict_fn(rows))
+                ## zip would stop at the shorter list and leave the other callers waiting forever
+                if len(predictions) != len(batch):
+                    raise ValueError(f"predict_fn returned {len(predictions)} predictions for {len(batch)} rows")
+                for (_, future, _), prediction in zip(batch, predictions):
+                    future.set_result(prediction)
+            except BaseException as e:
+                ## Every caller in the failed batch gets the error instead of hanging
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                ## Anything else (e.g. SystemExit) ends the worker, the next submit starts a new one
+                if not isinstance(e, Exception):
+                    raise
+
+            self.metrics.record(
+                batch_size=len(batch),
+                wait_seconds=[start - enqueued_at for _, _, enqueued_at in batch],
+                score_seconds=time.perf_counter() - start,
+            )
+            log_every = self.batcher_config.log_every_batches
+            if log_every and self.metrics.batches % log_every == 0:
+                logging.info(f"Prediction batcher metrics: {self.metrics.snapshot()}")
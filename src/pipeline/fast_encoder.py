@@ -0,0 +1,187 @@
+## Fast-path replacement for preprocessor.transform during online scoring.
+## The fitted ColumnTransformer is compiled once into plain lookup tables (impute values,
+## category -> column maps, scale vectors) and records are written straight into a NumPy
+## matrix, skipping DataFrame construction and sklearn's input validation.
+## Only NumPy is imported here, so the encoder can be used without sklearn loaded.
+
+import numpy as np
+
+from src.pipeline.schema import CategoricalColumn
+
+
+def _is_missing(value):
+    ## Like SimpleImputer on object columns only NaN counts as missing,
+    ## None is treated as an unknown category
+    return isinstance(value, float) and value != value
+
+
+class FastEncoder:
+    """Compiled form of the fitted preprocessor from DataTransformation.
+
+    Produces the same numbers as preprocessor.transform (dense output) for the
+    layout built in get_data_transformer_object: median imputer + StandardScaler on
+    the numerical columns, then most-frequent imputer + OneHotEncoder(handle_unknown='ignore')
+    + StandardScaler(with_mean=False) on the categorical columns.
+    """
+
+    def __init__(self, numerical_columns, numerical_fill, numerical_mean, numerical_scale,
+                 categorical_columns, categorical_fill, categories, categorical_scale, input_columns=None):
+        self.numerical_columns = list(numerical_columns)
+        self.numerical_fill = np.asarray(numerical_fill, dtype=np.float64)
+        self.numerical_mean = np.asarray(numerical_mean, dtype=np.float64)
+        self.numerical_scale = np.asarray(numerical_scale, dtype=np.float64)
+
+        self.categorical_columns = list(categorical_columns)
+        self.categorical_fill = list(categorical_fill)
+        self.categories = [list(values) for values in categories]
+        self.categorical_scale = np.asarray(categorical_scale, dtype=np.float64)
+        self.input_columns = list(input_columns or (self.categorical_columns + self.numerical_columns))
+
+        ## Precompute everything the transform needs per value
+        n_numerical = len(self.numerical_columns)
+        self.n_features = n_numerical + len(self.categorical_scale)
+        # sklearn scales sparse one-hot output by multiplying with 1 / scale_
+        self.categorical_inverse_scale = 1 / self.categorical_scale
+        self.category_index = []  # One dict per categorical column: value -> output column
+        offset = n_numerical
+        for values in self.categories:
+            self.category_index.append({value: offset + i for i, value in enumerate(values)})
+            offset += len(values)
+
+    @classmethod
+    def from_preprocessor(cls, preprocessor):
+        """Compiles a fitted ColumnTransformer, raises ValueError if its layout is not supported."""
+        numerical = None
+        categorical = None
+        for name, transformer, columns in preprocessor.transformers_:
+            if name == "remainder":
+                if transformer != "drop" and len(columns):
+                    raise ValueError("Remainder columns are not supported")
+                continue
+            steps = [type(step).__name__ for _, step in transformer.steps]
+            if steps == ["SimpleImputer", "StandardScaler"]:
+                numerical = (list(columns), transformer)
+            elif steps == ["SimpleImputer", "OneHotEncoder", "StandardScaler"]:
+                categorical = (list(columns), transformer)
+            else:
+                raise ValueError(f"Unsupported transformer '{name}' with steps {steps}")
+
+        if numerical is None or categorical is None:
+            raise ValueError("Expected one numerical and one categorical transformer")
+        if preprocessor.output_indices_["num"].start != 0:
+            raise ValueError("Numerical features must come first in the output")
+
+        numerical_columns, num_pipeline = numerical
+        imputer, scaler = num_pipeline.steps[0][1], num_pipeline.steps[1][1]
+        mean = scaler.mean_ if scaler.with_mean else np.zeros(len(numerical_columns))
+        scale = scaler.scale_ if scaler.with_std else np.ones(len(numerical_columns))
+
+        categorical_columns, cat_pipeline = categorical
+        cat_imputer, onehot, cat_scaler = (step for _, step in cat_pipeline.steps)
+        if onehot.drop_idx_ is not None or onehot.handle_unknown != "ignore" or cat_scaler.with_mean:
+            raise ValueError("Only OneHotEncoder(handle_unknown='ignore', drop=None) is supported")
+        if getattr(onehot, "_infrequent_enabled", False):
+            raise ValueError("Infrequent category grouping is not supported")
+        n_onehot = sum(len(values) for values in onehot.categories_)
+        cat_scale = cat_scaler.scale_ if cat_scaler.with_std else np.ones(n_onehot)
+
+        return cls(
+            numerical_columns=numerical_columns,
+            numerical_fill=imputer.statistics_,
+            numerical_mean=mean,
+            numerical_scale=scale,
+            categorical_columns=categorical_columns,
+            categorical_fill=list(cat_imputer.statistics_),
+            categories=[list(values) for values in onehot.categories_],
+            categorical_scale=cat_scale,
+            input_columns=list(getattr(preprocessor, "feature_names_in_", [])) or None,
+        )
+
+    def transform_columns(self, columns, out=None):
+        """Encodes a mapping column name -> sequence of values into an (n, n_features) matrix."""
+        n_rows = len(columns[self.input_columns[0]])
+        if out is None:
+            out = np.zeros((n_rows, self.n_features), dtype=np.float64)
+        else:
+            out[:n_rows] = 0.0
+
+        for k, column in enumerate(self.numerical_columns):
+            values = np.asarray(columns[column], dtype=np.float64)  # None becomes NaN
+            values = np.where(np.isnan(values), self.numerical_fill[k], values)
+            ## Same operations in the same order as StandardScaler, so the result is bit-identical
+            values -= self.numerical_mean[k]
+            values /= self.numerical_scale[k]
+            out[:n_rows, k] = values
+
+        rows = np.arange(n_rows)
+        for k, column in enumerate(self.categorical_columns):
+            index = self.category_index[k]
+            fill_index = index.get(self.categorical_fill[k], -1)
+            ## Unknown categories get no column at all, like handle_unknown='ignore'
+            values = columns[column]
+            if isinstance(values, CategoricalColumn):
+                positions = values.map(lambda value: fill_index if _is_missing(value) else index.get(value, -1),
+                                       dtype=np.intp)
+            else:
+                positions = np.fromiter(
+                    (fill_index if _is_missing(value) else index.get(value, -1) for value in values),
+                    dtype=np.intp, count=n_rows,
+                )
+            known = positions >= 0
+            out[rows[known], positions[known]] = self.categorical_inverse_scale[positions[known] - len(self.numerical_columns)]
+
+        return out[:n_rows]
+
+    def transform_records(self, records, columns=None, out=None):
+        """Encodes dicts, or tuples/lists whose values are in `columns` order (default input_columns)."""
+        if not len(records):
+            return np.zeros((0, self.n_features), dtype=np.float64)
+        if isinstance(records[0], dict):
+            data = {column: [record.get(column) for record in records] for column in self.input_columns}
+        else:
+            data = dict(zip(columns or self.input_columns, zip(*records)))
+        return self.transform_columns(data, out=out)
+
+    def transform_one(self, record, columns=None, out=None):
+        """Encodes one record into a (1, n_features) matrix."""
+        return self.transform_records([record], columns=columns, out=out)
+
+    def transform(self, frame):
+        """Drop-in for preprocessor.transform on a DataFrame."""
+        return self.transform_columns({column: frame[column].to_numpy() for column in self.input_columns})
+
+    def to_arrays(self, prefix="encoder_"):
+        """Flattens the encoder into plain NumPy arrays (no pickles), e.g. for np.savez."""
+        return {
+            f"{prefix}numerical_columns": np.array(self.numerical_columns, dtype=str),
+            f"{prefix}numerical_fill": self.numerical_fill,
+            f"{prefix}numerical_mean": self.numerical_mean,
+            f"{prefix}numerical_scale": self.numerical_scale,
+            f"{prefix}categorical_columns": np.array(self.categorical_columns, dtype=str),
+            f"{prefix}categorical_fill": np.array(self.categorical_fill, dtype=str),
+            f"{prefix}categories": np.array([value for values in self.categories for value in values], dtype=str),
+            f"{prefix}category_counts": np.array([len(values) for values in self.categories], dtype=np.int64),
+            f"{prefix}categorical_scale": self.categorical_scale,
+            f"{prefix}input_columns": np.array(self.input_columns, dtype=str),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix="encoder_"):
+        """Rebuilds an encoder from the output of to_arrays."""
+        flat_categories = arrays[f"{prefix}categories"].tolist()
+        categories = []
+        offset = 0
+        for count in arrays[f"{prefix}category_counts"].tolist():
+            categories.append(flat_categories[offset:offset + count])
+            offset += count
+        return cls(
+            numerical_columns=arrays[f"{prefix}numerical_columns"].tolist(),
+            numerical_fill=arrays[f"{prefix}numerical_fill"],
+            numerical_mean=arrays[f"{prefix}numerical_mean"],
+            numerical_scale=arrays[f"{prefix}numerical_scale"],
+            categorical_columns=arrays[f"{prefix}categorical_columns"].tolist(),
+            categorical_fill=arrays[f"{prefix}categorical_fill"].tolist(),
+            categories=categories,
+            categorical_scale=arrays[f"{prefix}categorical_scale"],
+            input_columns=arrays[f"{prefix}input_columns"].tolist(),
+        )
@@ -0,0 +1,151 @@
+## Lightweight inference artifact for the trained model.
+## ModelTrainer exports the selected model as plain arrays (linear coefficients or flattened
+## decision trees) together with the compiled preprocessor, all in one .npz file.
+## Scoring it needs only NumPy: no sklearn, xgboost, catboost or dill import and no unpickling,
+## so a web worker starts quickly and the file can be loaded without trusting pickled code.
+
+import json
+import struct
+import zipfile
+
+import numpy as np
+
+from src.pipeline.fast_encoder import FastEncoder
+
+LITE_MODEL_FORMAT_VERSION = 1
+## Arrays at least this large are memory-mapped by load(mmap=True), smaller ones are read
+MMAP_MIN_BYTES = 64 * 1024
+
+
+def _map_npz(file_path, min_bytes=MMAP_MIN_BYTES):
+    """
+    Reads the arrays of an uncompressed .npz (what np.savez writes), memory-mapping the large ones.
+    Every member is a plain .npy file stored as is inside the zip, so it can be mapped straight
+    from its offset: worker processes scoring with the same file then share those pages.
+    """
+    arrays = {}
+    with zipfile.ZipFile(file_path) as archive, open(file_path, "rb") as file_obj:
+        for info in archive.infolist():
+            name = info.filename[:-len(".npy")]
+            if info.compress_type != zipfile.ZIP_STORED or info.file_size < min_bytes:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+            ## The data starts after the local file header, whose name and extra field
+            ## lengths can differ from the central directory entry
+            file_obj.seek(info.header_offset)
+            local_header = file_obj.read(30)
+            name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+            file_obj.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(file_obj)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(file_obj)
+            if dtype.hasobject:
+                raise ValueError(f"Array '{name}' holds Python objects")
+            arrays[name] = np.memmap(file_path, dtype=dtype, mode="r", offset=file_obj.tell(), shape=shape,
+                                     order="F" if fortran_order else "C")
+    return arrays
+
+
+class LiteModel:
+    """Pure-NumPy scorer exported from a fitted regressor, see src/components/model_export.py.
+
+    kind "linear":        X @ coef + intercept
+    kind "tree_ensemble": base + scale * combine(leaf value of every tree), where the trees
+                          are stored as one set of node arrays (feature, threshold, left, right,
+                          value) and roots holds the index of each tree's first node.
+                          Leaves have left == -1. split "le" sends x <= threshold to the left
+                          (sklearn), "lt" sends x < threshold to the left (xgboost).
+    kind "oblivious":     catboost's symmetric trees, every level of a tree uses the same split,
+                          so the leaf index is built from one bit per level.
+    """
+
+    def __init__(self, kind, arrays, meta=None, encoder=None):
+        self.kind = kind
+        self.arrays = {name: np.asarray(array) for name, array in arrays.items()}
+        self.meta = dict(meta or {})
+        # Compiled preprocessor the model was trained with, None when it was not exported
+        self.encoder = encoder
+
+    @property
+    def model_name(self):
+        return self.meta.get("model_name")
+
+    def predict(self, X):
+        """Predicts for a dense 2-D feature matrix."""
+        if hasattr(X, "toarray"):
+            X = X.toarray()
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2:
+            raise ValueError(f"Expected a 2-D feature matrix, got shape {X.shape}")
+        if self.kind == "linear":
+            return X @ self.arrays["coef"] + self.meta["intercept"]
+        if self.kind == "tree_ensemble":
+            return self._predict_trees(X)
+        if self.kind == "oblivious":
+            return self._predict_oblivious(X)
+        raise ValueError(f"Unknown lite model kind '{self.kind}'")
+
+    def _predict_trees(self, X):
+        arrays = self.arrays
+        feature, threshold = arrays["feature"], arrays["threshold"]
+        left, right, value = arrays["left"], arrays["right"], arrays["value"]
+        ## Tree libraries compare single precision features
+        if self.meta.get("float32_features"):
+            X = X.astype(np.float32).astype(np.float64)
+
+        ## Walk every (row, tree) pair down one level per step, all pairs at once
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(arrays["roots"], (len(X), len(arrays["roots"]))).copy()
+        for _ in range(self.meta["max_depth"]):
+            x = X[rows, feature[node]]
+            if self.meta["split"] == "lt":
+                go_left = x < threshold[node]
+            else:
+                go_left = x <= threshold[node]
+            child = np.where(go_left, left[node], right[node])
+            node = np.where(child < 0, node, child)  # Leaves stay where they are
+        leaves = value[node]
+
+        combined = leaves.mean(axis=1) if self.meta["combine"] == "mean" else leaves.sum(axis=1)
+        return self.meta["base"] + self.meta["scale"] * combined
+
+    def _predict_oblivious(self, X):
+        arrays = self.arrays
+        split_feature, border = arrays["split_feature"], arrays["border"]  # (n_trees, depth)
+        if self.meta.get("float32_features"):
+            X = X.astype(np.float32).astype(np.float64)
+        ## Bit d of the leaf index is set when the d-th split of the tree is true (x > border)
+        bits = X[:, split_feature] > border  # (n_rows, n_trees, depth)
+        leaf_index = (bits.astype(np.int64) << np.arange(split_feature.shape[1])).sum(axis=2)
+        leaves = np.take_along_axis(arrays["leaf_value"][None, :, :], leaf_index[:, :, None], axis=2)[:, :, 0]
+        return self.meta["base"] + self.meta["scale"] * leaves.sum(axis=1)
+
+    def save(self, file_path):
+        """Writes the model (and encoder) to one .npz file, plain arrays only."""
+        meta = dict(self.meta, kind=self.kind, format_version=LITE_MODEL_FORMAT_VERSION,
+                    has_encoder=self.encoder is not None)
+        payload = {f"model_{name}": array for name, array in self.arrays.items()}
+        if self.encoder is not None:
+            payload.update(self.encoder.to_arrays())
+        payload["meta"] = np.array(json.dumps(meta))
+        with open(file_path, "wb") as file_obj:
+            np.savez(file_obj, **payload)
+
+    @classmethod
+    def load(cls, file_path, mmap=True):
+        """Loads a file written by save, never unpickles anything.
+        With mmap the large arrays (tree nodes) are read-only views of the file shared between processes."""
+        if mmap:
+            data = _map_npz(file_path)
+        else:
+            with np.load(file_path, allow_pickle=False) as npz:
+                data = {name: npz[name] for name in npz.files}
+        meta = json.loads(str(data["meta"]))
+        if meta.get("format_version") != LITE_MODEL_FORMAT_VERSION:
+            raise ValueError(f"Unsupported lite model format {meta.get('format_version')}")
+        arrays = {name[len("model_"):]: array for name, array in data.items() if name.startswith("model_")}
+        encoder = FastEncoder.from_arrays(data) if meta.pop("has_encoder") else None
+        kind = meta.pop("kind")
+        meta.pop("format_version")
+        return cls(kind, arrays, meta, encoder)
@@ -0,0 +1,271 @@
+## In-process metrics for the prediction service, exposed in the Prometheus text format
+## at /metrics. Histograms time every phase of a prediction (parse, CustomData row build,
+## table lookup, transform, predict), counters track model loads, errors, requests and
+## prediction cache / table lookups, and a histogram records batch sizes. Only the standard library is used.
+## Metrics are on by default, PREDICT_METRICS=0 turns them off: every call then returns
+## immediately (timers are one shared no-op object), so the hot path pays almost nothing.
+## Each process keeps its own numbers, with several gunicorn workers every worker is a
+## separate target (or scrape them through a multiprocess-aware exporter).
+
+import bisect
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+
+## Latency buckets in seconds, fine-grained below 10ms where single-row scoring lives
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 10000)
+
+
+@dataclass
+class MetricsConfig:
+    """Configuration class for the prediction metrics."""
+    enabled: bool = field(default_factory=lambda: os.environ.get("PREDICT_METRICS", "1") != "0")
+    # Prefix of every metric name
+    namespace: str = "student_performance"
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def get(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, _format_labels(self.labelnames, labels), value) for labels, value in items]
+
+
+class Gauge(Counter):
+    """Value that can go up and down (or be set), e.g. the loaded model version time."""
+
+    kind = "gauge"
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *labelvalues):
+        """Context manager that observes the seconds spent in its block."""
+        return _Timer(self, labelvalues)
+
+    def count(self, *labelvalues):
+        series = self._series.get(labelvalues)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        samples = []
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                label_text = _format_labels(self.labelnames, labels, [("le", _format_value(float(bound)))])
+                samples.append((f"{self.name}_bucket", label_text, cumulative))
+            label_text = _format_labels(self.labelnames, labels)
+            samples.append((f"{self.name}_sum", label_text, series[-1]))
+            samples.append((f"{self.name}_count", label_text, cumulative))
+        return samples
+
+
+class _Timer:
+    __slots__ = ("histogram", "labelvalues", "start")
+
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class PredictionMetrics:
+    """The metrics of the prediction service, see the module comment."""
+
+    def __init__(self, config=None):
+        self.metrics_config = config or MetricsConfig()
+        self.enabled = self.metrics_config.enabled
+        prefix = self.metrics_config.namespace
+        self.phase_seconds = Histogram(
+            f"{prefix}_prediction_phase_seconds",
+            "Time spent in each phase of a prediction request",
+            LATENCY_BUCKETS, labelnames=("phase",),
+        )
+        self.request_seconds = Histogram(
+            f"{prefix}_request_seconds", "End to end time of prediction requests",
+            LATENCY_BUCKETS, labelnames=("endpoint",),
+        )
+        self.batch_size = Histogram(
+            f"{prefix}_prediction_batch_size", "Rows scored per transform + predict call",
+            BATCH_SIZE_BUCKETS, labelnames=("source",),
+        )
+        self.requests = Counter(
+            f"{prefix}_requests_total", "Prediction requests handled", labelnames=("endpoint",),
+        )
+        self.errors = Counter(
+            f"{prefix}_errors_total", "Failed requests and rejected records", labelnames=("endpoint", "kind"),
+        )
+        self.model_loads = Counter(
+            f"{prefix}_model_loads_total", "Model artifact load attempts by outcome", labelnames=("outcome",),
+        )
+        self.model_load_seconds = Histogram(
+            f"{prefix}_model_load_seconds", "Time to load the model artifacts", LATENCY_BUCKETS,
+        )
+        self.model_loaded_at = Gauge(
+            f"{prefix}_model_loaded_timestamp_seconds", "Unix time the current model was loaded",
+        )
+        self.cache_lookups = Counter(
+            f"{prefix}_prediction_cache_lookups_total",
+            "Prediction cache lookups by result (hit, shared_hit, miss)", labelnames=("result",),
+        )
+        self.table_lookups = Counter(
+            f"{prefix}_prediction_table_lookups_total",
+            "Records looked up in the precomputed prediction table by result (hit, miss)", labelnames=("result",),
+        )
+        self.pending_requests = Gauge(
+            f"{prefix}_pending_requests", "Requests being scored or waiting for a scoring worker (async server)",
+        )
+        self._metrics = [
+            self.phase_seconds, self.request_seconds, self.batch_size, self.requests,
+            self.errors, self.model_loads, self.model_load_seconds, self.model_loaded_at,
+            self.cache_lookups, self.table_lookups, self.pending_requests,
+        ]
+
+    ## Thin wrappers that do nothing when metrics are disabled
+
+    def time_phase(self, phase):
+        if not self.enabled:
+            return _NULL_TIMER
+        return self.phase_seconds.time(phase)
+
+    def time_request(self, endpoint):
+        if not self.enabled:
+            return _NULL_TIMER
+        self.requests.inc(endpoint)
+        return self.request_seconds.time(endpoint)
+
+    def observe_batch(self, size, source):
+        if self.enabled:
+            self.batch_size.observe(size, source)
+
+    def count_error(self, endpoint, kind, amount=1):
+        if self.enabled:
+            self.errors.inc(endpoint, kind, amount=amount)
+
+    def count_cache(self, result, amount=1):
+        if self.enabled and amount:
+            self.cache_lookups.inc(result, amount=amount)
+
+    def count_table(self, result, amount=1):
+        if self.enabled and amount:
+            self.table_lookups.inc(result, amount=amount)
+
+    def set_pending(self, count):
+        if self.enabled:
+            self.pending_requests.set(count)
+
+    def model_loaded(self, outcome, seconds=None):
+        if not self.enabled:
+            return
+        self.model_loads.inc(outcome)
+        if seconds is not None:
+            self.model_load_seconds.observe(seconds)
+        if outcome == "loaded":
+            self.model_loaded_at.set(time.time())
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+_prediction_metrics = None
+_prediction_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Returns the metrics shared by everything in this process."""
+    global _prediction_metrics
+    if _prediction_metrics is None:
+        with _prediction_metrics_lock:
+            if _prediction_metrics is None:
+                _prediction_metrics = PredictionMetrics()
+    return _prediction_metrics
@@ -0,0 +1,275 @@
+## Process-wide registry that keeps the trained model and preprocessor in memory.
+## Loading the dill pickles is far more expensive than a prediction, so we load them
+## once per process and only reload when the artifact files on disk actually change.
+
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.exception import CustomException
+from src.logger import logging
+from src.pipeline.fast_encoder import FastEncoder
+from src.pipeline.lite_model import LiteModel
+from src.pipeline.metrics import get_metrics
+from src.pipeline.prediction_table import PredictionTable
+from src.utils import hash_file, load_object
+
+
+@dataclass
+class ModelRegistryConfig:
+    """Configuration class for the model registry."""
+    model_file_path: str = os.path.join("artifacts", "model.pkl")
+    preprocessor_file_path: str = os.path.join("artifacts", "preprocessor.pkl")
+    # Written by ModelTrainer after both artifacts are saved, see write_artifact_manifest.
+    # While it exists only the manifest is watched: every writer of the artifacts must rewrite it
+    manifest_file_path: str = os.path.join("artifacts", "manifest.json")
+    # How often (in seconds) the files are checked for a new version, 0 checks on every call
+    reload_check_interval: float = 2.0
+    # Without a manifest: "mtime" compares size + modification time, "hash" compares sha256
+    version_strategy: str = "mtime"
+    # Compile the preprocessor into a FastEncoder for online scoring
+    compile_fast_encoder: bool = True
+    # Pure-NumPy export of the model, see src/components/model_export.py
+    lite_model_file_path: str = os.path.join("artifacts", "model_lite.npz")
+    # Serve the lite model instead of unpickling model.pkl + preprocessor.pkl when the
+    # manifest lists it (ModelTrainer only lists it when it matches the model)
+    prefer_lite_model: bool = True
+    # Memory-map the large arrays of the artifacts (lite model tree nodes, out-of-band arrays of
+    # model.pkl / preprocessor.pkl) so the workers on one host share one read-only copy
+    mmap_artifacts: bool = True
+    # Precomputed predictions for the whole input grid, see src/pipeline/prediction_table.py.
+    # Memory-mapped and used for every in-domain record when the manifest lists it
+    prediction_table_file_path: str = os.path.join("artifacts", "prediction_table.npy")
+    use_prediction_table: bool = True
+
+
+@dataclass(frozen=True)
+class ModelBundle:
+    """A model and the preprocessor it was trained with, always swapped together."""
+    model: object
+    # None when the model is a LiteModel that carries its own encoder
+    preprocessor: object
+    version: tuple
+    loaded_at: float
+    # Compiled preprocessor, None when the preprocessor layout could not be compiled
+    encoder: object = None
+    # PredictionTable of the model, None when none was exported
+    prediction_table: object = None
+
+
+def file_fingerprint(file_path, strategy="mtime"):
+    """Returns a value that changes whenever the file at file_path changes."""
+    if strategy == "hash":
+        return hash_file(file_path)
+    stat = os.stat(file_path)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def compile_encoder(preprocessor):
+    """Compiles the preprocessor and checks it against preprocessor.transform, None if they differ."""
+    import pandas as pd
+
+    ## The streaming IncrementalPreprocessor already transforms through a FastEncoder
+    if hasattr(preprocessor, "to_fast_encoder"):
+        return preprocessor.to_fast_encoder()
+
+    try:
+        encoder = FastEncoder.from_preprocessor(preprocessor)
+    except Exception as e:
+        logging.info(f"Preprocessor could not be compiled, using preprocessor.transform: {e}")
+        return None
+
+    try:
+        ## Probe every known category plus rows of missing (NaN) and None values
+        n_rows = max(len(values) for values in encoder.categories)
+        probe = {}
+        for k, column in enumerate(encoder.categorical_columns):
+            values = encoder.categories[k]
+            probe[column] = [values[i % len(values)] for i in range(n_rows)] + [np.nan, None]
+        for k, column in enumerate(encoder.numerical_columns):
+            probe[column] = [float(i * 7 % 101) for i in range(n_rows)] + [np.nan, None]
+        probe_df = pd.DataFrame(probe, columns=encoder.input_columns)
+
+        expected = preprocessor.transform(probe_df)
+        if hasattr(expected, "toarray"):
+            expected = expected.toarray()
+        matches = np.array_equal(expected, encoder.transform(probe_df))
+    except Exception as e:
+        ## e.g. an sklearn version the preprocessor was not pickled with, serving must still start
+        logging.warning(f"Compiled encoder could not be checked, using preprocessor.transform: {e}")
+        return None
+    if not matches:
+        logging.warning("Compiled encoder does not match preprocessor.transform, not using it")
+        return None
+    return encoder
+
+
+class ModelRegistry:
+    """Holds the current ModelBundle and hot-reloads it when the artifacts change.
+
+    Callers should take the bundle once per request (bundle = registry.get()) and use
+    bundle.model and bundle.preprocessor from that same object, so a reload happening
+    in the middle of the request can never mix an old model with a new preprocessor.
+    """
+
+    def __init__(self, config=None, metrics=None):
+        self.registry_config = config or ModelRegistryConfig()
+        self.metrics = metrics or get_metrics()
+        self._bundle = None
+        self._reload_lock = threading.Lock()  # Only one thread loads at a time
+        self._last_check = 0.0
+
+    def _read_manifest(self):
+        manifest_path = self.registry_config.manifest_file_path
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as file_obj:
+            return json.load(file_obj)
+
+    def artifact_version(self):
+        """
+        Version of the artifacts currently on disk.
+
+        While a manifest exists only the manifest is compared, so anything that replaces
+        model.pkl or preprocessor.pkl must rewrite it afterwards (ModelTrainer.save_model does).
+        A file replaced without a new manifest is not served until the next manifest is written.
+        """
+        ## The manifest is only rewritten once a complete model + preprocessor pair has
+        ## been saved, so while it exists it is the only thing we need to watch
+        manifest = self._read_manifest()
+        if manifest is not None:
+            return tuple(sorted(manifest["files"].items()))
+
+        strategy = self.registry_config.version_strategy
+        return (
+            file_fingerprint(self.registry_config.model_file_path, strategy),
+            file_fingerprint(self.registry_config.preprocessor_file_path, strategy),
+        )
+
+    def _matches_manifest(self, manifest):
+        for path, expected in manifest["files"].items():
+            if not os.path.exists(path) or hash_file(path) != expected:
+                return False
+        return True
+
+    def _load_artifacts(self, manifest):
+        """Returns (model, preprocessor, encoder), from the lite model when possible."""
+        config = self.registry_config
+        if config.prefer_lite_model and manifest is not None and config.lite_model_file_path in manifest["files"]:
+            lite_model = LiteModel.load(config.lite_model_file_path, mmap=config.mmap_artifacts)
+            if lite_model.encoder is not None:
+                ## Nothing is unpickled, the model and encoder are plain arrays
+                return lite_model, None, lite_model.encoder
+            preprocessor = load_object(file_path=config.preprocessor_file_path, mmap=config.mmap_artifacts)
+            return lite_model, preprocessor, self._compile(preprocessor)
+
+        model = load_object(file_path=config.model_file_path, mmap=config.mmap_artifacts)
+        preprocessor = load_object(file_path=config.preprocessor_file_path, mmap=config.mmap_artifacts)
+        return model, preprocessor, self._compile(preprocessor)
+
+    def _load_prediction_table(self, manifest):
+        ## Only a table listed in the manifest is known to belong to the model being loaded
+        config = self.registry_config
+        if not config.use_prediction_table or manifest is None:
+            return None
+        if config.prediction_table_file_path not in manifest["files"]:
+            return None
+        try:
+            return PredictionTable.load(config.prediction_table_file_path)
+        except ValueError as e:
+            ## A table that is being replaced, the model scores every record until the next reload
+            logging.warning(f"Prediction table not used: {e}")
+            return None
+
+    def _compile(self, preprocessor):
+        return compile_encoder(preprocessor) if self.registry_config.compile_fast_encoder else None
+
+    def load(self):
+        """Loads both artifacts and swaps them in as one bundle."""
+        try:
+            with self._reload_lock:
+                return self._load_locked()
+        except Exception as e:
+            self.metrics.model_loaded("failed")
+            raise CustomException(e, sys)
+
+    def _load_locked(self):
+        start = time.perf_counter()
+        version_before = self.artifact_version()
+        manifest = self._read_manifest()
+        model, preprocessor, encoder = self._load_artifacts(manifest)
+        prediction_table = self._load_prediction_table(manifest)
+        version_after = self.artifact_version()
+
+        ## If something changed while we were reading (e.g. training is writing a new model
+        ## right now) we might hold a mismatched pair, so keep the old bundle and retry later
+        consistent = version_before == version_after
+        if consistent and manifest is not None:
+            consistent = self._matches_manifest(manifest)
+
+        if not consistent:
+            if self._bundle is not None:
+                logging.info("Artifacts changed while loading, keeping the current model")
+                self.metrics.model_loaded("kept", time.perf_counter() - start)
+                return self._bundle
+            ## Nothing to fall back to at startup, serving the files on disk is the best we can do
+            logging.warning("Model artifacts do not match the manifest, loading them anyway")
+
+        ## Assigning one attribute is atomic, in-flight requests keep their old bundle
+        self._bundle = ModelBundle(
+            model=model,
+            preprocessor=preprocessor,
+            version=version_after,
+            loaded_at=time.time(),
+            encoder=encoder,
+            prediction_table=prediction_table,
+        )
+        self.metrics.model_loaded("loaded", time.perf_counter() - start)
+        logging.info(f"Loaded model artifacts version {version_after}")
+        return self._bundle
+
+    def get(self):
+        """Returns the current bundle, loading or reloading it if needed."""
+        bundle = self._bundle
+        if bundle is None:
+            return self.load()
+
+        now = time.monotonic()
+        if now - self._last_check < self.registry_config.reload_check_interval:
+            return bundle
+
+        ## Only one thread checks the files, the others keep serving the current bundle
+        if not self._reload_lock.acquire(blocking=False):
+            return bundle
+        try:
+            self._last_check = now
+            try:
+                if self.artifact_version() != bundle.version:
+                    logging.info("New model artifacts detected, reloading")
+                    return self._load_locked()
+            except Exception as e:
+                ## A broken or half-written artifact must not take the service down
+                self.metrics.model_loaded("failed")
+                logging.error(f"Reloading model artifacts failed, keeping the current model: {e}")
+            return self._bundle
+        finally:
+            self._reload_lock.release()
+
+
+_model_registry = None
+_model_registry_lock = threading.Lock()
+
+
+def get_model_registry():
+    """Returns the registry shared by everything in this process."""
+    global _model_registry
+    if _model_registry is None:
+        with _model_registry_lock:
+            if _model_registry is None:
+                _model_registry = ModelRegistry()
+    return _model_registry
@@ -1,39 +1,216 @@
 import sys
-import pandas as pd
+
+import numpy as np
+
 from src.exception import CustomException
-from src.utils import load_object
-import os
+from src.pipeline.metrics import get_metrics
+from src.pipeline.model_registry import get_model_registry
+## The field lists are defined with the rest of the input schema
+from src.pipeline.schema import (
+    CATEGORICAL_FEATURES,
+    FEATURE_COLUMNS,
+    NUMERICAL_FEATURES,
+    SCORE_RANGE,
+    SchemaError,
+    coerce_record,
+    coerce_records,
+    form_record,
+)
+
+
+def validate_record(record):
+    """
+    Checks one input record (a dict) and returns (row, errors).
+    row holds the cleaned values in FEATURE_COLUMNS order, errors maps field name -> message.
+    """
+    try:
+        return coerce_record(record), {}
+    except SchemaError as e:
+        return None, e.errors
+
+
+def normalize_row(row):
+    """
+    Returns the row as a hashable tuple: categories without surrounding spaces, scores as float.
+    The tuple is both the prediction cache key and what the model scores, so a cache hit
+    always equals what the model would have returned for the row.
+    """
+    n_categorical = len(CATEGORICAL_FEATURES)
+    categories = tuple(value.strip() if isinstance(value, str) else value for value in row[:n_categorical])
+    scores = tuple(float(value) for value in row[n_categorical:])
+    return categories + scores
 
 class PredictPipeline:
-    def __init__(self):
-        pass
+    def __init__(self, registry=None, batcher=None, metrics=None, cache=None):
+        ## The model and preprocessor are loaded once per process by the shared registry
+        self.registry = registry or get_model_registry()
+        ## Optional PredictionBatcher, when set single rows are scored together with
+        ## other concurrent requests instead of one transform + predict per row
+        self.batcher = batcher
+        ## Transform / predict timings and batch sizes, shown at /metrics
+        self.metrics = metrics or get_metrics()
+        ## Optional PredictionCache, repeated records are answered without scoring them again
+        self.cache = cache
 
     def predict(self,features):
         try:
-            model_path=os.path.join("artifacts","model.pkl")
-            preprocessor_path=os.path.join('artifacts','preprocessor.pkl')
-            print("Before Loading")
-            model=load_object(file_path=model_path)
-            preprocessor=load_object(file_path=preprocessor_path)
-            print("After Loading")
-            data_scaled=preprocessor.transform(features)
-            preds=model.predict(data_scaled)
+            ## Take the bundle once so model and preprocessor always come from the same version
+            bundle=self.registry.get()
+            ## The compiled encoder gives the same numbers as the preprocessor, just faster
+            with self.metrics.time_phase("transform"):
+                if bundle.encoder is not None:
+                    data_scaled=bundle.encoder.transform(features)
+                else:
+                    data_scaled=bundle.preprocessor.transform(features)
+            with self.metrics.time_phase("predict"):
+                preds=bundle.model.predict(data_scaled)
+            self.metrics.observe_batch(len(preds), "frame")
             return preds
         
         except Exception as e:
             raise CustomException(e,sys)
 
+    def predict_rows(self, rows):
+        """Scores rows given as lists of values in FEATURE_COLUMNS order."""
+        bundle = self.registry.get()
+        if bundle.prediction_table is None or not len(rows):
+            return [float(pred) for pred in self._score_rows(bundle, rows)]
+        if len(rows) == 1:
+            with self.metrics.time_phase("table_lookup"):
+                pred = bundle.prediction_table.lookup_row(rows[0], FEATURE_COLUMNS)
+            self.metrics.count_table("hit" if pred is not None else "miss")
+            if pred is not None:
+                return [pred]
+            return [float(pred) for pred in self._score_rows(bundle, rows)]
+        preds, found = self._lookup_table(bundle, dict(zip(FEATURE_COLUMNS, zip(*rows))))
+        if not found.all():
+            missing = np.flatnonzero(~found)
+            preds[missing] = self._score_rows(bundle, [rows[i] for i in missing])
+        return [float(pred) for pred in preds]
+
+    def predict_columns(self, columns):
+        """Scores a mapping column name -> list of values, without building a DataFrame when possible."""
+        bundle = self.registry.get()
+        if bundle.prediction_table is None:
+            return self._score_columns(bundle, columns)
+        preds, found = self._lookup_table(bundle, columns)
+        if not found.all():
+            missing = np.flatnonzero(~found)
+            preds[missing] = self._score_columns(
+                bundle, {column: [columns[column][i] for i in missing] for column in FEATURE_COLUMNS}
+            )
+        return preds
+
+    def _lookup_table(self, bundle, columns):
+        ## In-domain records are read from the precomputed table, the others (found False) need the model
+        with self.metrics.time_phase("table_lookup"):
+            preds, found = bundle.prediction_table.lookup_columns(columns)
+        n_found = int(found.sum())
+        self.metrics.count_table("hit", n_found)
+        self.metrics.count_table("miss", len(found) - n_found)
+        return preds, found
+
+    def _score_rows(self, bundle, rows):
+        if bundle.encoder is None:
+            ## pandas is only needed (and imported) when the preprocessor could not be compiled
+            import pandas as pd
+            return self.predict(pd.DataFrame(rows, columns=FEATURE_COLUMNS))
+        ## Rows go straight into the feature matrix, no DataFrame needed
+        with self.metrics.time_phase("transform"):
+            data_scaled = bundle.encoder.transform_records(rows, columns=FEATURE_COLUMNS)
+        with self.metrics.time_phase("predict"):
+            preds = bundle.model.predict(data_scaled)
+        self.metrics.observe_batch(len(rows), "rows")
+        return preds
+
+    def _score_columns(self, bundle, columns):
+        if bundle.encoder is None:
+            import pandas as pd
+            return self.predict(pd.DataFrame(columns, columns=FEATURE_COLUMNS))
+        with self.metrics.time_phase("transform"):
+            data_scaled = bundle.encoder.transform_columns(columns)
+        with self.metrics.time_phase("predict"):
+            preds = bundle.model.predict(data_scaled)
+        self.metrics.observe_batch(len(preds), "columns")
+        return preds
+
+    def predict_row(self, row):
+        """Scores a single row, through the cache and the batcher when they are configured."""
+        try:
+            if self.cache is not None:
+                ## The version is taken before scoring: should the model be swapped meanwhile, the
+                ## cache refuses the result because it is no longer for the current version
+                version = self.registry.get().version
+                row = normalize_row(row)
+                cached = self.cache.get_many(version, [row])[0]
+                if cached is not None:
+                    return cached
+            if self.batcher is not None:
+                prediction = self.batcher.predict_one(list(row))
+            else:
+                prediction = self.predict_rows([list(row)])[0]
+            if self.cache is not None:
+                self.cache.put_many(version, [row], [prediction])
+            return prediction
+        except Exception as e:
+            raise CustomException(e,sys)
+
+    def predict_batch(self, records):
+        """
+        Scores many records with a single transform + predict call.
+        Returns (predictions, errors): predictions has one entry per record in input order
+        (None for invalid records) and errors lists {"index", "errors"} for every invalid record.
+        """
+        try:
+            ## Every field is validated and coerced for the whole batch at once, the valid
+            ## records come back as typed columns that are encoded with a single call
+            columns, valid_indices, errors = coerce_records(records)
+
+            predictions = [None] * len(records)
+            if valid_indices and self.cache is not None:
+                version = self.registry.get().version
+                rows = [normalize_row(row) for row in zip(*columns.values())]
+                valid_indices, columns, rows = self._fill_from_cache(version, valid_indices, rows, predictions)
+            if valid_indices:
+                preds = self.predict_columns(columns)
+                for index, pred in zip(valid_indices, preds):
+                    predictions[index] = float(pred)
+                if self.cache is not None:
+                    self.cache.put_many(version, rows, preds)
+
+            return predictions, errors
+
+        except Exception as e:
+            raise CustomException(e,sys)
+
+    def _fill_from_cache(self, version, valid_indices, rows, predictions):
+        """Sets the cached predictions, returns the indices, columns and rows still to be scored."""
+        cached = self.cache.get_many(version, rows)
+        missing = []
+        for index, row, prediction in zip(valid_indices, rows, cached):
+            if prediction is None:
+                missing.append((index, row))
+            else:
+                predictions[index] = prediction
+        ## The misses are put back into columns and still scored with one call
+        columns = {column: [row[k] for _, row in missing] for k, column in enumerate(FEATURE_COLUMNS)}
+        return [index for index, _ in missing], columns, [row for _, row in missing]
+
 
 
 class CustomData:
+    """One input record. __slots__ keeps it to the seven values, no per-instance dict."""
+
+    __slots__ = tuple(FEATURE_COLUMNS)
+
     def __init__(  self,
         gender: str,
         race_ethnicity: str,
         parental_level_of_education,
         lunch: str,
         test_preparation_course: str,
-        reading_score: int,
-        writing_score: int):
+        reading_score: float,
+        writing_score: float):
 
         self.gender = gender
 
@@ -49,8 +226,20 @@ class CustomData:
 
         self.writing_score = writing_score
 
+    @classmethod
+    def from_record(cls, record):
+        """Validates and coerces a record dict, raises SchemaError with the message of every bad field."""
+        return cls(*coerce_record(record))
+
+    @classmethod
+    def from_form(cls, form):
+        """Same as from_record for the fields of the HTML form (request.form or a parsed query string)."""
+        return cls.from_record(form_record(form))
+
     def get_data_as_data_frame(self):
         try:
+            import pandas as pd
+
             custom_data_input_dict = {
                 "gender": [self.gender],
                 "race_ethnicity": [self.race_ethnicity],
@@ -66,3 +255,6 @@ class CustomData:
         except Exception as e:
             raise CustomException(e, sys)
 
+    def get_data_as_row(self):
+        """Returns the record as a list of values in FEATURE_COLUMNS order."""
+        return [getattr(self, column) for column in FEATURE_COLUMNS]
@@ -0,0 +1,266 @@
+## Cache of prediction results for repeated inputs.
+## A record is five categories with a handful of values each plus two scores between 0 and
+## 100, so real traffic asks for the same inputs again and again. The cache maps the
+## normalized record to its prediction and is tied to the model artifact version: when the
+## registry loads a new model every cached result of the old one is dropped.
+##
+## Two tiers:
+##  - an in-process LRU dict with a maximum number of entries and an optional TTL
+##  - optionally a shared file in PREDICT_CACHE_DIR, memory-mapped by every worker process,
+##    so a result computed by one gunicorn worker is a hit for all the others. It is a fixed
+##    size open-addressing hash table (two independent 64-bit key hashes -> prediction), one
+##    file per model version. The shared tier is best effort: when it fails the worker logs it
+##    and goes on with its in-memory tier.
+
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+from src.logger import logging
+from src.pipeline.metrics import get_metrics
+
+
+@dataclass
+class PredictionCacheConfig:
+    """Configuration class for the prediction cache."""
+    enabled: bool = field(default_factory=lambda: os.environ.get("PREDICT_CACHE", "1") != "0")
+    # Entries kept in memory per process, the least recently used one is evicted after that.
+    # An entry is a 7-value tuple plus a float, roughly 0.5 KB, so 50_000 entries stay below ~25 MB
+    max_entries: int = 50_000
+    # Seconds an in-memory entry stays valid, 0 keeps it until it is evicted or the model changes
+    ttl_seconds: float = 3600.0
+    # Folder of the shared tier, None (the default) keeps the cache per process
+    shared_dir: Optional[str] = field(default_factory=lambda: os.environ.get("PREDICT_CACHE_DIR"))
+    # Slots of the shared table, 24 bytes each (the file is sparse, only used pages take memory)
+    shared_slots: int = 1 << 20
+    # Slots looked at for a key before giving up (lookup) or not storing it (insert)
+    shared_probe_length: int = 8
+    # Shared files of other model versions are deleted once no worker switched to them for
+    # this long, workers still on such a version keep using their open file meanwhile
+    shared_stale_seconds: float = 3600.0
+
+
+class SharedPredictionTable:
+    """Memory-mapped hash table of predictions shared by the worker processes of one machine.
+
+    Lookups only read the mapped file. Inserts take an exclusive lock on the file (through
+    the descriptor opened with it, so it works even once the file was deleted), write the
+    value and the check hash first and the key last, and never overwrite a used slot, so a
+    reader that finds its key also finds the complete value next to it.
+    A slot only answers for a key when both 64-bit hashes match, a wrong prediction needs a
+    128-bit collision.
+    """
+
+    _dtype = np.dtype([("key", "<u8"), ("check", "<u8"), ("value", "<f8")])
+    ## Part of the file name, a file with another slot layout is never mapped
+    _layout = "key-check-value"
+
+    def __init__(self, directory, version, n_slots, probe_length, stale_seconds=3600.0):
+        version_hash = hashlib.sha256(repr((self._layout, version)).encode()).hexdigest()[:16]
+        self.file_path = os.path.join(directory, f"predictions_{version_hash}.bin")
+        self.n_slots = n_slots
+        self.probe_length = probe_length
+
+        os.makedirs(directory, exist_ok=True)
+        n_bytes = n_slots * self._dtype.itemsize
+        with open(self.file_path, "ab") as file_obj:
+            if file_obj.tell() < n_bytes:
+                file_obj.truncate(n_bytes)  # Sparse file of zeros, key 0 means empty slot
+        ## Kept open for the inserts' lock, the mapping and this descriptor outlive a deletion
+        self._lock_file = open(self.file_path, "rb")
+        self.table = np.memmap(self.file_path, dtype=self._dtype, mode="r+", shape=(n_slots,))
+        ## The modification time says when a worker last switched to this version
+        os.utime(self.file_path)
+        self._remove_stale_versions(directory, stale_seconds)
+
+    def _remove_stale_versions(self, directory, stale_seconds):
+        ## Only files no worker switched to for stale_seconds: a worker still on an older
+        ## version goes on with its open file, deleting it only frees the disk space later
+        now = time.time()
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if not name.startswith("predictions_") or path == self.file_path:
+                continue
+            try:
+                if now - os.path.getmtime(path) > stale_seconds:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def key_hash(key):
+        """Two independent 64-bit hashes of the key, (slot key, check)."""
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=16).digest()
+        ## The slot key is never 0, that marks an empty slot
+        return int.from_bytes(digest[:8], "little") | 1, int.from_bytes(digest[8:], "little")
+
+    def _slots(self, key):
+        start = key % self.n_slots
+        return [(start + i) % self.n_slots for i in range(self.probe_length)]
+
+    def get(self, key_hash):
+        key, check = key_hash
+        for slot in self._slots(key):
+            stored = int(self.table["key"][slot])
+            if stored == key and int(self.table["check"][slot]) == check:
+                return float(self.table["value"][slot])
+            if stored == 0:
+                return None
+        return None
+
+    def put(self, key_hash, value):
+        import fcntl
+
+        key, check = key_hash
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            for slot in self._slots(key):
+                stored = int(self.table["key"][slot])
+                if stored == key and int(self.table["check"][slot]) == check:
+                    return
+                if stored == 0:
+                    self.table["value"][slot] = value
+                    self.table["check"][slot] = check
+                    self.table["key"][slot] = key
+                    return
+            ## Every probed slot is taken by other keys, the in-memory tier still has it
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+
+class PredictionCache:
+    """Thread-safe LRU (+ TTL) cache of predictions for one model version at a time."""
+
+    def __init__(self, config=None, metrics=None):
+        self.cache_config = config or PredictionCacheConfig()
+        self.metrics = metrics or get_metrics()
+        self._entries = OrderedDict()  # key -> (prediction, expires_at)
+        self._lock = threading.Lock()
+        self._version = None
+        self._shared = None
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _switch_version(self, version):
+        ## Called with the lock held: results of another model version are never returned
+        self._entries.clear()
+        self._version = version
+        ## Not closed here, a thread may still be storing into the old table
+        self._shared = None
+        config = self.cache_config
+        if config.shared_dir:
+            try:
+                self._shared = SharedPredictionTable(
+                    config.shared_dir, version, config.shared_slots, config.shared_probe_length,
+                    config.shared_stale_seconds,
+                )
+            except Exception as e:
+                logging.warning(f"Shared prediction cache unavailable, using the in-memory cache only: {e}")
+        logging.info("Prediction cache cleared for a new model version")
+
+    def get_many(self, version, keys):
+        """Returns the cached prediction of every key (see normalize_row), None where there is none."""
+        now = time.monotonic()
+        results = [None] * len(keys)
+        shared_lookups = []
+        with self._lock:
+            if version != self._version:
+                self._switch_version(version)
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is None:
+                    shared_lookups.append(i)
+                    continue
+                prediction, expires_at = entry
+                if expires_at is not None and expires_at < now:
+                    del self._entries[key]
+                    shared_lookups.append(i)
+                    continue
+                self._entries.move_to_end(key)
+                results[i] = prediction
+            shared = self._shared
+
+        n_shared_hits = 0
+        if shared is not None and shared_lookups:
+            found = {}
+            try:
+                for i in shared_lookups:
+                    prediction = shared.get(shared.key_hash(keys[i]))
+                    if prediction is not None:
+                        results[i] = found[keys[i]] = prediction
+                        n_shared_hits += 1
+            except Exception as e:
+                self._drop_shared(shared, e)
+            if found:
+                ## Keep shared hits in memory too, the next lookup does not need the file
+                self._store(version, found.items(), share=False)
+
+        n_misses = len(shared_lookups) - n_shared_hits
+        n_hits = len(keys) - len(shared_lookups)
+        with self._lock:
+            self.hits += n_hits
+            self.shared_hits += n_shared_hits
+            self.misses += n_misses
+        self.metrics.count_cache("hit", n_hits)
+        self.metrics.count_cache("shared_hit", n_shared_hits)
+        self.metrics.count_cache("miss", n_misses)
+        return results
+
+    def put_many(self, version, keys, predictions):
+        """Stores the predictions a model of the given version made for keys."""
+        self._store(version, zip(keys, predictions), share=True)
+
+    def _store(self, version, items, share):
+        items = [(key, float(prediction)) for key, prediction in items if prediction is not None]
+        ttl = self.cache_config.ttl_seconds
+        expires_at = time.monotonic() + ttl if ttl > 0 else None
+        with self._lock:
+            ## A result of a model that is no longer current is simply not kept
+            if version != self._version:
+                return
+            for key, prediction in items:
+                self._entries[key] = (prediction, expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.cache_config.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            shared = self._shared
+        if share and shared is not None:
+            try:
+                for key, prediction in items:
+                    if math.isfinite(prediction):
+                        shared.put(shared.key_hash(key), prediction)
+            except Exception as e:
+                self._drop_shared(shared, e)
+
+    def _drop_shared(self, shared, error):
+        ## A failing shared tier never fails a request, this worker goes on without it
+        logging.warning(f"Shared prediction cache failed, using the in-memory cache only: {error}")
+        with self._lock:
+            if self._shared is shared:
+                self._shared = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
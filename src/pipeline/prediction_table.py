@@ -0,0 +1,128 @@
+## Precomputed predictions for every possible input.
+## The categorical fields only take the values the OneHotEncoder was fitted on and the scores
+## are whole numbers from 0 to 100, so the whole input space is a grid of a few million cells.
+## ModelTrainer scores that grid once after training (see export_prediction_table in
+## model_export.py) and saves it as a .npy array with one axis per input field, plus a small
+## .json file naming the axes. Serving memory-maps the array, so every worker shares the same
+## pages, and answers a record with one index computation and one array read.
+## Records outside the grid (unknown category, missing value, fractional or out-of-range
+## score) are reported as misses and scored by the model as before.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from src.pipeline.schema import CategoricalColumn
+
+PREDICTION_TABLE_FORMAT_VERSION = 1
+
+
+def table_meta_path(file_path):
+    """The .json file with the axes of the table saved at file_path."""
+    return os.path.splitext(file_path)[0] + ".json"
+
+
+def table_values_hash(values):
+    """sha256 of the table's cells, stored in the .json file to pair it with its .npy file."""
+    return hashlib.sha256(np.ascontiguousarray(values)).hexdigest()
+
+
+class PredictionTable:
+    """Predictions indexed by (category of each categorical column..., each score - score_min)."""
+
+    def __init__(self, values, categorical_columns, categories, numerical_columns, score_range, meta=None):
+        self.values = values
+        self.categorical_columns = list(categorical_columns)
+        self.categories = [list(values) for values in categories]
+        self.numerical_columns = list(numerical_columns)
+        self.score_min, self.score_max = (int(bound) for bound in score_range)
+        self.meta = dict(meta or {})
+
+        self.category_index = [{value: i for i, value in enumerate(values)} for values in self.categories]
+        self.flat_values = values.reshape(-1)  # A view, the memory map stays shared
+        ## Element strides of a C-ordered array, axis k advances the flat index by strides[k]
+        self.strides = [stride // values.itemsize for stride in values.strides]
+        self._row_plans = {}  # columns -> [(position in row, category index or None, stride)]
+
+    @classmethod
+    def load(cls, file_path, mmap=True):
+        with open(table_meta_path(file_path)) as file_obj:
+            meta = json.load(file_obj)
+        if meta.get("format_version") != PREDICTION_TABLE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported prediction table format {meta.get('format_version')}")
+        values = np.load(file_path, mmap_mode="r" if mmap else None, allow_pickle=False)
+        ## The two files are replaced one after the other, a table written by another export
+        ## would be read with the wrong axes
+        if "values_sha256" in meta and table_values_hash(values) != meta["values_sha256"]:
+            raise ValueError(f"{file_path} does not match {table_meta_path(file_path)}, it is being replaced")
+        return cls(
+            values, meta["categorical_columns"], meta["categories"], meta["numerical_columns"],
+            meta["score_range"], meta=meta,
+        )
+
+    @property
+    def model_name(self):
+        return self.meta.get("model_name")
+
+    def lookup_columns(self, columns):
+        """
+        Looks up a mapping column name -> sequence of values.
+        Returns (predictions, found): predictions is NaN wherever found is False.
+        """
+        n_rows = len(columns[self.categorical_columns[0]])
+        flat_index = np.zeros(n_rows, dtype=np.int64)
+        found = np.ones(n_rows, dtype=bool)
+
+        for k, column in enumerate(self.categorical_columns):
+            index = self.category_index[k]
+            values = columns[column]
+            if isinstance(values, CategoricalColumn):
+                positions = values.map(lambda value: index.get(value, -1))
+            else:
+                positions = np.fromiter((index.get(value, -1) for value in values), dtype=np.int64, count=n_rows)
+            found &= positions >= 0
+            flat_index += np.maximum(positions, 0) * self.strides[k]
+
+        for k, column in enumerate(self.numerical_columns, start=len(self.categorical_columns)):
+            values = np.asarray(columns[column], dtype=np.float64)  # None becomes NaN
+            ## NaN fails every comparison, so missing scores are misses too
+            on_grid = (values == np.floor(values)) & (values >= self.score_min) & (values <= self.score_max)
+            found &= on_grid
+            flat_index += np.where(on_grid, values - self.score_min, 0).astype(np.int64) * self.strides[k]
+
+        predictions = np.full(n_rows, np.nan)
+        predictions[found] = self.flat_values[flat_index[found]]
+        return predictions, found
+
+    def lookup_row(self, row, columns):
+        """
+        Returns the prediction for one row (values in `columns` order), None when it is not in
+        the table. Plain Python, a single row is much cheaper this way than with array operations.
+        """
+        plan = self._row_plans.get(tuple(columns))
+        if plan is None:
+            positions = {column: i for i, column in enumerate(columns)}
+            plan = [(positions[column], index, stride)
+                    for column, index, stride in zip(self.categorical_columns, self.category_index, self.strides)]
+            plan += [(positions[column], None, stride)
+                     for column, stride in zip(self.numerical_columns, self.strides[len(self.categorical_columns):])]
+            self._row_plans[tuple(columns)] = plan
+
+        flat_index = 0
+        for position, index, stride in plan:
+            value = row[position]
+            if index is not None:
+                offset = index.get(value) if isinstance(value, str) else None
+                if offset is None:
+                    return None
+            else:
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    return None
+                ## NaN fails the range check
+                if not self.score_min <= value <= self.score_max or value != int(value):
+                    return None
+                offset = int(value) - self.score_min
+            flat_index += offset * stride
+        return float(self.flat_values[flat_index])
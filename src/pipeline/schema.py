@@ -0,0 +1,213 @@
+## Schema of the seven input fields of a prediction request.
+## Records (JSON objects or the HTML form) are validated and coerced column by column: every
+## categorical field becomes a CategoricalColumn (codes into its distinct, stripped values) and
+## every score a float64 array, with array operations doing the checks whenever the values
+## already have the expected types.
+## Errors are reported per record and per field, with the same messages as before.
+
+import math
+from itertools import repeat
+
+import numpy as np
+
+## Input fields of one student record, in the order the preprocessor was trained on
+CATEGORICAL_FEATURES = [
+    "gender",
+    "race_ethnicity",
+    "parental_level_of_education",
+    "lunch",
+    "test_preparation_course",
+]
+NUMERICAL_FEATURES = ["reading_score", "writing_score"]
+FEATURE_COLUMNS = CATEGORICAL_FEATURES + NUMERICAL_FEATURES
+
+## Scores are percentages, anything outside this range is a data entry error
+SCORE_RANGE = (0.0, 100.0)
+
+## Names of the HTML form fields (templates/home.html) that differ from the column names
+FORM_FIELDS = {"race_ethnicity": "ethnicity"}
+
+CATEGORY_ERROR = "is required and must be a non-empty string"
+NUMBER_ERROR = "is required and must be a number"
+RANGE_ERROR = f"must be between {SCORE_RANGE[0]:g} and {SCORE_RANGE[1]:g}"
+RECORD_ERROR = "must be a JSON object"
+
+
+class SchemaError(ValueError):
+    """Raised for a single invalid record, errors maps field name -> message."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(f"{field} {message}" for field, message in errors.items()))
+
+
+class CategoricalColumn:
+    """
+    Values of a categorical field as integer codes into the list of its distinct values.
+    A field only has a handful of distinct values, so the encoder and the prediction table look
+    each of them up once (map) instead of once per record. Iterating or indexing it gives the
+    values themselves, like the list it replaces.
+    """
+
+    __slots__ = ("codes", "categories")
+
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        categories = self.categories
+        return (categories[code] for code in self.codes.tolist())
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self.categories[self.codes[key]]
+        return CategoricalColumn(self.codes[key], self.categories)
+
+    def map(self, func, dtype=np.int64):
+        """func applied to every value, calling it once per distinct value."""
+        return np.array([func(value) for value in self.categories], dtype=dtype).reshape(-1)[self.codes]
+
+
+def coerce_categorical(values):
+    """Returns (CategoricalColumn of the stripped strings, mask of invalid values)."""
+    n_rows = len(values)
+    if n_rows and set(map(type, values)) == {str}:
+        ## All strings: find the distinct values in C, strip only those, then merge the
+        ## values that were the same apart from surrounding spaces
+        distinct, codes = np.unique(np.asarray(values, dtype=np.str_), return_inverse=True)
+        categories, stripped_codes = np.unique(np.char.strip(distinct), return_inverse=True)
+        codes = stripped_codes[codes].reshape(n_rows)
+        return CategoricalColumn(codes, categories.tolist()), (categories == "")[codes]
+
+    codes = np.empty(n_rows, dtype=np.int64)
+    invalid = np.zeros(n_rows, dtype=bool)
+    category_codes = {}
+    categories = []
+    for i, value in enumerate(values):
+        if isinstance(value, str):
+            value = value.strip()
+            invalid[i] = not value
+        else:
+            invalid[i] = True
+            ## Unhashable values (lists, dicts) are invalid anyway, keep them apart by identity
+            value = value if value is None or isinstance(value, (int, float)) else id(value)
+        code = category_codes.get(value)
+        if code is None:
+            code = category_codes[value] = len(categories)
+            categories.append(value)
+        codes[i] = code
+    return CategoricalColumn(codes, categories), invalid
+
+
+def coerce_numerical(values):
+    """Returns (float64 array, mask of values that are not numbers, mask of numbers out of range)."""
+    n_rows = len(values)
+    column = None
+    not_number = np.zeros(n_rows, dtype=bool)
+    if set(map(type, values)) <= {int, float}:
+        try:
+            column = np.asarray(values, dtype=np.float64).reshape(n_rows)
+        except OverflowError:  # An int too large for a float, checked one by one below
+            column = None
+    if column is None:
+        column = np.full(n_rows, np.nan)
+        for i, value in enumerate(values):
+            try:
+                ## bool is a subclass of int, but True is not a valid score
+                if isinstance(value, bool):
+                    raise ValueError
+                column[i] = float(value)
+            except (TypeError, ValueError, OverflowError):
+                not_number[i] = True
+    ## NaN and infinities fail the range check, like the scores outside SCORE_RANGE
+    with np.errstate(invalid="ignore"):
+        out_of_range = ~((column >= SCORE_RANGE[0]) & (column <= SCORE_RANGE[1])) & ~not_number
+    return column, not_number, out_of_range
+
+
+def coerce_columns(columns):
+    """
+    Validates a mapping field name -> sequence of raw values (all the same length).
+    Returns (typed columns in FEATURE_COLUMNS order, errors) where errors maps the index of
+    every invalid record to {field: message}.
+    """
+    typed = {}
+    errors = {}
+    for field in CATEGORICAL_FEATURES:
+        typed[field], invalid = coerce_categorical(columns[field])
+        for i in np.flatnonzero(invalid).tolist():
+            errors.setdefault(i, {})[field] = CATEGORY_ERROR
+    for field in NUMERICAL_FEATURES:
+        typed[field], not_number, out_of_range = coerce_numerical(columns[field])
+        for i in np.flatnonzero(not_number).tolist():
+            errors.setdefault(i, {})[field] = NUMBER_ERROR
+        for i in np.flatnonzero(out_of_range).tolist():
+            errors.setdefault(i, {})[field] = RANGE_ERROR
+    ## Same field order in every error dict, whatever check found the problem
+    errors = {i: {field: field_errors[field] for field in FEATURE_COLUMNS if field in field_errors}
+              for i, field_errors in sorted(errors.items())}
+    return typed, errors
+
+
+def coerce_records(records):
+    """
+    Validates a list of record dicts in one pass per field.
+    Returns (columns, valid_indices, errors): columns hold the typed values of the valid records
+    only (FEATURE_COLUMNS order), errors lists {"index", "errors"} for every invalid record.
+    """
+    is_dict = [isinstance(record, dict) for record in records]
+    dict_records = [record for record, ok in zip(records, is_dict) if ok]
+    dict_indices = [index for index, ok in enumerate(is_dict) if ok]
+
+    typed, field_errors = coerce_columns(
+        {field: list(map(dict.get, dict_records, repeat(field))) for field in FEATURE_COLUMNS}
+    )
+    errors = {index: {"record": RECORD_ERROR} for index, ok in enumerate(is_dict) if not ok}
+    errors.update((dict_indices[i], record_errors) for i, record_errors in field_errors.items())
+
+    valid = np.ones(len(dict_records), dtype=bool)
+    valid[list(field_errors)] = False
+    columns = {field: values[valid] for field, values in typed.items()}
+    valid_indices = [index for index, ok in zip(dict_indices, valid.tolist()) if ok]
+    return columns, valid_indices, [{"index": index, "errors": errors[index]} for index in sorted(errors)]
+
+
+def coerce_record(record):
+    """
+    Validates one record, returns its values in FEATURE_COLUMNS order or raises SchemaError.
+    Plain Python: for a single record that is much cheaper than building arrays.
+    """
+    if not isinstance(record, dict):
+        raise SchemaError({"record": RECORD_ERROR})
+    row = []
+    errors = {}
+    for field in CATEGORICAL_FEATURES:
+        value = record.get(field)
+        if isinstance(value, str) and value.strip():
+            row.append(value.strip())
+        else:
+            errors[field] = CATEGORY_ERROR
+    for field in NUMERICAL_FEATURES:
+        value = record.get(field)
+        try:
+            if isinstance(value, bool):
+                raise ValueError
+            value = float(value)
+        except (TypeError, ValueError, OverflowError):
+            errors[field] = NUMBER_ERROR
+            continue
+        if not math.isfinite(value) or not SCORE_RANGE[0] <= value <= SCORE_RANGE[1]:
+            errors[field] = RANGE_ERROR
+        row.append(value)
+    if errors:
+        raise SchemaError(errors)
+    return row
+
+
+def form_record(form):
+    """Maps the fields of the HTML form (any mapping with .get) to a record dict."""
+    return {field: form.get(FORM_FIELDS.get(field, field)) for field in FEATURE_COLUMNS}
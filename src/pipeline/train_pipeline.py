@@ -0,0 +1,321 @@
+## Training pipeline built from the components: data ingestion -> data transformation ->
+## one fit per candidate model -> model selection.
+## The steps are declared as stages with their dependencies and run by a small scheduler:
+## stages whose dependencies are done run at the same time (max_workers), every finished
+## stage is checkpointed so a crashed run resumes where it stopped, and the time spent in
+## each stage is reported at the end.
+
+import dataclasses
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, Optional
+
+from src.exception import CustomException
+from src.logger import logging
+from src.utils import load_object, save_object
+
+
+@dataclass
+class TrainPipelineConfig:
+    """Configuration class for the training pipeline."""
+    checkpoint_dir: str = os.path.join("artifacts", "checkpoints")
+    # Per-stage timings of the last run
+    report_file_path: str = os.path.join("artifacts", "train_pipeline_report.json")
+    # Stages that run at the same time once their dependencies are done, 1 runs them one by one
+    max_workers: int = 1
+    # "thread" or "process" pool for the stages, with processes every stage input is pickled
+    backend: str = "thread"
+    # Continue from the checkpoints of an unfinished run instead of starting over
+    resume: bool = True
+    # Checkpoints are deleted after a successful run unless this is set
+    keep_checkpoints: bool = False
+
+
+@dataclass
+class Stage:
+    """One step of the pipeline. func is called with the outputs of depends_on, in that order."""
+    name: str
+    func: Callable
+    depends_on: tuple = ()
+    # Rebuilds the output from files the stage saved itself (e.g. the transformed arrays),
+    # used instead of pickling the output into the checkpoint
+    restore: Optional[Callable] = None
+
+
+class StageRunner:
+    """Runs stages in dependency order, in parallel where possible, with checkpoints."""
+
+    def __init__(self, stages, config=None, inputs_key=None):
+        self.pipeline_config = config or TrainPipelineConfig()
+        self.stages = {stage.name: stage for stage in stages}
+        ## Fingerprint of what the stages read (source data, configs, code), see TrainPipeline.inputs_key
+        self.inputs_key = inputs_key
+        self.order = self._topological_order()
+        self.stage_report = {}
+
+    def _topological_order(self):
+        for stage in self.stages.values():
+            for dependency in stage.depends_on:
+                if dependency not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dependency}'")
+        order = []
+        done = set()
+        while len(order) < len(self.stages):
+            ready = [name for name, stage in self.stages.items()
+                     if name not in done and set(stage.depends_on) <= done]
+            if not ready:
+                raise ValueError("The stage dependencies contain a cycle")
+            order.extend(ready)
+            done.update(ready)
+        return order
+
+    def _graph_key(self):
+        ## Checkpoints are only reused by a run with the same stages, dependencies and inputs:
+        ## after a change to the source data, a config or the code a crashed run starts over
+        graph = [[name, list(self.stages[name].depends_on)] for name in self.order]
+        return hashlib.sha256(json.dumps([graph, self.inputs_key]).encode()).hexdigest()
+
+    def _state_path(self):
+        return os.path.join(self.pipeline_config.checkpoint_dir, "state.json")
+
+    def _checkpoint_path(self, name):
+        return os.path.join(self.pipeline_config.checkpoint_dir, f"{name}.pkl")
+
+    def _load_state(self):
+        state_path = self._state_path()
+        if self.pipeline_config.resume and os.path.exists(state_path):
+            with open(state_path) as file_obj:
+                state = json.load(file_obj)
+            if state.get("graph") == self._graph_key():
+                return state
+            logging.info("Checkpoints belong to a different pipeline or other inputs, starting over")
+        shutil.rmtree(self.pipeline_config.checkpoint_dir, ignore_errors=True)
+        os.makedirs(self.pipeline_config.checkpoint_dir, exist_ok=True)
+        return {"graph": self._graph_key(), "done": {}}
+
+    def _save_state(self, state):
+        tmp_path = f"{self._state_path()}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file_obj:
+            json.dump(state, file_obj, indent=2)
+        os.replace(tmp_path, self._state_path())
+
+    def _checkpoint(self, state, name, output, timing):
+        ## The output is saved before the stage is marked done, so a crash in between only reruns it
+        if self.stages[name].restore is None:
+            save_object(self._checkpoint_path(name), output)
+        state["done"][name] = timing
+        self._save_state(state)
+
+    def _resume(self, state, outputs):
+        for name in self.order:
+            if name not in state["done"]:
+                continue
+            stage = self.stages[name]
+            outputs[name] = stage.restore() if stage.restore is not None else load_object(self._checkpoint_path(name))
+            self.stage_report[name] = dict(state["done"][name], status="resumed")
+            logging.info(f"Stage {name} resumed from checkpoint")
+
+    def run(self):
+        """Runs every stage that is not checkpointed yet, returns name -> output."""
+        try:
+            start = time.perf_counter()
+            state = self._load_state()
+            outputs = {}
+            self._resume(state, outputs)
+
+            executor_class = ProcessPoolExecutor if self.pipeline_config.backend == "process" else ThreadPoolExecutor
+            with executor_class(max_workers=max(1, self.pipeline_config.max_workers)) as executor:
+                running = {}
+                while len(outputs) < len(self.stages):
+                    ## Start every stage whose dependencies are done
+                    for name in self.order:
+                        stage = self.stages[name]
+                        if name in outputs or name in running.values():
+                            continue
+                        if all(dependency in outputs for dependency in stage.depends_on):
+                            logging.info(f"Stage {name} started")
+                            inputs = [outputs[dependency] for dependency in stage.depends_on]
+                            future = executor.submit(_timed_call, stage.func, inputs)
+                            running[future] = name
+
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        name = running.pop(future)
+                        try:
+                            output, timing = future.result()
+                        except Exception:
+                            ## Let the stages already running finish and checkpoint them,
+                            ## so the next run does not repeat their work
+                            for other in wait(running).done:
+                                if other.exception() is None:
+                                    other_output, other_timing = other.result()
+                                    self._checkpoint(state, running[other], other_output, other_timing)
+                            logging.error(f"Stage {name} failed, rerun the pipeline to resume")
+                            raise
+                        outputs[name] = output
+                        self._checkpoint(state, name, output, timing)
+                        self.stage_report[name] = dict(timing, status="ran")
+                        logging.info(f"Stage {name} done in {timing['seconds']:.2f}s")
+
+            self._write_report(time.perf_counter() - start)
+            if not self.pipeline_config.keep_checkpoints:
+                shutil.rmtree(self.pipeline_config.checkpoint_dir, ignore_errors=True)
+            return outputs
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _write_report(self, total_seconds):
+        report = {
+            "total_seconds": total_seconds,
+            "stages": {name: self.stage_report[name] for name in self.order},
+        }
+        os.makedirs(os.path.dirname(self.pipeline_config.report_file_path) or ".", exist_ok=True)
+        with open(self.pipeline_config.report_file_path, "w") as file_obj:
+            json.dump(report, file_obj, indent=2)
+
+        lines = [f"{'stage':<36}{'status':>9}{'seconds':>10}"]
+        for name in self.order:
+            stage_report = self.stage_report[name]
+            lines.append(f"{name:<36}{stage_report['status']:>9}{stage_report['seconds']:>10.2f}")
+        lines.append(f"{'total (wall)':<36}{'':>9}{total_seconds:>10.2f}")
+        logging.info("Stage timings:\n" + "\n".join(lines))
+
+
+def _timed_call(func, inputs):
+    ## Module level so process pools can pickle it
+    started_at = time.time()
+    start = time.perf_counter()
+    output = func(*inputs)
+    return output, {"started_at": started_at, "seconds": time.perf_counter() - start}
+
+
+## Stage functions, module level (or functools.partial of them) so they also work with processes
+
+def run_data_ingestion():
+    from src.components.data_ingestion import DataIngestion
+
+    train_data_path, test_data_path, _ = DataIngestion().initiate_data_ingestion()
+    return train_data_path, test_data_path
+
+
+def run_data_transformation(data_paths):
+    from src.components.data_transformation import DataTransformation
+
+    return DataTransformation().initiate_data_transformation_xy(*data_paths)
+
+
+def run_cv_folds(data_paths):
+    from src.components.data_transformation import DataTransformation
+
+    return DataTransformation().initiate_cv_folds(data_paths[0])
+
+
+def restore_transformed_data():
+    from src.components.data_transformation import DataTransformation
+
+    return DataTransformation().load_transformed_data()
+
+
+def fit_candidate(model_name, n_threads, shared_process, transformed_data, folds=None):
+    """Searches, fits and scores (and cross-validates) one candidate model of ModelTrainer, returns (model, result)."""
+    from src.components.model_trainer import ModelTrainer
+    from src.utils import fit_and_score_model, limit_model_threads
+
+    X_train, y_train, X_test, y_test = transformed_data
+    trainer = ModelTrainer()
+    config = trainer.model_trainer_config
+    model = limit_model_threads(trainer.get_models()[model_name], n_threads)
+    return fit_and_score_model(
+        model, X_train, y_train, X_test, y_test,
+        trainer.get_params().get(model_name), config.search_config,
+        model_name in config.dense_input_models, folds, shared_process,
+    )
+
+
+def select_model(model_names, transformed_data, *fits):
+    """Saves the best of the fitted candidates, like ModelTrainer.initiate_model_trainer_xy."""
+    from src.components.model_trainer import ModelTrainer
+
+    _, _, X_test, y_test = transformed_data
+    models = {name: model for name, (model, _) in zip(model_names, fits)}
+    model_report = {name: result for name, (_, result) in zip(model_names, fits)}
+    best_model_name, r2_square, _ = ModelTrainer().save_best_model(models, model_report, X_test, y_test)
+    return {"best_model": best_model_name, "r2_score": r2_square, "model_report": model_report}
+
+
+class TrainPipeline:
+    """Declares the training stages and runs them with a StageRunner."""
+
+    def __init__(self, config=None):
+        self.pipeline_config = config or TrainPipelineConfig()
+        self.stage_report = {}
+
+    def get_stages(self):
+        from src.components.model_trainer import ModelTrainer
+
+        trainer = ModelTrainer()
+        model_names = list(trainer.get_models())
+        ## Split the cores between the fits that run at the same time
+        n_threads = max(1, (os.cpu_count() or 1) // max(1, self.pipeline_config.max_workers))
+
+        stages = [
+            Stage("data_ingestion", run_data_ingestion),
+            Stage("data_transformation", run_data_transformation, ("data_ingestion",),
+                  restore=restore_transformed_data),
+        ]
+        fit_inputs = ("data_transformation",)
+        if trainer.model_trainer_config.evaluation == "kfold":
+            ## The folds are preprocessed once and shared by all the fit stages
+            stages.append(Stage("cv_folds", run_cv_folds, ("data_ingestion",)))
+            fit_inputs = ("data_transformation", "cv_folds")
+
+        ## Fit stages running in threads of one process share its CPU time and peak memory numbers
+        shared_process = self.pipeline_config.max_workers > 1 and self.pipeline_config.backend != "process"
+        fit_stages = [f"fit_{model_name}" for model_name in model_names]
+        for stage_name, model_name in zip(fit_stages, model_names):
+            stages.append(Stage(stage_name, partial(fit_candidate, model_name, n_threads, shared_process), fit_inputs))
+        stages.append(Stage("model_selection", partial(select_model, model_names),
+                            ("data_transformation", *fit_stages)))
+        return stages
+
+    def inputs_key(self):
+        """Stage cache fingerprint of the source data, the component configs and their code."""
+        from src import utils
+        from src.components import cross_validation, data_ingestion, data_transformation
+        from src.components import hyperparameter_search, model_trainer
+        from src.stage_cache import StageCache
+
+        ingestion_config = data_ingestion.DataIngestionConfig()
+        return StageCache().fingerprint(
+            "train_pipeline",
+            inputs=[ingestion_config.source_data_path],
+            config={
+                "data_ingestion": dataclasses.asdict(ingestion_config),
+                "data_transformation": dataclasses.asdict(data_transformation.DataTransformationConfig()),
+                "model_trainer": dataclasses.asdict(model_trainer.ModelTrainerConfig()),
+            },
+            code=[sys.modules[__name__], utils, cross_validation, data_ingestion, data_transformation,
+                  hyperparameter_search, model_trainer],
+        )
+
+    def run(self):
+        """Trains and saves the best model, returns {"best_model", "r2_score", "model_report"}."""
+        try:
+            runner = StageRunner(self.get_stages(), self.pipeline_config, inputs_key=self.inputs_key())
+            outputs = runner.run()
+            self.stage_report = runner.stage_report
+            return outputs["model_selection"]
+        except Exception as e:
+            raise CustomException(e, sys)
+
+
+if __name__ == "__main__":
+    result = TrainPipeline().run()
+    print(f"Best model: {result['best_model']} with R2 {result['r2_score']:.4f}")
@@ -0,0 +1,177 @@
+## Content-addressed cache for the pipeline stages.
+## Every stage computes a fingerprint from its input data, its config and its source code.
+## If an earlier run with the same fingerprint left its outputs in the cache, the stage is
+## skipped and those outputs are reused, so only stages downstream of a real change rerun.
+
+import dataclasses
+import functools
+import hashlib
+import importlib.metadata
+import inspect
+import json
+import os
+import shutil
+import sys
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.exception import CustomException
+from src.logger import logging
+from src.utils import hash_file
+
+
+@dataclass
+class StageCacheConfig:
+    """Configuration class for the stage cache."""
+    cache_dir: str = os.path.join("artifacts", "cache")
+    enabled: bool = True
+    # Older entries of a stage are deleted once it has more than this many
+    max_entries_per_stage: int = 5
+
+
+def _hash_input(digest, value):
+    ## Files are hashed by content, arrays by dtype, shape and bytes
+    if isinstance(value, np.ndarray):
+        digest.update(f"array:{value.dtype.str}:{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif hasattr(value, "tocsr"):  # scipy sparse matrix
+        matrix = value.tocsr()
+        digest.update(f"sparse:{matrix.shape}".encode())
+        for part in (matrix.data, matrix.indices, matrix.indptr):
+            _hash_input(digest, part)
+    elif isinstance(value, str) and os.path.isfile(value):
+        digest.update(f"file:{hash_file(value)}".encode())
+    else:
+        digest.update(json.dumps(value, sort_keys=True, default=str).encode())
+
+
+## Library versions are part of every fingerprint, a pickle from another sklearn version may not even load.
+## Names of the installed distributions: the versions are read from their metadata, the same whether
+## or not the (lazily imported) library was loaded yet
+ENVIRONMENT_PACKAGES = ("numpy", "pandas", "scikit-learn", "xgboost", "catboost", "dill")
+
+
+@functools.lru_cache(maxsize=1)
+def _environment_versions():
+    versions = {}
+    for name in ENVIRONMENT_PACKAGES:
+        try:
+            versions[name] = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            continue  # Not installed, so no stage output can depend on it
+    return versions
+
+
+class StageCache:
+    """Stores and restores the outputs of pipeline stages keyed by their fingerprint."""
+
+    def __init__(self, config=None):
+        self.cache_config = config or StageCacheConfig()
+
+    def fingerprint(self, stage_name, inputs=(), config=None, code=()):
+        """
+        Hash of everything that determines a stage's output:
+        inputs (file paths, arrays or JSON values), config (a dataclass or dict) and
+        code (modules or functions whose source is hashed, so editing a stage invalidates it).
+        """
+        try:
+            digest = hashlib.sha256(stage_name.encode())
+            digest.update(json.dumps(_environment_versions(), sort_keys=True).encode())
+            for value in inputs:
+                _hash_input(digest, value)
+
+            if dataclasses.is_dataclass(config):
+                config = dataclasses.asdict(config)
+            digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+
+            for obj in code:
+                digest.update(inspect.getsource(obj).encode())
+            return digest.hexdigest()
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _entry_dir(self, stage_name, fingerprint):
+        return os.path.join(self.cache_config.cache_dir, stage_name, fingerprint)
+
+    def lookup(self, stage_name, fingerprint):
+        """Returns the cached entry {"files", "arrays", "metadata"} or None on a miss."""
+        if not self.cache_config.enabled:
+            return None
+        entry_dir = self._entry_dir(stage_name, fingerprint)
+        entry_path = os.path.join(entry_dir, "entry.json")
+        if not os.path.exists(entry_path):
+            return None
+        try:
+            with open(entry_path) as file_obj:
+                entry = json.load(file_obj)
+            entry["dir"] = entry_dir
+            os.utime(entry_path)  # Marks the entry as recently used for pruning
+            logging.info(f"Stage cache hit for {stage_name} ({fingerprint[:12]})")
+            return entry
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable cache entry for {stage_name}: {e}")
+            return None
+
+    def restore_files(self, entry, targets):
+        """Copies cached files back to their target paths, name -> path."""
+        try:
+            for name, target_path in targets.items():
+                cached_path = os.path.join(entry["dir"], entry["files"][name])
+                ## Leave the file alone when it already holds the cached content
+                if os.path.exists(target_path) and hash_file(target_path) == entry["hashes"][name]:
+                    continue
+                os.makedirs(os.path.dirname(target_path) or ".", exist_ok=True)
+                tmp_path = f"{target_path}.{os.getpid()}.tmp"
+                shutil.copyfile(cached_path, tmp_path)
+                os.replace(tmp_path, target_path)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def load_array(self, entry, name):
+        """Loads an array stored with the entry."""
+        return np.load(os.path.join(entry["dir"], entry["arrays"][name]), allow_pickle=False)
+
+    def store(self, stage_name, fingerprint, files=None, arrays=None, metadata=None):
+        """Saves a stage's output files (name -> path), arrays (name -> ndarray) and JSON metadata."""
+        if not self.cache_config.enabled:
+            return
+        try:
+            entry_dir = self._entry_dir(stage_name, fingerprint)
+            tmp_dir = f"{entry_dir}.{os.getpid()}.tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+
+            entry = {"stage": stage_name, "created_at": time.time(), "files": {}, "hashes": {}, "arrays": {},
+                     "metadata": metadata or {}}
+            for name, path in (files or {}).items():
+                file_name = f"{name}{os.path.splitext(path)[1]}"
+                shutil.copyfile(path, os.path.join(tmp_dir, file_name))
+                entry["files"][name] = file_name
+                entry["hashes"][name] = hash_file(path)
+            for name, array in (arrays or {}).items():
+                file_name = f"{name}.npy"
+                np.save(os.path.join(tmp_dir, file_name), array, allow_pickle=False)
+                entry["arrays"][name] = file_name
+            ## entry.json is written last, an entry without it is never used
+            with open(os.path.join(tmp_dir, "entry.json"), "w") as file_obj:
+                json.dump(entry, file_obj, indent=2, default=float)
+
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+            self._prune(stage_name)
+        except Exception as e:
+            ## Failing to cache must never fail the pipeline itself
+            logging.warning(f"Could not store {stage_name} in the stage cache: {e}")
+
+    def _prune(self, stage_name):
+        stage_dir = os.path.join(self.cache_config.cache_dir, stage_name)
+        entries = []
+        for name in os.listdir(stage_dir):
+            entry_path = os.path.join(stage_dir, name, "entry.json")
+            if os.path.exists(entry_path):
+                entries.append((os.path.getmtime(entry_path), os.path.join(stage_dir, name)))
+        entries.sort(reverse=True)
+        for _, entry_dir in entries[self.cache_config.max_entries_per_stage:]:
+            shutil.rmtree(entry_dir, ignore_errors=True)
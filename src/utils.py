@@ -1,50 +1,399 @@
 ## Common Functions for the project that are used in multiple files
+import hashlib
+import inspect
+import json
 import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import numpy as np
-import pandas as pd
-import dill
-
-from sklearn.metrics import r2_score
 
 from src.exception import CustomException
 from src.logger import logging
 
-def save_object(file_path, obj):
+## pandas, scipy, dill, sklearn and the hyperparameter search are imported inside the functions
+## that use them: the serving path only needs hash_file / load_object from this module and
+## should not pay for loading the training libraries
+
+## Object files with large NumPy arrays are written as: magic, header length, JSON header,
+## the pickle stream (protocol 5) and then the raw array data ("out-of-band" buffers).
+## load_object can memory-map the file and hand the arrays views into the mapping instead of
+## copies, so worker processes on one host share those pages read-only through the page cache.
+OUT_OF_BAND_MAGIC = b"DILLOOB1"
+## Smaller arrays stay inside the pickle stream, mapping them is not worth a page each
+OUT_OF_BAND_MIN_BYTES = 64 * 1024
+## Array data starts on a 64 byte boundary so every dtype is aligned
+OUT_OF_BAND_ALIGNMENT = 64
+
+def _align(offset):
+    return -(-offset // OUT_OF_BAND_ALIGNMENT) * OUT_OF_BAND_ALIGNMENT
+
+def _dump_out_of_band(obj, file_obj, min_bytes):
+    """Pickles obj with large arrays out-of-band, returns False when there were none to move."""
+    import io
+    import dill
+
+    buffers = []
+    stream = io.BytesIO()
+    pickler = dill.Pickler(stream, protocol=5, buffer_callback=buffers.append)
+
+    ## dill pickles plain arrays through ndarray.__reduce__ (data copied into the stream),
+    ## reducer_override runs before dill's dispatch and uses numpy's protocol 5 reduce instead
+    def reducer_override(value):
+        if type(value) is np.ndarray and value.nbytes >= min_bytes and not value.dtype.hasobject:
+            return value.__reduce_ex__(5)
+        return NotImplemented
+
+    pickler.reducer_override = reducer_override
+    pickler.dump(obj)
+    if not buffers:
+        return False
+
+    pickle_bytes = stream.getbuffer()
+    raw_buffers = [buffer.raw() for buffer in buffers]
+    ## The header length does not depend on the offsets' digits once it is padded, so lay
+    ## the file out with a fixed size header region
+    header_size = _align(len(json.dumps({"pickle": [0, 0], "buffers": [[2 ** 62, 2 ** 62]] * len(buffers)})))
+    offset = len(OUT_OF_BAND_MAGIC) + 8 + header_size
+    header = {"pickle": [offset, len(pickle_bytes)], "buffers": []}
+    offset += len(pickle_bytes)
+    for raw in raw_buffers:
+        offset = _align(offset)
+        header["buffers"].append([offset, raw.nbytes])
+        offset += raw.nbytes
+
+    file_obj.write(OUT_OF_BAND_MAGIC)
+    file_obj.write(header_size.to_bytes(8, "little"))
+    file_obj.write(json.dumps(header).encode().ljust(header_size))
+    file_obj.write(pickle_bytes)
+    for raw, (offset, _) in zip(raw_buffers, header["buffers"]):
+        file_obj.write(b"\0" * (offset - file_obj.tell()))
+        file_obj.write(raw)
+    return True
+
+def save_object(file_path, obj, out_of_band=True):
+    """
+    Pickles obj with dill. With out_of_band, NumPy arrays of at least OUT_OF_BAND_MIN_BYTES
+    are stored as raw data after the pickle stream so load_object(mmap=True) can map them.
+    """
     try:
         dir_path = os.path.dirname(file_path)
 
         os.makedirs(dir_path, exist_ok=True)  # Create directory if it doesn't exist
 
-        with open(file_path, 'wb') as file_obj:
-            dill.dump(obj, file_obj)
+        ## Write to a temporary file first and rename it into place, so a process
+        ## loading the object at the same time never sees a half-written file
+        import dill
+
+        tmp_file_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(tmp_file_path, 'wb') as file_obj:
+            if not (out_of_band and _dump_out_of_band(obj, file_obj, OUT_OF_BAND_MIN_BYTES)):
+                file_obj.seek(0)
+                file_obj.truncate()
+                dill.dump(obj, file_obj)
+        os.replace(tmp_file_path, file_path)
         
     except Exception as e:
         raise CustomException(e, sys)
     
-def load_object(file_path):
+def load_object(file_path, mmap=False):
+    """
+    Loads an object saved by save_object (or any dill/pickle file).
+    With mmap the out-of-band arrays are read-only views into a shared memory mapping of the
+    file, without it they are private writable copies. Objects that copy their arrays while
+    unpickling (sklearn trees, xgboost and catboost boosters) get no sharing either way.
+    """
     try:
+        import dill
+
         with open(file_path, 'rb') as file_obj:
-            return dill.load(file_obj)
+            if file_obj.read(len(OUT_OF_BAND_MAGIC)) != OUT_OF_BAND_MAGIC:
+                file_obj.seek(0)
+                return dill.load(file_obj)
+
+            header_size = int.from_bytes(file_obj.read(8), "little")
+            header = json.loads(file_obj.read(header_size))
+            if mmap:
+                import mmap as mmap_module
+
+                ## The mapping stays valid after the file is replaced, the arrays keep it alive
+                data = memoryview(mmap_module.mmap(file_obj.fileno(), 0, access=mmap_module.ACCESS_READ))
+            else:
+                file_obj.seek(0)
+                data = memoryview(bytearray(file_obj.read()))
+        pickle_offset, pickle_size = header["pickle"]
+        buffers = [data[offset:offset + size] for offset, size in header["buffers"]]
+        return dill.loads(data[pickle_offset:pickle_offset + pickle_size], buffers=buffers)
+    except Exception as e:
+        raise CustomException(e, sys)
+
+## File extension of each supported format for tabular artifacts (train/test/raw data)
+DATAFRAME_FORMATS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+
+def path_for_format(file_path, artifact_format):
+    """Swaps the extension of file_path for the one of artifact_format, e.g. train.csv -> train.parquet."""
+    if artifact_format not in DATAFRAME_FORMATS:
+        raise ValueError(f"Unknown artifact format '{artifact_format}', expected one of {list(DATAFRAME_FORMATS)}")
+    return os.path.splitext(file_path)[0] + DATAFRAME_FORMATS[artifact_format]
+
+def save_dataframe(df, file_path):
+    """
+    Saves a DataFrame in the format given by the file extension.
+    Parquet and Feather (both need pyarrow) are typed columnar files, text columns are
+    stored as categoricals so each distinct value is written once (dictionary encoding).
+    """
+    try:
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        extension = os.path.splitext(file_path)[1]
+        tmp_file_path = f"{file_path}.{os.getpid()}.tmp"
+        if extension == ".csv":
+            df.to_csv(tmp_file_path, index=False, header=True)
+        else:
+            text_columns = df.select_dtypes(include="object").columns
+            df = df.astype({column: "category" for column in text_columns}).reset_index(drop=True)
+            if extension == ".parquet":
+                df.to_parquet(tmp_file_path, index=False)
+            elif extension == ".feather":
+                df.to_feather(tmp_file_path)
+            else:
+                raise ValueError(f"Unsupported data file extension '{extension}'")
+        os.replace(tmp_file_path, file_path)
     except Exception as e:
         raise CustomException(e, sys)
 
-def evaluate_model(X_train, y_train, X_test, y_test, models,param):
+def save_array(file_path, array):
+    """Saves a NumPy array as an .npy file, which np.load can memory-map without copying."""
+    try:
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        tmp_file_path = f"{file_path}.{os.getpid()}.tmp.npy"
+        np.save(tmp_file_path, array, allow_pickle=False)
+        os.replace(tmp_file_path, file_path)
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def save_features(file_path, X):
+    """
+    Saves a feature matrix: dense arrays as .npy, scipy sparse matrices as CSR .npz.
+    The extension of file_path is replaced to match, and a stale file in the other
+    format is removed. Returns the path that was written.
+    """
+    try:
+        from scipy import sparse
+
+        base_path = os.path.splitext(file_path)[0]
+        if sparse.issparse(X):
+            saved_path = base_path + ".npz"
+            os.makedirs(os.path.dirname(saved_path) or ".", exist_ok=True)
+            tmp_file_path = f"{saved_path}.{os.getpid()}.tmp.npz"
+            sparse.save_npz(tmp_file_path, sparse.csr_matrix(X), compressed=False)
+            os.replace(tmp_file_path, saved_path)
+        else:
+            saved_path = base_path + ".npy"
+            save_array(saved_path, X)
+        remove_other_feature_format(saved_path)
+        return saved_path
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def remove_other_feature_format(file_path):
+    """
+    Removes the .npy / .npz file next to file_path that has the other format, so load_features
+    never picks up a matrix of an earlier run. Call it for every features file written or restored.
+    """
+    base_path, extension = os.path.splitext(file_path)
+    stale_path = base_path + (".npy" if extension == ".npz" else ".npz")
+    if os.path.exists(stale_path):
+        os.remove(stale_path)
+
+def load_features(file_path, mmap_mode=None):
+    """Loads a matrix saved by save_features, dense .npy files can be memory-mapped."""
+    try:
+        from scipy import sparse
+
+        base_path = os.path.splitext(file_path)[0]
+        if os.path.exists(base_path + ".npz"):
+            return sparse.load_npz(base_path + ".npz").tocsr()
+        return np.load(base_path + ".npy", mmap_mode=mmap_mode)
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def load_dataframe(file_path):
+    """Loads a DataFrame saved by save_dataframe (or any CSV), picking the reader from the extension."""
+    try:
+        import pandas as pd
+
+        extension = os.path.splitext(file_path)[1]
+        if extension == ".parquet":
+            return pd.read_parquet(file_path)
+        if extension == ".feather":
+            return pd.read_feather(file_path)
+        return pd.read_csv(file_path)
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def hash_file(file_path):
+    """Returns the sha256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file_obj:
+        for chunk in iter(lambda: file_obj.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_artifact_manifest(manifest_path, file_paths):
+    """
+    Records the content hash of artifacts that belong together (e.g. model + preprocessor).
+    The manifest is written last, so readers know the whole set is complete.
+    """
+    try:
+        manifest = {
+            "created_at": time.time(),
+            "files": {path: hash_file(path) for path in file_paths},
+        }
+        tmp_manifest_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_manifest_path, 'w') as file_obj:
+            json.dump(manifest, file_obj, indent=2)
+        os.replace(tmp_manifest_path, manifest_path)
+    except Exception as e:
+        raise CustomException(e, sys)
+
+## Parameters different libraries use for the number of threads a model trains with
+THREAD_COUNT_PARAMS = ("n_jobs", "nthread", "thread_count")
+
+def limit_model_threads(model, n_threads):
+    """
+    Sets every thread-count parameter the model supports (sklearn n_jobs, xgboost nthread,
+    catboost thread_count), so models trained side by side do not oversubscribe the cores.
+    """
+    ## catboost only reports explicitly set params in get_params, so check __init__ as well
+    supported = set(model.get_params()) | set(inspect.signature(type(model).__init__).parameters)
+    thread_params = {key: n_threads for key in THREAD_COUNT_PARAMS if key in supported}
+    if thread_params:
+        model.set_params(**thread_params)
+    return model
+
+def fit_and_score_model(model, X_train, y_train, X_test, y_test, param_grid=None, search_config=None, densify=False,
+                        folds=None, shared_process=False):
+    """
+    Searches the model's hyperparameters (if a grid is given), fits it and scores it on the test data.
+    Returns (fitted model, result) where result holds the R2 score, timings and best parameters, or the error.
+    The fit and the test predict are each measured with ResourceUsage: wall time ("fit_time"), CPU time
+    ("fit_cpu_time") and peak memory ("fit_peak_memory_mb"), and the same for predict. CPU time and peak
+    memory are None with shared_process=True (other fits run in this process at the same time).
+    densify converts sparse features to dense arrays for models that cannot take sparse input.
+    With folds (CrossValidationFolds) the search is scored on the folds and result["cv"] holds the
+    k-fold R2 scores of the chosen parameters ({"scores", "r2_mean", "r2_std", "fit_time", "predict_time"}).
+    Defined at module level so it can be sent to a process pool.
+    """
+    result = {
+        "r2_score": None, "fit_time": None, "predict_time": None, "error": None,
+        "best_params": {}, "search": None, "cv": None,
+        "fit_cpu_time": None, "fit_peak_memory_mb": None, "predict_cpu_time": None, "predict_peak_memory_mb": None,
+    }
+    try:
+        from scipy import sparse
+        from sklearn.metrics import r2_score
+        from src.components.hyperparameter_search import HyperparameterSearch
+        from src.components.training_profiler import ResourceUsage
+
+        if densify and sparse.issparse(X_train):
+            X_train, X_test = X_train.toarray(), X_test.toarray()
+
+        if param_grid:
+            if folds is not None:
+                search = HyperparameterSearch(search_config).search_folds(model, param_grid, folds, densify)
+            else:
+                search = HyperparameterSearch(search_config).search(model, param_grid, X_train, y_train)
+            result["search"] = search
+            result["best_params"] = search["best_params"]
+            model.set_params(**search["best_params"])
+
+        if folds is not None:
+            from src.components.cross_validation import cross_validate
+            result["cv"] = cross_validate(model, folds, densify)
+
+        with ResourceUsage(shared_process) as usage:
+            model.fit(X_train, y_train)
+        result["fit_time"], result["fit_cpu_time"], result["fit_peak_memory_mb"] = (
+            usage.wall_time, usage.cpu_time, usage.peak_memory_mb
+        )
+
+        with ResourceUsage(shared_process) as usage:
+            y_pred = model.predict(X_test)
+        result["predict_time"], result["predict_cpu_time"], result["predict_peak_memory_mb"] = (
+            usage.wall_time, usage.cpu_time, usage.peak_memory_mb
+        )
+
+        result["r2_score"] = r2_score(y_test, y_pred)
+    except Exception as e:
+        result["error"] = str(e)
+    return model, result
+
+def evaluate_model(X_train, y_train, X_test, y_test, models, param, n_jobs=1, backend="process", search_config=None,
+                   dense_models=(), folds=None):
     """
     Evaluate the performance of different regression models and return a report.
+    The report maps model name -> {"r2_score", "fit_time", "predict_time", "error", "best_params", "search", "cv"}
+    plus the CPU time and peak memory of the fit and predict, see fit_and_score_model.
+    With folds (CrossValidationFolds) every model is also cross-validated on those shared folds, see
+    fit_and_score_model.
+
+    `param` maps model name -> hyperparameter grid. Models with a grid are tuned with
+    HyperparameterSearch (configured by search_config) on the training data before the final fit.
+    X may be a scipy sparse matrix, models named in dense_models get a dense copy instead.
+
+    With n_jobs > 1 (or -1 for all cores) the models are fitted in parallel in a process
+    or thread pool. The models in `models` are replaced by their fitted versions and the
+    report keeps the order of `models`, whatever order the fits finish in.
     """
+    from src.components.hyperparameter_search import resolve_param_grids
+
     report = {}
     logging.info("Evaluating models...")
-    for model_name, model in models.items():
-        try:
-            
-            model.fit(X_train, y_train)
-            y_pred = model.predict(X_test)
-            r2_square = r2_score(y_test, y_pred)
-            report[model_name] = r2_square
-        except Exception as e:
-            report[model_name] = str(e)
+    param_grids = resolve_param_grids(models, param or {})
+
+    cpu_count = os.cpu_count() or 1
+    ## Never more workers than models, each process worker gets its own copy of the data
+    n_workers = max(1, min(cpu_count if n_jobs == -1 else n_jobs, len(models)))
+
+    if n_workers == 1:
+        for model_name, model in models.items():
+            models[model_name], report[model_name] = fit_and_score_model(
+                model, X_train, y_train, X_test, y_test, param_grids[model_name], search_config,
+                model_name in dense_models, folds
+            )
+    else:
+        ## Split the cores between the workers so each model trains with its own share
+        threads_per_model = max(1, cpu_count // n_workers)
+        for model in models.values():
+            limit_model_threads(model, threads_per_model)
+
+        executor_class = ProcessPoolExecutor if backend == "process" else ThreadPoolExecutor
+        logging.info(f"Fitting models with {n_workers} {backend} workers, {threads_per_model} threads each")
+        ## A process worker fits one model at a time, threads share the process and its CPU / memory numbers
+        shared_process = backend != "process"
+        with executor_class(max_workers=n_workers) as executor:
+            futures = {
+                model_name: executor.submit(
+                    fit_and_score_model, model, X_train, y_train, X_test, y_test,
+                    param_grids[model_name], search_config, model_name in dense_models, folds, shared_process
+                )
+                for model_name, model in models.items()
+            }
+            for model_name, future in futures.items():
+                models[model_name], report[model_name] = future.result()
+
+    for model_name, result in report.items():
+        if result["error"] is not None:
+            logging.info(f"{model_name} failed: {result['error']}")
+        else:
+            cv = result["cv"]
+            cv_summary = f" cv_r2={cv['r2_mean']:.4f}+-{cv['r2_std']:.4f}" if cv else ""
+            logging.info(
+                f"{model_name}: r2={result['r2_score']:.4f}{cv_summary} fit={result['fit_time']:.3f}s "
+                f"fit_cpu={result['fit_cpu_time']}s fit_peak={result['fit_peak_memory_mb']}MB "
+                f"best_params={result['best_params']}"
+            )
 
     logging.info("Model evaluation complete.")
-    return report
\ No newline at end of file
+    return report
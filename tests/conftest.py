@@ -0,0 +1,76 @@
+## Shared fixtures: the student dataset shipped in notebook/data and a preprocessor fitted on it.
+## The log files of the modules under test go to a temporary folder, not to ./logs
+
+import importlib
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("LOG_DIR", tempfile.mkdtemp(prefix="student-performance-logs-"))
+
+import pandas as pd
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_PATH = os.path.join(REPO_ROOT, "notebook", "data", "stud.csv")
+
+
+@pytest.fixture(scope="session")
+def student_df():
+    return pd.read_csv(DATA_PATH)
+
+
+@pytest.fixture(scope="session")
+def fitted_preprocessor(student_df):
+    from src.components.data_transformation import TARGET_COLUMN, DataTransformation
+
+    preprocessor = DataTransformation().get_data_transformer_object()
+    return preprocessor.fit(student_df.drop(columns=[TARGET_COLUMN]))
+
+
+@pytest.fixture(scope="session")
+def training_data(student_df, fitted_preprocessor):
+    """(X, y) of the whole dataset, dense."""
+    from src.components.data_transformation import TARGET_COLUMN
+
+    X = fitted_preprocessor.transform(student_df.drop(columns=[TARGET_COLUMN]))
+    return X, student_df[TARGET_COLUMN].to_numpy(dtype=float)
+
+
+@pytest.fixture(scope="session")
+def encoder(fitted_preprocessor):
+    from src.pipeline.model_registry import compile_encoder
+
+    compiled = compile_encoder(fitted_preprocessor)
+    assert compiled is not None
+    return compiled
+
+
+@pytest.fixture(scope="module")
+def app_module(tmp_path_factory, training_data, fitted_preprocessor):
+    """
+    application.py imported in a folder with freshly saved artifacts, without the prediction cache.
+    The registry reads the artifacts relative to the working directory, so the module's tests run there.
+    """
+    from sklearn.linear_model import LinearRegression
+
+    from src.pipeline import model_registry as registry_module
+    from src.pipeline.model_registry import ModelRegistryConfig
+    from src.utils import save_object, write_artifact_manifest
+
+    X, y = training_data
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(tmp_path_factory.mktemp("app"))
+        monkeypatch.setenv("PREDICT_CACHE", "0")
+        monkeypatch.delenv("PREDICT_BATCHING", raising=False)
+        config = ModelRegistryConfig()
+        os.makedirs(os.path.dirname(config.model_file_path))
+        save_object(config.model_file_path, LinearRegression().fit(X, y))
+        save_object(config.preprocessor_file_path, fitted_preprocessor)
+        write_artifact_manifest(config.manifest_file_path, [config.model_file_path, config.preprocessor_file_path])
+        ## The registry is created and loaded when application.py is imported
+        monkeypatch.setattr(registry_module, "_model_registry", None)
+        monkeypatch.delitem(sys.modules, "application", raising=False)
+        application = importlib.import_module("application")
+        yield application
+        sys.modules.pop("application", None)
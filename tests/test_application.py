@@ -0,0 +1,80 @@
+
+import numpy as np
+import pytest
+
+from src.pipeline.schema import CATEGORY_ERROR, FEATURE_COLUMNS, NUMBER_ERROR, RANGE_ERROR
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture(scope="module")
+def records(student_df):
+    return student_df[FEATURE_COLUMNS].head(20).to_dict("records")
+
+
+def test_valid_batch_is_scored(client, app_module, records, training_data):
+    X, _ = training_data
+    model = app_module.model_registry.get().model
+
+    response = client.post("/predict", json={"records": records})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["errors"] == []
+    np.testing.assert_allclose(body["predictions"], model.predict(X[:20]), atol=1e-9)
+    ## A plain list is accepted as well
+    assert client.post("/predict", json=records).get_json() == body
+
+
+def test_invalid_fields_are_reported_per_record(client, records):
+    bad = [records[0], dict(records[1], gender="", reading_score="abc"), dict(records[2], writing_score=120)]
+
+    response = client.post("/predict", json={"records": bad})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["predictions"][0] is not None and body["predictions"][1:] == [None, None]
+    assert body["errors"] == [
+        {"index": 1, "errors": {"gender": CATEGORY_ERROR, "reading_score": NUMBER_ERROR}},
+        {"index": 2, "errors": {"writing_score": RANGE_ERROR}},
+    ]
+
+
+@pytest.mark.parametrize("body", [{"records": "not a list"}, {"rows": []}, "text"])
+def test_body_without_records_is_a_bad_request(client, body):
+    assert client.post("/predict", json=body).status_code == 400
+
+
+def test_invalid_form_is_a_bad_request(client, records):
+    form = {column: str(value) for column, value in records[0].items()}
+    form["ethnicity"] = form.pop("race_ethnicity")  # Field name used by templates/home.html
+    form["writing_score"] = "abc"
+
+    response = client.post("/predictdata", data=form)
+
+    assert response.status_code == 400
+    assert response.get_data(as_text=True) == f"Invalid input: writing_score {NUMBER_ERROR}"
+
+
+def test_too_many_records_are_rejected(client, app_module, records, monkeypatch):
+    monkeypatch.setattr(app_module, "MAX_BATCH_RECORDS", 10)
+
+    response = client.post("/predict", json=records[:11])
+
+    assert response.status_code == 413
+    assert client.post("/predict", json=records[:10]).status_code == 200
+
+
+def test_single_rows_match_the_batch(client, app_module, records):
+    batch = client.post("/predict", json=records).get_json()["predictions"]
+    pipeline = app_module.PredictPipeline(registry=app_module.model_registry)
+
+    singles = [client.post("/predict", json=[record]).get_json()["predictions"][0] for record in records]
+    rows = [[record[column] for column in FEATURE_COLUMNS] for record in records]
+
+    np.testing.assert_allclose(singles, batch, atol=1e-9)
+    np.testing.assert_allclose([pipeline.predict_row(row) for row in rows], batch, atol=1e-9)
+    np.testing.assert_allclose(pipeline.predict_rows(rows), batch, atol=1e-9)
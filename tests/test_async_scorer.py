@@ -0,0 +1,110 @@
+import asyncio
+import importlib
+import json
+import sys
+import threading
+
+import pytest
+
+from src.pipeline.async_scorer import AsyncScorer, AsyncScorerConfig, ScorerBusyError
+
+
+class _BlockingPipeline:
+    """Stands in for PredictPipeline, every call waits until release is set."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def predict_batch(self, records):
+        self.release.wait(timeout=10)
+        return [float(len(records))] * len(records), []
+
+    def predict_row(self, row):
+        self.release.wait(timeout=10)
+        return 1.0
+
+
+def _scorer(max_pending):
+    pipeline = _BlockingPipeline()
+    scorer = AsyncScorer(pipeline=pipeline, config=AsyncScorerConfig(backend="thread", max_workers=1,
+                                                                     max_pending=max_pending))
+    scorer.start()
+    return scorer, pipeline
+
+
+async def _wait_for_pending(scorer, n_pending):
+    while scorer.pending < n_pending:
+        await asyncio.sleep(0.001)
+
+
+def test_requests_above_max_pending_are_rejected():
+    scorer, pipeline = _scorer(max_pending=2)
+
+    async def run():
+        waiting = [asyncio.ensure_future(scorer.predict_batch([{}])) for _ in range(2)]
+        await _wait_for_pending(scorer, 2)
+        with pytest.raises(ScorerBusyError):
+            await scorer.predict_row(["row"])
+        pipeline.release.set()
+        return await asyncio.gather(*waiting)
+
+    try:
+        assert asyncio.run(run()) == [([1.0], [])] * 2
+        assert scorer.pending == 0
+    finally:
+        pipeline.release.set()
+        scorer.close()
+
+
+@pytest.fixture
+def asgi_app(monkeypatch):
+    monkeypatch.setenv("PREDICT_CACHE", "0")
+    monkeypatch.delitem(sys.modules, "asgi_app", raising=False)
+    module = importlib.import_module("asgi_app")
+    yield module
+    sys.modules.pop("asgi_app", None)
+
+
+async def _request(app, path, body):
+    messages = []
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            await asyncio.sleep(3600)  # Never disconnects
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app({"type": "http", "method": "POST", "path": path}, receive, send)
+    start, body_message = messages
+    return start["status"], dict(start["headers"]), body_message["body"]
+
+
+def test_full_pool_answers_503(asgi_app, monkeypatch):
+    scorer, pipeline = _scorer(max_pending=1)
+    monkeypatch.setattr(asgi_app, "scorer", scorer)
+    body = json.dumps([{"gender": "female"}]).encode()
+
+    async def run():
+        first = asyncio.ensure_future(_request(asgi_app.app, "/predict", body))
+        await _wait_for_pending(scorer, 1)
+        busy = await _request(asgi_app.app, "/predict", body)
+        pipeline.release.set()
+        return await first, busy
+
+    try:
+        (first_status, _, first_body), (status, headers, busy_body) = asyncio.run(run())
+    finally:
+        pipeline.release.set()
+        scorer.close()
+
+    assert first_status == 200
+    assert json.loads(first_body) == {"predictions": [1.0], "errors": []}
+    assert status == 503
+    assert headers[b"retry-after"] == b"1"
+    assert json.loads(busy_body) == {"error": "Server busy, retry later"}
+    assert asgi_app.metrics.errors.get("predict", "overloaded") >= 1
@@ -0,0 +1,71 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from src.pipeline.batcher import PredictionBatcher, PredictionBatcherConfig
+
+
+def _batcher(predict_fn, max_wait_ms=1000):
+    ## A long window and a batch size of 3 put the three rows below into one batch
+    return PredictionBatcher(predict_fn, PredictionBatcherConfig(max_batch_size=3, max_wait_ms=max_wait_ms))
+
+
+def test_each_caller_gets_its_own_prediction():
+    batcher = _batcher(lambda rows: [row * 2 for row in rows])
+    futures = [batcher.submit(row) for row in (1, 2, 3)]
+
+    assert [future.result(timeout=5) for future in futures] == [2, 4, 6]
+    assert batcher.metrics.snapshot()["batch_size_counts"] == {3: 1}
+
+
+def test_wrong_number_of_predictions_fails_the_whole_batch():
+    batcher = _batcher(lambda rows: rows[:-1])
+    futures = [batcher.submit(row) for row in (1, 2, 3)]
+
+    for future in futures:
+        with pytest.raises(ValueError, match="2 predictions for 3 rows"):
+            future.result(timeout=5)
+
+
+def _dead_thread():
+    thread = threading.Thread(target=lambda: None)
+    thread.start()
+    thread.join()
+    return thread
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_rows_waiting_for_a_dead_worker_are_scored_by_the_next_one():
+    calls = []
+
+    def predict_fn(rows):
+        calls.append(list(rows))
+        if len(calls) == 1:
+            raise SystemExit  # Ends the worker thread
+        return [row * 2 for row in rows]
+
+    batcher = _batcher(predict_fn, max_wait_ms=1)
+    with pytest.raises(SystemExit):
+        batcher.submit(1).result(timeout=5)
+    batcher._worker.join(timeout=5)
+    ## A row that was queued while the worker was going away
+    waiting = Future()
+    batcher._queue.put((2, waiting, time.perf_counter()))
+
+    assert batcher.submit(3).result(timeout=5) == 6
+    assert waiting.result(timeout=5) == 4
+
+
+def test_forked_child_does_not_score_the_rows_of_the_parent():
+    calls = []
+    batcher = _batcher(lambda rows: calls.append(list(rows)) or [row * 2 for row in rows], max_wait_ms=1)
+    ## State as inherited by a child: the parent's worker is gone and its rows are in the queue
+    batcher._worker, batcher._worker_pid = _dead_thread(), -1
+    parent_future = Future()
+    batcher._queue.put((1, parent_future, time.perf_counter()))
+
+    assert batcher.submit(2).result(timeout=5) == 4
+    assert calls == [[2]]
+    assert not parent_future.done()
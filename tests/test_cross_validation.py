@@ -0,0 +1,68 @@
+import pickle
+
+import numpy as np
+import pytest
+from sklearn.linear_model import LinearRegression
+from sklearn.model_selection import KFold, cross_val_score
+from sklearn.pipeline import make_pipeline
+from sklearn.tree import DecisionTreeRegressor
+
+from src.components.cross_validation import cross_validate
+from src.components.data_transformation import TARGET_COLUMN, DataTransformation
+
+
+@pytest.fixture
+def folds_setup(tmp_path, monkeypatch, student_df):
+    """Folds of the training data, preprocessed in a temporary folder."""
+    monkeypatch.chdir(tmp_path)
+    train_path = str(tmp_path / "train.csv")
+    student_df.to_csv(train_path, index=False)
+    transformation = DataTransformation()
+    return transformation, train_path, transformation.initiate_cv_folds(train_path)
+
+
+def _sklearn_scores(transformation, student_df, model):
+    cv_config = transformation.data_transformation_config.cv_config
+    kfold = KFold(n_splits=cv_config.n_splits, shuffle=cv_config.shuffle, random_state=cv_config.random_state)
+    pipeline = make_pipeline(transformation.get_data_transformer_object(), model)
+    return cross_val_score(pipeline, student_df.drop(columns=[TARGET_COLUMN]), student_df[TARGET_COLUMN],
+                           cv=kfold, scoring="r2")
+
+
+@pytest.mark.parametrize("model", [LinearRegression(), DecisionTreeRegressor(max_depth=4, random_state=0)])
+def test_scores_match_cross_val_score(folds_setup, student_df, model):
+    transformation, _, folds = folds_setup
+
+    result = cross_validate(model, folds)
+
+    expected = _sklearn_scores(transformation, student_df, model)
+    np.testing.assert_allclose(result["scores"], expected, rtol=1e-9)
+    assert result["r2_mean"] == pytest.approx(expected.mean())
+    assert result["r2_std"] == pytest.approx(expected.std())
+
+
+def test_folds_are_loaded_lazily_and_pickled_as_paths(folds_setup):
+    _, _, folds = folds_setup
+    assert len(folds) == 5
+    assert folds._loaded == {}
+
+    X_fit, y_fit, X_val, y_val = folds[2]
+
+    assert list(folds._loaded) == [2]
+    assert isinstance(y_fit, np.memmap)
+    assert X_fit.shape[0] + X_val.shape[0] == 1000
+    restored = pickle.loads(pickle.dumps(folds))
+    assert restored._loaded == {}
+    for original, copy in zip(folds[2], restored[2]):
+        np.testing.assert_array_equal(np.asarray(original), np.asarray(copy))
+
+
+def test_cached_folds_are_restored(folds_setup, monkeypatch):
+    transformation, train_path, folds = folds_setup
+    expected = [np.asarray(part).copy() for part in folds[0]]
+
+    monkeypatch.setattr(transformation, "get_data_transformer_object", lambda: pytest.fail("folds were refitted"))
+    restored = transformation.initiate_cv_folds(train_path)
+
+    for original, copy in zip(expected, restored[0]):
+        np.testing.assert_array_equal(original, np.asarray(copy))
@@ -0,0 +1,63 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.linear_model import LinearRegression
+from sklearn.tree import DecisionTreeRegressor
+
+from src import utils
+from src.utils import evaluate_model
+
+
+class _FailingRegressor(RegressorMixin, BaseEstimator):
+    def fit(self, X, y):
+        raise ValueError("cannot fit")
+
+
+def _models():
+    return {
+        "LinearRegression": LinearRegression(),
+        "DecisionTreeRegressor": DecisionTreeRegressor(max_depth=4, random_state=0),
+        "Failing": _FailingRegressor(),
+    }
+
+
+def _split(training_data):
+    X, y = training_data
+    return X[:800], y[:800], X[800:], y[800:]
+
+
+def _comparable(report):
+    ## Timings and resource numbers differ from run to run
+    return {name: (result["r2_score"], result["error"], result["best_params"]) for name, result in report.items()}
+
+
+@pytest.mark.parametrize("backend", ["process", "thread"])
+def test_parallel_report_matches_the_serial_one(backend, training_data):
+    serial = evaluate_model(*_split(training_data), models=_models(), param={})
+
+    models = _models()
+    parallel = evaluate_model(*_split(training_data), models=models, param={}, n_jobs=2, backend=backend)
+
+    assert list(parallel) == list(serial)
+    assert _comparable(parallel) == _comparable(serial)
+    assert parallel["Failing"]["error"] == "cannot fit"
+    assert serial["LinearRegression"]["r2_score"] > 0.8
+    ## The fitted models come back from the workers
+    assert hasattr(models["DecisionTreeRegressor"], "tree_")
+
+
+def test_no_more_workers_than_models(training_data, monkeypatch):
+    pool_sizes = []
+
+    class _Executor(ThreadPoolExecutor):
+        def __init__(self, max_workers):
+            pool_sizes.append(max_workers)
+            super().__init__(max_workers=max_workers)
+
+    monkeypatch.setattr(utils, "ThreadPoolExecutor", _Executor)
+    monkeypatch.setattr(utils.os, "cpu_count", lambda: 64)
+
+    evaluate_model(*_split(training_data), models=_models(), param={}, n_jobs=-1, backend="thread")
+
+    assert pool_sizes == [3]
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+from src.components.data_transformation import TARGET_COLUMN
+from src.pipeline.fast_encoder import FastEncoder
+from src.pipeline.model_registry import compile_encoder
+from src.pipeline.schema import FEATURE_COLUMNS, coerce_records
+
+
+def test_matches_column_transformer(student_df, fitted_preprocessor):
+    features = student_df.drop(columns=[TARGET_COLUMN])
+    encoder = FastEncoder.from_preprocessor(fitted_preprocessor)
+
+    assert np.array_equal(encoder.transform(features), fitted_preprocessor.transform(features))
+
+
+def test_matches_column_transformer_with_missing_and_unknown_values(student_df, fitted_preprocessor):
+    features = student_df.drop(columns=[TARGET_COLUMN]).head(20).copy()
+    features.loc[0, "gender"] = None
+    features.loc[1, "lunch"] = np.nan
+    features.loc[2, "race_ethnicity"] = "group Z"  # Not seen in training, encoded as all zeros
+    features.loc[3, "reading_score"] = np.nan
+    encoder = FastEncoder.from_preprocessor(fitted_preprocessor)
+
+    assert np.array_equal(encoder.transform(features), fitted_preprocessor.transform(features))
+
+
+def test_row_and_column_inputs_match_the_frame(student_df, fitted_preprocessor):
+    features = student_df[FEATURE_COLUMNS].head(50)
+    encoder = FastEncoder.from_preprocessor(fitted_preprocessor)
+    expected = fitted_preprocessor.transform(features)
+
+    rows = features.values.tolist()
+    assert np.array_equal(encoder.transform_records(rows, columns=FEATURE_COLUMNS), expected)
+    columns = {column: features[column].tolist() for column in FEATURE_COLUMNS}
+    assert np.array_equal(encoder.transform_columns(columns), expected)
+
+
+def test_categorical_columns_from_the_schema_match_lists(student_df, fitted_preprocessor):
+    records = student_df[FEATURE_COLUMNS].head(50).to_dict("records")
+    records[0]["gender"] = "  male "  # Stripped by the schema
+    columns, valid_indices, errors = coerce_records(records)
+    assert errors == [] and valid_indices == list(range(50))
+    encoder = FastEncoder.from_preprocessor(fitted_preprocessor)
+
+    as_lists = {column: list(values) for column, values in columns.items()}
+    assert np.array_equal(encoder.transform_columns(columns), encoder.transform_columns(as_lists))
+    expected = fitted_preprocessor.transform(pd.DataFrame(as_lists, columns=FEATURE_COLUMNS))
+    assert np.array_equal(encoder.transform_columns(columns), expected)
+
+
+def test_arrays_round_trip(fitted_preprocessor, student_df):
+    features = student_df.drop(columns=[TARGET_COLUMN]).head(10)
+    encoder = FastEncoder.from_preprocessor(fitted_preprocessor)
+    restored = FastEncoder.from_arrays(encoder.to_arrays())
+
+    assert np.array_equal(restored.transform(features), encoder.transform(features))
+
+
+class _FailingTransform:
+    """A preprocessor that compiles but cannot transform, e.g. pickled with another sklearn."""
+
+    def __init__(self, preprocessor):
+        self.preprocessor = preprocessor
+
+    def __getattr__(self, name):
+        return getattr(self.preprocessor, name)
+
+    def transform(self, X):
+        raise ValueError("unexpected dtype")
+
+
+def test_failing_probe_falls_back_to_the_preprocessor(fitted_preprocessor):
+    FastEncoder.from_preprocessor(_FailingTransform(fitted_preprocessor))  # Compiling itself works
+    assert compile_encoder(_FailingTransform(fitted_preprocessor)) is None
@@ -0,0 +1,126 @@
+import time
+
+import numpy as np
+import pytest
+from scipy import sparse
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import r2_score
+
+from src.components.hyperparameter_search import HyperparameterSearch, HyperparameterSearchConfig
+from src.utils import fit_and_score_model
+
+## Shifted predictions only get worse, so offset 0 is the true best of every grid below
+OFFSETS = [-16, -8, -4, -2, 0, 2, 4, 8, 16]
+
+
+class _Shifted(RegressorMixin, BaseEstimator):
+    """LinearRegression whose predictions are moved by `offset`, optionally slow or dense-only."""
+
+    def __init__(self, offset=0.0, delay=0.0, dense_only=False):
+        self.offset = offset
+        self.delay = delay
+        self.dense_only = dense_only
+
+    def fit(self, X, y):
+        if self.dense_only and sparse.issparse(X):
+            raise TypeError("dense data is required")
+        time.sleep(self.delay)
+        self.model_ = LinearRegression().fit(X, y)
+        return self
+
+    def predict(self, X):
+        if self.dense_only and sparse.issparse(X):
+            raise TypeError("dense data is required")
+        return self.model_.predict(X) + self.offset
+
+
+def _search(**config):
+    return HyperparameterSearch(HyperparameterSearchConfig(**config))
+
+
+def _folds(X, y, n_folds=3):
+    folds = []
+    for val_idx in np.array_split(np.arange(len(y)), n_folds):
+        fit_mask = np.ones(len(y), dtype=bool)
+        fit_mask[val_idx] = False
+        folds.append((X[fit_mask], y[fit_mask], X[val_idx], y[val_idx]))
+    return folds
+
+
+@pytest.mark.parametrize("strategy", ["halving", "grid", "random"])
+def test_true_best_of_the_grid_is_found(strategy, training_data):
+    X, y = training_data
+
+    result = _search(strategy=strategy, n_iter=len(OFFSETS)).search(_Shifted(), {"offset": OFFSETS}, X, y)
+
+    assert result["best_params"] == {"offset": 0}
+    assert result["n_candidates"] == len(OFFSETS)
+
+
+def test_halving_prunes_on_the_small_rungs(training_data):
+    X, y = training_data
+
+    result = _search(strategy="halving", halving_factor=3).search(_Shifted(), {"offset": OFFSETS}, X, y)
+
+    ## 9 candidates, then 3, then 1
+    assert result["n_evaluated"] == 9 + 3 + 1
+    assert result["n_pruned"] == 6 + 2
+
+
+def test_grid_prunes_clearly_losing_candidates(training_data):
+    X, y = training_data
+
+    result = _search(strategy="grid", prune_margin=0.05).search(_Shifted(), {"offset": [0, 16, 32]}, X, y)
+
+    assert result["best_params"] == {"offset": 0}
+    assert result["n_pruned"] == 2
+    assert result["n_evaluated"] == 3
+
+
+def test_time_budget_stops_the_search(training_data):
+    X, y = training_data
+    model = _Shifted(delay=0.05)
+
+    result = _search(strategy="grid", time_budget=0.2).search(model, {"offset": OFFSETS * 4}, X, y)
+
+    assert 0 < result["n_evaluated"] < len(OFFSETS)
+    assert result["search_time"] < 1.0
+    ## The best candidate seen before the budget ran out is kept
+    assert result["best_params"]
+
+
+def test_no_finite_score_keeps_the_defaults(training_data):
+    X, y = training_data
+    X_sparse = sparse.csr_matrix(X)
+
+    result = _search(strategy="grid").search(_Shifted(dense_only=True), {"offset": [0, 2]}, X_sparse, y)
+
+    assert result["best_params"] == {} and result["best_score"] is None
+    assert result["n_evaluated"] == 2
+
+
+@pytest.mark.parametrize("strategy", ["halving", "grid"])
+def test_dense_only_model_is_searched_on_dense_folds(strategy, training_data):
+    X, y = training_data
+    folds = _folds(sparse.csr_matrix(X), y)
+    search = _search(strategy=strategy)
+
+    assert search.search_folds(_Shifted(dense_only=True), {"offset": OFFSETS}, folds)["best_params"] == {}
+    result = search.search_folds(_Shifted(dense_only=True), {"offset": OFFSETS}, folds, densify=True)
+    assert result["best_params"] == {"offset": 0}
+
+
+def test_fit_and_score_model_densifies_the_folds(training_data):
+    X, y = training_data
+    X_sparse = sparse.csr_matrix(X)
+    folds = _folds(X_sparse[:800], y[:800])
+
+    model, result = fit_and_score_model(
+        _Shifted(dense_only=True), X_sparse[:800], y[:800], X_sparse[800:], y[800:],
+        param_grid={"offset": [0, 8]}, densify=True, folds=folds,
+    )
+
+    assert result["error"] is None
+    assert result["best_params"] == {"offset": 0}
+    assert result["r2_score"] == pytest.approx(r2_score(y[800:], model.predict(X[800:])))
@@ -0,0 +1,185 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.linear_model import LinearRegression
+
+from src.components.data_ingestion import DataIngestionConfig
+from src.components.data_transformation import TARGET_COLUMN, DataTransformation, DataTransformationConfig
+from src.components.incremental_update import IncrementalUpdateConfig, IncrementalUpdater
+from src.pipeline.model_registry import compile_encoder
+from src.utils import hash_file, load_object, save_object
+
+## Rows of the dataset the "last full run" trained on, the others are appended by the tests
+N_TRAINED = 600
+
+
+class _Updater(IncrementalUpdater):
+    """Records full re-selections instead of running the whole TrainPipeline."""
+
+    def full_retrain(self, reason, history=()):
+        self.full_reasons.append(reason)
+        return {"action": "full", "reason": reason}
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch, student_df):
+    """Artifacts and source data of a finished run, in a temporary working directory."""
+    monkeypatch.chdir(tmp_path)
+    source_path = DataIngestionConfig().source_data_path
+    os.makedirs(os.path.dirname(source_path))
+    student_df.iloc[:N_TRAINED].to_csv(source_path, index=False)
+    return source_path
+
+
+def _start(student_df, model, reference_r2=0.5, **config):
+    """Saves preprocessor, model and the updater state as a full run would, returns the updater."""
+    train_df = student_df.iloc[:N_TRAINED]
+    preprocessor = DataTransformation().get_data_transformer_object().fit(train_df.drop(columns=[TARGET_COLUMN]))
+    model.fit(preprocessor.transform(train_df), train_df[TARGET_COLUMN])
+    save_object(DataTransformationConfig().preprocessor_obj_file_path, preprocessor)
+
+    updater = _Updater(IncrementalUpdateConfig(**config))
+    updater.full_reasons = []
+    ## The prediction table is not needed here and takes most of the export time
+    updater.trainer.model_trainer_config.export_prediction_table = False
+    save_object(updater.trainer.model_trainer_config.trained_model_file_path, model)
+
+    source_path = updater.update_config.source_data_path
+    offset = os.path.getsize(source_path)
+    with open(source_path) as file_obj:
+        columns = file_obj.readline().strip().replace('"', "").split(",")
+    updater._save_state({
+        "source_path": source_path,
+        "source_offset": offset,
+        "source_tail_hash": updater._tail_hash(offset),
+        "columns": columns,
+        "best_model": type(model).__name__,
+        "reference_r2": reference_r2,
+        **updater._running_statistics(train_df, compile_encoder(preprocessor), model),
+        "history": [],
+    })
+    return updater
+
+
+def _append(source_path, rows):
+    rows.to_csv(source_path, mode="a", header=False, index=False)
+
+
+def _state(updater):
+    with open(updater.update_config.state_file_path) as file_obj:
+        return json.load(file_obj)
+
+
+def test_without_a_previous_run_everything_is_retrained(workspace):
+    updater = _Updater()
+    updater.full_reasons = []
+
+    assert updater.initiate_incremental_update()["action"] == "full"
+    assert updater.full_reasons == ["no previous run to continue from"]
+
+
+def test_no_new_rows(workspace, student_df):
+    updater = _start(student_df, LinearRegression())
+
+    assert updater.initiate_incremental_update() == {"action": "none", "reason": "no new rows"}
+
+
+def test_rewritten_source_is_retrained(workspace, student_df):
+    updater = _start(student_df, LinearRegression())
+    student_df.iloc[100:N_TRAINED + 50].to_csv(workspace, index=False)
+
+    assert updater.initiate_incremental_update()["action"] == "full"
+    assert updater.full_reasons == ["the source was rewritten, not appended to"]
+
+
+def test_too_many_new_rows_are_retrained(workspace, student_df):
+    updater = _start(student_df, LinearRegression(), max_new_fraction=0.1)
+    _append(workspace, student_df.iloc[N_TRAINED:N_TRAINED + 100])
+
+    assert updater.initiate_incremental_update()["action"] == "full"
+    assert "more than 10%" in updater.full_reasons[0]
+
+
+def test_new_category_is_retrained(workspace, student_df):
+    updater = _start(student_df, LinearRegression())
+    rows = student_df.iloc[N_TRAINED:N_TRAINED + 5].copy()
+    rows["lunch"] = "none"
+    _append(workspace, rows)
+
+    updater.initiate_incremental_update()
+    assert updater.full_reasons == ["new categories in lunch: ['none']"]
+
+
+def test_shifted_scores_are_retrained(workspace, student_df):
+    updater = _start(student_df, LinearRegression())
+    rows = student_df.iloc[N_TRAINED:N_TRAINED + 60].copy()
+    rows[TARGET_COLUMN] = np.clip(rows[TARGET_COLUMN] + 30, 0, 100)
+    _append(workspace, rows)
+
+    updater.initiate_incremental_update()
+    assert updater.full_reasons[0].startswith(f"mean of {TARGET_COLUMN} moved")
+
+
+def test_worse_model_on_the_new_rows_is_retrained(workspace, student_df):
+    updater = _start(student_df, LinearRegression(), reference_r2=1.0, min_test_rows=1)
+    _append(workspace, student_df.iloc[N_TRAINED:N_TRAINED + 100])
+
+    updater.initiate_incremental_update()
+    assert updater.full_reasons[0].startswith("R2 on the new rows")
+
+
+def test_linear_model_is_updated_in_place(workspace, student_df):
+    updater = _start(student_df, LinearRegression())
+    preprocessor_path = DataTransformationConfig().preprocessor_obj_file_path
+    preprocessor_hash = hash_file(preprocessor_path)
+    _append(workspace, student_df.iloc[N_TRAINED:N_TRAINED + 100])
+
+    summary = updater.initiate_incremental_update()
+
+    assert summary["action"] == "incremental"
+    assert updater.full_reasons == []
+    state = _state(updater)
+    assert state["n_train_rows"] == N_TRAINED + summary["train_rows"]
+    assert state["source_offset"] == os.path.getsize(workspace)
+    ## The scaler takes the new rows, the linear model is solved again in that scaling
+    assert hash_file(preprocessor_path) != preprocessor_hash
+    ## The registry only watches the manifest, it must name the new files
+    with open(updater.trainer.model_trainer_config.manifest_file_path) as file_obj:
+        manifest = json.load(file_obj)
+    assert preprocessor_path in manifest["files"]
+    assert all(hash_file(path) == expected for path, expected in manifest["files"].items())
+
+
+def test_tree_model_waits_for_enough_rows(workspace, student_df):
+    updater = _start(student_df, GradientBoostingRegressor(n_estimators=20, random_state=0), min_warm_start_rows=50)
+    offset = _state(updater)["source_offset"]
+    _append(workspace, student_df.iloc[N_TRAINED:N_TRAINED + 10])
+
+    summary = updater.initiate_incremental_update()
+
+    assert summary["action"] == "none"
+    ## The rows are read again with the next ones
+    assert _state(updater)["source_offset"] == offset
+
+
+def test_tree_model_keeps_its_preprocessor(workspace, student_df):
+    model = GradientBoostingRegressor(n_estimators=20, random_state=0)
+    updater = _start(student_df, model)
+    preprocessor_path = DataTransformationConfig().preprocessor_obj_file_path
+    preprocessor_hash = hash_file(preprocessor_path)
+    X_trained = load_object(preprocessor_path).transform(student_df.iloc[:N_TRAINED])
+    before = model.predict(X_trained)
+    _append(workspace, student_df.iloc[N_TRAINED:N_TRAINED + 150])
+
+    summary = updater.initiate_incremental_update()
+
+    assert summary["action"] == "incremental"
+    assert hash_file(preprocessor_path) == preprocessor_hash
+    updated = load_object(updater.trainer.model_trainer_config.trained_model_file_path)
+    assert len(updated.estimators_) > 20
+    ## The stages fitted before the update still see the features they were trained on
+    stage_20 = list(updated.staged_predict(X_trained))[19]
+    np.testing.assert_allclose(stage_20, before)
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.neighbors import KNeighborsRegressor
+from sklearn.tree import DecisionTreeRegressor
+
+from src.components.model_export import compile_lite_model, export_lite_model
+from src.pipeline.lite_model import LiteModel
+
+
+def _xgboost():
+    xgboost = pytest.importorskip("xgboost")
+    return xgboost.XGBRegressor(n_estimators=20, max_depth=4)
+
+
+def _catboost():
+    catboost = pytest.importorskip("catboost")
+    return catboost.CatBoostRegressor(iterations=20, depth=4, verbose=0, allow_writing_files=False)
+
+
+MODELS = {
+    "LinearRegression": LinearRegression,
+    "DecisionTreeRegressor": lambda: DecisionTreeRegressor(max_depth=8, random_state=0),
+    "RandomForestRegressor": lambda: RandomForestRegressor(n_estimators=10, random_state=0),
+    "GradientBoostingRegressor": lambda: GradientBoostingRegressor(n_estimators=20, random_state=0),
+    "XGBRegressor": _xgboost,
+    "CatBoostRegressor": _catboost,
+}
+
+
+@pytest.mark.parametrize("model_name", list(MODELS))
+def test_lite_model_matches_predict(model_name, training_data, tmp_path):
+    X, y = training_data
+    model = MODELS[model_name]().fit(X, y)
+
+    lite_model = compile_lite_model(model, tmp_dir=str(tmp_path))
+
+    np.testing.assert_allclose(lite_model.predict(X), model.predict(X), rtol=0, atol=1e-3)
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_exported_lite_model_loads_with_the_same_predictions(mmap, training_data, encoder, tmp_path):
+    X, y = training_data
+    model = RandomForestRegressor(n_estimators=10, random_state=0).fit(X, y)
+    file_path = str(tmp_path / "model_lite.npz")
+
+    assert export_lite_model(model, file_path, X, encoder=encoder, tolerance=1e-3) == file_path
+    lite_model = LiteModel.load(file_path, mmap=mmap)
+
+    np.testing.assert_allclose(lite_model.predict(X), model.predict(X), rtol=0, atol=1e-3)
+    assert lite_model.model_name == "RandomForestRegressor"
+    assert lite_model.encoder is not None
+
+
+def test_unsupported_model_is_not_exported_and_an_old_file_is_removed(training_data, tmp_path):
+    X, y = training_data
+    file_path = str(tmp_path / "model_lite.npz")
+    export_lite_model(LinearRegression().fit(X, y), file_path, X)
+    assert os.path.exists(file_path)
+
+    assert export_lite_model(KNeighborsRegressor().fit(X, y), file_path, X) is None
+    assert not os.path.exists(file_path)
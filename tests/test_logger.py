@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+import queue
+import time
+
+import pytest
+
+from src import logger as logger_module
+from src.logger import JsonFormatter, LoggingConfig, _BatchWriter, _NonBlockingQueueHandler
+
+
+def _writer(tmp_path, **config):
+    config = LoggingConfig(log_dir=str(tmp_path), file_name="app.log", **config)
+    return _BatchWriter(config, queue.Queue(maxsize=config.queue_size), JsonFormatter())
+
+
+def _record(message):
+    return logging.makeLogRecord({"name": "test", "levelno": logging.INFO, "levelname": "INFO", "msg": message})
+
+
+def _messages(file_path):
+    with open(file_path) as file_obj:
+        return [json.loads(line)["message"] for line in file_obj]
+
+
+def _backups(tmp_path):
+    return sorted(name for name in os.listdir(tmp_path) if name.startswith("app.log."))
+
+
+def test_records_are_written_as_json_lines(tmp_path):
+    writer = _writer(tmp_path)
+
+    writer._write([_record("first"), _record("second")])
+
+    assert _messages(writer.file_path) == ["first", "second"]
+
+
+def test_file_is_rotated_by_size(tmp_path):
+    writer = _writer(tmp_path, max_bytes=1000, backup_count=2)
+
+    for k in range(20):
+        writer._write([_record(f"record {k}")])
+
+    backups = _backups(tmp_path)
+    assert len(backups) == 2
+    assert os.path.getsize(writer.file_path) <= 1000
+    assert _messages(writer.file_path)[-1] == "record 19"
+
+
+def test_file_is_rotated_by_age(tmp_path):
+    writer = _writer(tmp_path, rotate_interval=60)
+    writer._write([_record("old")])
+    writer._opened_at -= 120
+
+    writer._write([_record("new")])
+
+    assert _messages(writer.file_path) == ["new"]
+    assert len(_backups(tmp_path)) == 1
+
+
+def test_age_survives_a_restart(tmp_path):
+    writer = _writer(tmp_path, rotate_interval=60)
+    writer._write([_record("before the restart")])
+    opened_at = writer._opened_at
+
+    ## A new process (or a restart) appending to the same file keeps counting from its start
+    restarted = _writer(tmp_path, rotate_interval=60)
+    restarted._write([_record("after the restart")])
+    assert restarted._opened_at == opened_at
+    assert _backups(tmp_path) == []
+
+    with open(restarted.opened_at_path) as file_obj:
+        sidecar = json.load(file_obj)
+    sidecar["opened_at"] -= 120
+    with open(restarted.opened_at_path, "w") as file_obj:
+        json.dump(sidecar, file_obj)
+    late = _writer(tmp_path, rotate_interval=60)
+    late._write([_record("one")])
+    late._write([_record("two")])
+    assert _messages(late.file_path) == ["two"]
+
+
+def test_sidecar_of_a_rotated_file_is_not_reused(tmp_path):
+    writer = _writer(tmp_path)
+    writer._write([_record("first file")])
+    os.rename(writer.file_path, writer.file_path + ".rotated")
+    old_opened_at = writer._opened_at
+    time.sleep(0.01)
+
+    restarted = _writer(tmp_path)
+    restarted._write([_record("second file")])
+
+    assert restarted._opened_at > old_opened_at
+
+
+def _stalled_handler(writer):
+    ## A writer thread that never runs, so the records stay in the queue
+    writer._thread, writer._pid = object(), os.getpid()
+    return _NonBlockingQueueHandler(writer.queue, writer)
+
+
+def test_dropped_records_are_counted_and_reported(tmp_path):
+    writer = _writer(tmp_path, queue_size=2)
+    handler = _stalled_handler(writer)
+
+    for k in range(5):
+        handler.emit(_record(f"record {k}"))
+
+    assert writer.dropped == 3
+    writer._write([writer.queue.get_nowait(), writer.queue.get_nowait()])
+    assert _messages(writer.file_path) == ["record 0", "record 1", "3 log records dropped, the log queue was full"]
+    assert writer.dropped == 0
+
+
+def test_forked_child_does_not_write_the_parent_records(tmp_path):
+    writer = _writer(tmp_path, flush_interval=0.01)
+    handler = _stalled_handler(writer)
+    handler.emit(_record("queued in the parent"))
+
+    writer.after_fork_in_child()
+    handler.emit(_record("logged in the child"))
+    writer.stop()
+
+    assert _messages(writer.file_path) == ["logged in the child"]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_fork_gives_the_child_a_new_queue():
+    parent_queue = logger_module._writer.queue
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            child_queue = logger_module._writer.queue
+            os.write(write_fd, json.dumps([child_queue is parent_queue, child_queue.qsize()]).encode())
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    os.waitpid(pid, 0)
+    with os.fdopen(read_fd) as file_obj:
+        same_queue, queued = json.load(file_obj)
+
+    assert same_queue is False
+    assert queued == 0
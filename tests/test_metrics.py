@@ -0,0 +1,97 @@
+import re
+
+import pytest
+
+from src.pipeline.metrics import LATENCY_BUCKETS, Histogram, MetricsConfig, PredictionMetrics
+
+## One sample line of the text exposition format: name, optional {labels}, value
+SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="(\\.|[^"\\])*",?)*\})? \S+$')
+
+
+def _samples(histogram):
+    return {f"{name}{labels}": value for name, labels, value in histogram.samples()}
+
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    histogram = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0, 10.0))
+    for value in (0.05, 0.1, 0.5, 1.0, 20.0):
+        histogram.observe(value)
+
+    assert _samples(histogram) == {
+        'latency_seconds_bucket{le="0.1"}': 2,  # A value on a bound counts in that bucket
+        'latency_seconds_bucket{le="1.0"}': 4,
+        'latency_seconds_bucket{le="10.0"}': 4,
+        'latency_seconds_bucket{le="+Inf"}': 5,
+        "latency_seconds_sum": pytest.approx(21.65),
+        "latency_seconds_count": 5,
+    }
+    assert histogram.count() == 5
+
+
+def test_histogram_series_per_label():
+    histogram = Histogram("phase_seconds", "Phases", buckets=(1.0,), labelnames=("phase",))
+    histogram.observe(0.5, "transform")
+    histogram.observe(2.0, "predict")
+    histogram.observe(0.5, "predict")
+
+    samples = _samples(histogram)
+    assert samples['phase_seconds_bucket{phase="predict",le="1.0"}'] == 1
+    assert samples['phase_seconds_count{phase="predict"}'] == 2
+    assert samples['phase_seconds_count{phase="transform"}'] == 1
+
+
+def test_render_is_valid_exposition_format():
+    metrics = PredictionMetrics(MetricsConfig(enabled=True, namespace="test"))
+    with metrics.time_request("predict"):
+        with metrics.time_phase("transform"):
+            pass
+    metrics.observe_batch(3, "columns")
+    metrics.count_error("predict", 'bad "quoted"\nkind')
+    metrics.model_loaded("loaded", 0.2)
+    metrics.count_cache("hit", amount=2)
+
+    text = metrics.render()
+
+    assert text.endswith("\n")
+    for line in text.splitlines():
+        if line.startswith("# HELP ") or line.startswith("# TYPE "):
+            continue
+        assert SAMPLE_LINE.match(line), line
+    assert "# TYPE test_request_seconds histogram" in text
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{endpoint="predict"} 1' in text
+    assert 'test_request_seconds_count{endpoint="predict"} 1' in text
+    assert f'test_prediction_phase_seconds_bucket{{phase="transform",le="{LATENCY_BUCKETS[-1]}"}} 1' in text
+    assert 'test_prediction_batch_size_bucket{source="columns",le="2.0"} 0' in text
+    assert 'test_prediction_batch_size_bucket{source="columns",le="4.0"} 1' in text
+    assert 'test_errors_total{endpoint="predict",kind="bad \\"quoted\\"\\nkind"} 1' in text
+    assert 'test_model_loads_total{outcome="loaded"} 1' in text
+    assert 'test_prediction_cache_lookups_total{result="hit"} 2' in text
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = PredictionMetrics(MetricsConfig(enabled=False, namespace="test"))
+    with metrics.time_request("predict"):
+        with metrics.time_phase("transform"):
+            pass
+    metrics.count_error("predict", "bad_request")
+    metrics.model_loaded("loaded", 0.2)
+
+    assert [line for line in metrics.render().splitlines() if not line.startswith("#")] == []
+
+
+def test_metrics_endpoint(app_module, student_df):
+    client = app_module.app.test_client()
+    records = student_df.drop(columns=["math_score"]).head(3).to_dict("records")
+    client.post("/predict", json=records)
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert "version=0.0.4" in response.headers["Content-Type"]
+    text = response.get_data(as_text=True)
+    assert 'student_performance_requests_total{endpoint="predict"}' in text
+    assert 'student_performance_model_loads_total{outcome="loaded"}' in text
+    for line in text.splitlines():
+        assert line.startswith("#") or SAMPLE_LINE.match(line), line
@@ -0,0 +1,154 @@
+import json
+
+import numpy as np
+import pytest
+from sklearn.linear_model import LinearRegression
+from sklearn.tree import DecisionTreeRegressor
+
+from src.components.model_export import export_lite_model
+from src.pipeline import model_registry as registry_module
+from src.pipeline.lite_model import LiteModel
+from src.pipeline.model_registry import ModelRegistry, ModelRegistryConfig
+from src.utils import hash_file, save_object, write_artifact_manifest
+
+
+@pytest.fixture
+def config(tmp_path):
+    return ModelRegistryConfig(
+        model_file_path=str(tmp_path / "model.pkl"),
+        preprocessor_file_path=str(tmp_path / "preprocessor.pkl"),
+        manifest_file_path=str(tmp_path / "manifest.json"),
+        lite_model_file_path=str(tmp_path / "model_lite.npz"),
+        prediction_table_file_path=str(tmp_path / "prediction_table.npy"),
+        reload_check_interval=0,
+    )
+
+
+def _save(config, model, preprocessor, lite_X=None, encoder=None):
+    """Saves the artifacts the way ModelTrainer does: files first, manifest last."""
+    save_object(config.model_file_path, model)
+    save_object(config.preprocessor_file_path, preprocessor)
+    file_paths = [config.model_file_path, config.preprocessor_file_path]
+    if lite_X is not None:
+        file_paths.append(export_lite_model(model, config.lite_model_file_path, lite_X, encoder=encoder))
+    write_artifact_manifest(config.manifest_file_path, file_paths)
+
+
+def _models(training_data):
+    X, y = training_data
+    return LinearRegression().fit(X, y), DecisionTreeRegressor(max_depth=3, random_state=0).fit(X, y)
+
+
+def test_artifacts_are_loaded_once(config, training_data, fitted_preprocessor, monkeypatch):
+    linear, _ = _models(training_data)
+    _save(config, linear, fitted_preprocessor)
+    loads = []
+    load_object = registry_module.load_object
+    monkeypatch.setattr(registry_module, "load_object", lambda **kwargs: loads.append(kwargs) or load_object(**kwargs))
+    registry = ModelRegistry(config)
+
+    bundles = [registry.get() for _ in range(5)]
+
+    assert all(bundle is bundles[0] for bundle in bundles)
+    assert len(loads) == 2  # model.pkl and preprocessor.pkl
+
+
+def test_process_registry_is_shared(monkeypatch):
+    monkeypatch.setattr(registry_module, "_model_registry", None)
+
+    assert registry_module.get_model_registry() is registry_module.get_model_registry()
+
+
+def test_new_manifest_is_reloaded(config, training_data, fitted_preprocessor):
+    linear, tree = _models(training_data)
+    _save(config, linear, fitted_preprocessor)
+    registry = ModelRegistry(config)
+    first = registry.get()
+
+    _save(config, tree, fitted_preprocessor)
+    second = registry.get()
+
+    assert second is not first
+    assert isinstance(second.model, DecisionTreeRegressor)
+    assert second.version != first.version
+
+
+def test_half_written_artifacts_are_skipped(config, training_data, fitted_preprocessor):
+    linear, tree = _models(training_data)
+    _save(config, linear, fitted_preprocessor)
+    registry = ModelRegistry(config)
+    first = registry.get()
+
+    ## The new manifest is in place but model.pkl is still being written
+    save_object(config.model_file_path, tree)
+    with open(config.manifest_file_path) as file_obj:
+        manifest = json.load(file_obj)
+    manifest["files"][config.model_file_path] = "0" * 64
+    with open(config.manifest_file_path, "w") as file_obj:
+        json.dump(manifest, file_obj)
+
+    assert registry.get() is first
+
+    ## Picked up once the set is complete
+    write_artifact_manifest(config.manifest_file_path, [config.model_file_path, config.preprocessor_file_path])
+    assert isinstance(registry.get().model, DecisionTreeRegressor)
+
+
+def test_model_replaced_without_a_new_manifest_is_not_served(config, training_data, fitted_preprocessor):
+    ## Every writer must rewrite the manifest, see ModelRegistry.artifact_version
+    linear, tree = _models(training_data)
+    _save(config, linear, fitted_preprocessor)
+    registry = ModelRegistry(config)
+    first = registry.get()
+
+    save_object(config.model_file_path, tree)
+
+    assert registry.get() is first
+
+
+def test_trainer_rewrites_the_manifest(tmp_path, monkeypatch, training_data, fitted_preprocessor):
+    from src.components.data_transformation import DataTransformationConfig
+    from src.components.model_trainer import ModelTrainer
+
+    monkeypatch.chdir(tmp_path)
+    X, _ = training_data
+    linear, tree = _models(training_data)
+    save_object(DataTransformationConfig().preprocessor_obj_file_path, fitted_preprocessor)
+    trainer = ModelTrainer()
+    trainer.model_trainer_config.export_prediction_table = False
+    trainer.save_model(linear, "LinearRegression", X)
+    registry = ModelRegistry(ModelRegistryConfig(reload_check_interval=0))
+    first = registry.get()
+
+    trainer.save_model(tree, "DecisionTreeRegressor", X)
+
+    with open(trainer.model_trainer_config.manifest_file_path) as file_obj:
+        manifest = json.load(file_obj)
+    assert all(hash_file(path) == expected for path, expected in manifest["files"].items())
+    assert registry.get() is not first
+
+
+def test_lite_model_is_served_when_the_manifest_lists_it(config, training_data, fitted_preprocessor, encoder):
+    X, _ = training_data
+    _, tree = _models(training_data)
+    _save(config, tree, fitted_preprocessor, lite_X=X, encoder=encoder)
+
+    bundle = ModelRegistry(config).get()
+
+    assert isinstance(bundle.model, LiteModel)
+    assert bundle.preprocessor is None
+    np.testing.assert_allclose(bundle.model.predict(X), tree.predict(X), atol=1e-3)
+
+
+def test_dill_artifacts_are_used_when_the_manifest_has_no_lite_model(config, training_data, fitted_preprocessor,
+                                                                     encoder):
+    X, _ = training_data
+    _, tree = _models(training_data)
+    ## A lite model of an older run is still on disk, but not listed
+    export_lite_model(tree, config.lite_model_file_path, X, encoder=encoder)
+    _save(config, tree, fitted_preprocessor)
+
+    bundle = ModelRegistry(config).get()
+
+    assert isinstance(bundle.model, DecisionTreeRegressor)
+    assert bundle.preprocessor is not None
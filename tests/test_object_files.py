@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from src.utils import OUT_OF_BAND_MAGIC, OUT_OF_BAND_MIN_BYTES, load_object, save_object
+
+## Float64 element counts just below and at the out-of-band threshold
+SMALL = OUT_OF_BAND_MIN_BYTES // 8 - 1
+LARGE = OUT_OF_BAND_MIN_BYTES // 8
+
+
+def _objects():
+    return {
+        "small": np.arange(SMALL, dtype=np.float64),
+        "large": np.arange(LARGE, dtype=np.float64),
+        "large_int": np.arange(3 * LARGE, dtype=np.int32).reshape(3, -1),
+        "fortran": np.asfortranarray(np.arange(2 * LARGE, dtype=np.float64).reshape(2, -1)),
+        "objects": np.array(["a", None, 1] * LARGE, dtype=object),
+        "text": "not an array",
+    }
+
+
+def _magic(file_path):
+    with open(file_path, "rb") as file_obj:
+        return file_obj.read(len(OUT_OF_BAND_MAGIC))
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_round_trip(tmp_path, mmap):
+    file_path = str(tmp_path / "object.pkl")
+    original = _objects()
+
+    save_object(file_path, original)
+    loaded = load_object(file_path, mmap=mmap)
+
+    assert _magic(file_path) == OUT_OF_BAND_MAGIC
+    assert loaded.keys() == original.keys()
+    for name, value in original.items():
+        if isinstance(value, np.ndarray):
+            assert loaded[name].dtype == value.dtype
+            np.testing.assert_array_equal(loaded[name], value)
+        else:
+            assert loaded[name] == value
+    assert loaded["fortran"].flags.f_contiguous
+
+
+def test_mmap_gives_read_only_views_above_the_threshold(tmp_path):
+    file_path = str(tmp_path / "object.pkl")
+    save_object(file_path, _objects())
+
+    mapped = load_object(file_path, mmap=True)
+    copied = load_object(file_path, mmap=False)
+
+    assert not mapped["large"].flags.writeable
+    assert not mapped["large"].flags.owndata
+    ## Below the threshold the array is inside the pickle stream, a private copy either way
+    assert mapped["small"].flags.writeable
+    assert copied["large"].flags.writeable
+    copied["large"][0] = -1.0
+    assert load_object(file_path, mmap=False)["large"][0] == 0.0
+
+
+def test_mapping_outlives_a_replaced_file(tmp_path):
+    file_path = str(tmp_path / "object.pkl")
+    save_object(file_path, {"large": np.ones(LARGE)})
+    mapped = load_object(file_path, mmap=True)
+
+    save_object(file_path, {"large": np.zeros(LARGE)})
+
+    assert mapped["large"].sum() == LARGE
+    assert load_object(file_path, mmap=True)["large"].sum() == 0
+
+
+@pytest.mark.parametrize("out_of_band", [True, False])
+def test_without_large_arrays_a_plain_dill_file_is_written(tmp_path, out_of_band):
+    file_path = str(tmp_path / "object.pkl")
+
+    save_object(file_path, {"small": np.arange(SMALL, dtype=np.float64)}, out_of_band=out_of_band)
+
+    assert _magic(file_path) != OUT_OF_BAND_MAGIC
+    assert load_object(file_path, mmap=True)["small"].sum() == np.arange(SMALL).sum()
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_fitted_model_predicts_the_same(tmp_path, training_data, mmap):
+    X, y = training_data
+    model = RandomForestRegressor(n_estimators=5, random_state=0).fit(X, y)
+    file_path = str(tmp_path / "model.pkl")
+
+    save_object(file_path, model)
+
+    np.testing.assert_array_equal(load_object(file_path, mmap=mmap).predict(X), model.predict(X))
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from src.pipeline.prediction_cache import PredictionCache, PredictionCacheConfig, SharedPredictionTable
+
+ROW = ("female", "group B", "bachelor's degree", "standard", "none", 72.0, 74.0)
+OTHER_ROW = ("male", "group C", "some college", "free/reduced", "completed", 50.0, 45.0)
+
+
+def _cache(**config):
+    return PredictionCache(PredictionCacheConfig(**dict({"shared_dir": None}, **config)))
+
+
+def test_hit_after_put():
+    cache = _cache()
+    assert cache.get_many("v1", [ROW]) == [None]
+
+    cache.put_many("v1", [ROW], [71.5])
+
+    assert cache.get_many("v1", [ROW, OTHER_ROW]) == [71.5, None]
+    assert cache.stats()["hits"] == 1
+
+
+def test_version_switch_drops_the_old_results():
+    cache = _cache()
+    cache.get_many("v1", [ROW])
+    cache.put_many("v1", [ROW], [71.5])
+
+    assert cache.get_many("v2", [ROW]) == [None]
+    ## A result computed with the old model after the switch is not kept either
+    cache.put_many("v1", [ROW], [71.5])
+    assert cache.get_many("v2", [ROW]) == [None]
+
+
+def test_shared_tier_is_seen_by_other_workers(tmp_path):
+    first = _cache(shared_dir=str(tmp_path), shared_slots=1024)
+    second = _cache(shared_dir=str(tmp_path), shared_slots=1024)
+    first.get_many("v1", [ROW])
+    first.put_many("v1", [ROW], [71.5])
+
+    assert second.get_many("v1", [ROW]) == [71.5]
+    assert second.stats()["shared_hits"] == 1
+
+
+def test_worker_on_the_old_version_keeps_working_after_a_switch(tmp_path):
+    old_worker = _cache(shared_dir=str(tmp_path), shared_slots=1024)
+    new_worker = _cache(shared_dir=str(tmp_path), shared_slots=1024, shared_stale_seconds=0)
+    old_worker.get_many("v1", [ROW])
+    old_file = old_worker._shared.file_path
+    os.utime(old_file, (0, 0))
+
+    ## The new worker removes the stale file of v1 while the old worker still uses it
+    new_worker.get_many("v2", [ROW])
+    assert not os.path.exists(old_file)
+
+    old_worker.put_many("v1", [ROW, OTHER_ROW], [71.5, 48.0])
+    assert old_worker.get_many("v1", [ROW, OTHER_ROW]) == [71.5, 48.0]
+    assert old_worker._shared is not None
+
+
+def test_recent_files_of_other_versions_are_kept(tmp_path):
+    old_worker = _cache(shared_dir=str(tmp_path), shared_slots=1024)
+    new_worker = _cache(shared_dir=str(tmp_path), shared_slots=1024)
+    old_worker.get_many("v1", [ROW])
+    new_worker.get_many("v2", [ROW])
+
+    assert os.path.exists(old_worker._shared.file_path)
+
+
+def test_failing_shared_tier_falls_back_to_memory(tmp_path, monkeypatch):
+    cache = _cache(shared_dir=str(tmp_path), shared_slots=1024)
+    cache.get_many("v1", [ROW])
+
+    def fail(*args):
+        raise OSError("disk gone")
+
+    monkeypatch.setattr(cache._shared, "put", fail)
+    cache.put_many("v1", [ROW], [71.5])
+
+    assert cache._shared is None
+    assert cache.get_many("v1", [ROW]) == [71.5]
+
+
+def test_same_slot_key_with_another_check_hash_is_a_miss(tmp_path):
+    table = SharedPredictionTable(str(tmp_path), "v1", n_slots=64, probe_length=4)
+    table.put((5, 1), 71.5)
+
+    assert table.get((5, 1)) == 71.5
+    assert table.get((5, 2)) is None
+
+
+@pytest.mark.parametrize("row", [ROW, OTHER_ROW])
+def test_key_hashes_are_stable_and_never_zero(row):
+    key, check = SharedPredictionTable.key_hash(row)
+    assert key != 0
+    assert SharedPredictionTable.key_hash(row) == (key, check)
@@ -0,0 +1,111 @@
+import os
+
+import numpy as np
+import pytest
+from sklearn.linear_model import LinearRegression
+
+from src.components.model_export import export_prediction_table
+from src.pipeline.model_registry import ModelBundle, ModelRegistry, ModelRegistryConfig
+from src.pipeline.predict_pipeline import PredictPipeline
+from src.pipeline.prediction_table import PredictionTable
+from src.pipeline.schema import FEATURE_COLUMNS
+
+## A small score range keeps the grid (and the test) small
+SCORE_RANGE = (40, 60)
+
+
+@pytest.fixture(scope="module")
+def model(training_data):
+    X, y = training_data
+    return LinearRegression().fit(X, y)
+
+
+@pytest.fixture(scope="module")
+def table(model, encoder, tmp_path_factory):
+    file_path = str(tmp_path_factory.mktemp("table") / "prediction_table.npy")
+    assert export_prediction_table(model, encoder, file_path, score_range=SCORE_RANGE) == file_path
+    return PredictionTable.load(file_path)
+
+
+def _record(student_df, i, **changes):
+    record = student_df[FEATURE_COLUMNS].iloc[i].to_dict()
+    record.update(reading_score=50.0, writing_score=45.0)
+    record.update(changes)
+    return record
+
+
+def _model_predictions(model, encoder, records):
+    columns = {column: [record[column] for record in records] for column in FEATURE_COLUMNS}
+    return model.predict(encoder.transform_columns(columns))
+
+
+def test_on_grid_records_are_found(table, model, encoder, student_df):
+    records = [_record(student_df, i, reading_score=40 + i % 21, writing_score=60 - i % 21) for i in range(200)]
+    columns = {column: [record[column] for record in records] for column in FEATURE_COLUMNS}
+
+    predictions, found = table.lookup_columns(columns)
+
+    assert found.all()
+    np.testing.assert_allclose(predictions, _model_predictions(model, encoder, records), atol=1e-4)
+    row = [records[0][column] for column in FEATURE_COLUMNS]
+    assert table.lookup_row(row, FEATURE_COLUMNS) == pytest.approx(predictions[0], abs=1e-6)
+
+
+@pytest.mark.parametrize("changes", [
+    {"reading_score": 50.5},      # Not a whole number
+    {"writing_score": 61.0},      # Outside the score range of the table
+    {"gender": "unknown"},        # Category the encoder was not fitted on
+    {"lunch": None},
+    {"reading_score": None},
+])
+def test_off_grid_records_are_misses(table, student_df, changes):
+    records = [_record(student_df, 0), _record(student_df, 1, **changes)]
+    columns = {column: [record[column] for record in records] for column in FEATURE_COLUMNS}
+
+    predictions, found = table.lookup_columns(columns)
+
+    assert found.tolist() == [True, False]
+    assert np.isnan(predictions[1])
+    assert table.lookup_row([records[1][column] for column in FEATURE_COLUMNS], FEATURE_COLUMNS) is None
+
+
+class _Registry:
+    def __init__(self, bundle):
+        self.bundle = bundle
+
+    def get(self):
+        return self.bundle
+
+
+def test_pipeline_scores_the_misses_with_the_model(table, model, encoder, student_df):
+    bundle = ModelBundle(model=model, preprocessor=None, version=("test",), loaded_at=0.0,
+                         encoder=encoder, prediction_table=table)
+    pipeline = PredictPipeline(registry=_Registry(bundle))
+    records = [_record(student_df, 0), _record(student_df, 1, reading_score=50.5),
+               _record(student_df, 2, writing_score=99.0), _record(student_df, 3)]
+
+    predictions, errors = pipeline.predict_batch(records)
+
+    assert errors == []
+    np.testing.assert_allclose(predictions, _model_predictions(model, encoder, records), atol=1e-4)
+    assert pipeline.predict_rows([[records[1][column] for column in FEATURE_COLUMNS]])[0] == pytest.approx(
+        predictions[1], abs=1e-9
+    )
+
+
+def test_table_of_another_export_is_refused(model, encoder, tmp_path):
+    file_path = str(tmp_path / "prediction_table.npy")
+    export_prediction_table(model, encoder, file_path, score_range=SCORE_RANGE)
+    old_values = np.load(file_path)
+
+    export_prediction_table(model, encoder, file_path, score_range=(30, 50))
+    assert sorted(os.listdir(tmp_path)) == ["prediction_table.json", "prediction_table.npy"]  # No temporary files
+    ## As seen between the two replaces of an export, or after a crash there: new axes, old cells
+    np.save(file_path, old_values)
+
+    with pytest.raises(ValueError, match="does not match"):
+        PredictionTable.load(file_path)
+
+    ## Serving keeps scoring with the model instead of failing the load
+    registry = ModelRegistry(ModelRegistryConfig(prediction_table_file_path=file_path))
+    assert registry._load_prediction_table({"files": {file_path: None}}) is None
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from src.pipeline.predict_pipeline import CustomData
+from src.pipeline.schema import (
+    CATEGORY_ERROR,
+    FEATURE_COLUMNS,
+    NUMBER_ERROR,
+    RANGE_ERROR,
+    RECORD_ERROR,
+    CategoricalColumn,
+    SchemaError,
+    coerce_record,
+    coerce_records,
+)
+
+VALID = {
+    "gender": "female",
+    "race_ethnicity": "group B",
+    "parental_level_of_education": "bachelor's degree",
+    "lunch": "standard",
+    "test_preparation_course": "none",
+    "reading_score": 72,
+    "writing_score": 74,
+}
+
+
+def test_valid_record_is_coerced():
+    record = dict(VALID, gender="  female ", reading_score="72.5")
+    assert coerce_record(record) == ["female", "group B", "bachelor's degree", "standard", "none", 72.5, 74.0]
+
+
+@pytest.mark.parametrize("changes, errors", [
+    ({"gender": ""}, {"gender": CATEGORY_ERROR}),
+    ({"lunch": None}, {"lunch": CATEGORY_ERROR}),
+    ({"lunch": ["standard"]}, {"lunch": CATEGORY_ERROR}),
+    ({"reading_score": "abc"}, {"reading_score": NUMBER_ERROR}),
+    ({"reading_score": True}, {"reading_score": NUMBER_ERROR}),
+    ({"reading_score": 10 ** 400}, {"reading_score": NUMBER_ERROR}),
+    ({"writing_score": 150}, {"writing_score": RANGE_ERROR}),
+    ({"writing_score": float("nan")}, {"writing_score": RANGE_ERROR}),
+    ({"gender": " ", "writing_score": -1}, {"gender": CATEGORY_ERROR, "writing_score": RANGE_ERROR}),
+])
+def test_invalid_fields_are_reported(changes, errors):
+    with pytest.raises(SchemaError) as raised:
+        coerce_record(dict(VALID, **changes))
+    assert raised.value.errors == errors
+
+    ## The batch path reports exactly the same errors
+    columns, valid_indices, batch_errors = coerce_records([VALID, dict(VALID, **changes)])
+    assert valid_indices == [0]
+    assert batch_errors == [{"index": 1, "errors": errors}]
+
+
+def test_batch_keeps_the_valid_records_in_order():
+    records = [VALID, "not a record", dict(VALID, gender="male"), dict(VALID, reading_score=None)]
+
+    columns, valid_indices, errors = coerce_records(records)
+
+    assert valid_indices == [0, 2]
+    assert errors == [{"index": 1, "errors": {"record": RECORD_ERROR}},
+                      {"index": 3, "errors": {"reading_score": NUMBER_ERROR}}]
+    assert list(columns) == FEATURE_COLUMNS
+    assert list(columns["gender"]) == ["female", "male"]
+    assert columns["reading_score"].tolist() == [72.0, 72.0]
+
+
+def test_error_message_names_every_field():
+    with pytest.raises(SchemaError, match="lunch is required and must be a non-empty string; writing_score"):
+        CustomData.from_record(dict(VALID, lunch="", writing_score=101))
+
+
+def test_from_form_maps_the_form_fields():
+    ## templates/home.html names the ethnicity field "ethnicity"
+    form = {
+        "gender": "male",
+        "ethnicity": "group C",
+        "parental_level_of_education": "some college",
+        "lunch": "free/reduced",
+        "test_preparation_course": "completed",
+        "reading_score": "61",
+        "writing_score": "58",
+    }
+
+    data = CustomData.from_form(form)
+
+    assert data.race_ethnicity == "group C"
+    assert data.reading_score == 61.0
+    assert data.writing_score == 58.0
+    assert data.get_data_as_row() == ["male", "group C", "some college", "free/reduced", "completed", 61.0, 58.0]
+
+
+def test_from_form_rejects_a_missing_field():
+    form = {"gender": "male", "race_ethnicity": "group C"}
+    with pytest.raises(SchemaError) as raised:
+        CustomData.from_form(form)
+    assert raised.value.errors["race_ethnicity"] == CATEGORY_ERROR
+    assert raised.value.errors["reading_score"] == NUMBER_ERROR
+
+
+def test_categorical_column_behaves_like_a_list():
+    column = CategoricalColumn(np.array([1, 0, 1]), ["female", "male"])
+
+    assert list(column) == ["male", "female", "male"]
+    assert column[2] == "male"
+    assert list(column[np.array([True, False, True])]) == ["male", "male"]
+    calls = []
+    mapped = column.map(lambda value: calls.append(value) or len(value))
+    assert mapped.tolist() == [4, 6, 4]
+    assert calls == ["female", "male"]  # Once per distinct value
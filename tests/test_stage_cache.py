@@ -0,0 +1,145 @@
+import os
+
+import numpy as np
+import pytest
+from scipy import sparse
+
+from src.components import data_ingestion as ingestion_module
+from src.components.data_ingestion import DataIngestion
+from src.stage_cache import StageCache, StageCacheConfig
+from src.utils import hash_file
+
+
+def _stage_v1(x):
+    return x + 1
+
+
+def _stage_v2(x):
+    return x + 2
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return StageCache(StageCacheConfig(cache_dir=str(tmp_path / "cache"), max_entries_per_stage=2))
+
+
+def test_fingerprint_follows_inputs_config_and_code(cache, tmp_path):
+    source = tmp_path / "source.csv"
+    source.write_text("a,b\n1,2\n")
+    base = cache.fingerprint("stage", inputs=[str(source)], config={"k": 1}, code=[_stage_v1])
+
+    assert cache.fingerprint("stage", inputs=[str(source)], config={"k": 1}, code=[_stage_v1]) == base
+    assert cache.fingerprint("stage", inputs=[str(source)], config={"k": 2}, code=[_stage_v1]) != base
+    assert cache.fingerprint("stage", inputs=[str(source)], config={"k": 1}, code=[_stage_v2]) != base
+    assert cache.fingerprint("other", inputs=[str(source)], config={"k": 1}, code=[_stage_v1]) != base
+    ## Files are hashed by their content, not their path or modification time
+    source.write_text("a,b\n1,3\n")
+    assert cache.fingerprint("stage", inputs=[str(source)], config={"k": 1}, code=[_stage_v1]) != base
+
+
+def test_fingerprint_of_arrays(cache):
+    X = np.arange(12.0).reshape(3, 4)
+
+    assert cache.fingerprint("stage", inputs=[X]) == cache.fingerprint("stage", inputs=[X.copy()])
+    assert cache.fingerprint("stage", inputs=[X]) != cache.fingerprint("stage", inputs=[X.reshape(4, 3)])
+    assert cache.fingerprint("stage", inputs=[X]) != cache.fingerprint("stage", inputs=[X.astype(np.float32)])
+    assert cache.fingerprint("stage", inputs=[sparse.csr_matrix(X)]) == cache.fingerprint(
+        "stage", inputs=[sparse.coo_matrix(X)]
+    )
+
+
+def test_stored_outputs_are_restored(cache, tmp_path):
+    output = tmp_path / "out" / "train.csv"
+    output.parent.mkdir()
+    output.write_text("train data")
+    fingerprint = cache.fingerprint("stage", config={"k": 1})
+    assert cache.lookup("stage", fingerprint) is None
+
+    cache.store("stage", fingerprint, files={"train": str(output)}, arrays={"y": np.arange(3)},
+                metadata={"score": 0.9})
+    output.write_text("changed by a later run")
+
+    entry = cache.lookup("stage", fingerprint)
+    cache.restore_files(entry, {"train": str(output)})
+    assert output.read_text() == "train data"
+    assert cache.load_array(entry, "y").tolist() == [0, 1, 2]
+    assert entry["metadata"] == {"score": 0.9}
+
+
+def test_disabled_cache_never_hits(tmp_path):
+    cache = StageCache(StageCacheConfig(cache_dir=str(tmp_path), enabled=False))
+    cache.store("stage", "abc", metadata={"score": 1})
+
+    assert cache.lookup("stage", "abc") is None
+
+
+def test_old_entries_are_pruned(cache, tmp_path):
+    for k in range(4):
+        fingerprint = cache.fingerprint("stage", config={"k": k})
+        cache.store("stage", fingerprint, metadata={"k": k})
+        os.utime(os.path.join(cache.cache_config.cache_dir, "stage", fingerprint, "entry.json"), (k, k))
+
+    kept = [cache.lookup("stage", cache.fingerprint("stage", config={"k": k})) is not None for k in range(4)]
+    assert kept == [False, False, True, True]
+
+
+@pytest.fixture
+def ingestion(tmp_path, monkeypatch, student_df):
+    """DataIngestion working in a temporary folder, counting the reads of the source data."""
+    monkeypatch.chdir(tmp_path)
+    ingestion = DataIngestion()
+    os.makedirs(os.path.dirname(ingestion.ingestion_config.source_data_path))
+    student_df.head(200).to_csv(ingestion.ingestion_config.source_data_path, index=False)
+
+    ingestion.reads = []
+    read_csv = ingestion_module.pd.read_csv
+
+    def counting_read_csv(*args, **kwargs):
+        ingestion.reads.append(args)
+        return read_csv(*args, **kwargs)
+
+    monkeypatch.setattr(ingestion_module.pd, "read_csv", counting_read_csv)
+    return ingestion
+
+
+def test_unchanged_stage_is_skipped(ingestion):
+    train_path, test_path, _ = ingestion.initiate_data_ingestion()
+    train_hash = hash_file(train_path)
+    os.remove(train_path)
+
+    assert DataIngestion().initiate_data_ingestion()[0] == train_path
+    assert len(ingestion.reads) == 1
+    ## The skipped stage still leaves its outputs in place
+    assert hash_file(train_path) == train_hash
+
+
+def test_changed_input_reruns_the_stage(ingestion, student_df):
+    ingestion.initiate_data_ingestion()
+    student_df.head(300).to_csv(ingestion.ingestion_config.source_data_path, index=False)
+
+    ingestion.initiate_data_ingestion()
+
+    assert len(ingestion.reads) == 2
+
+
+def test_changed_config_reruns_the_stage(ingestion):
+    ingestion.initiate_data_ingestion()
+    ingestion.ingestion_config.test_size = 0.3
+
+    ingestion.initiate_data_ingestion()
+
+    assert len(ingestion.reads) == 2
+
+
+def test_changed_code_reruns_the_stage(ingestion, monkeypatch):
+    ingestion.initiate_data_ingestion()
+    fingerprint = ingestion.stage_cache.fingerprint
+
+    def edited_fingerprint(stage_name, inputs=(), config=None, code=()):
+        ## As if the source of DataIngestion had been edited
+        return fingerprint(stage_name, inputs, config, code=[_stage_v2])
+
+    monkeypatch.setattr(ingestion.stage_cache, "fingerprint", edited_fingerprint)
+    ingestion.initiate_data_ingestion()
+
+    assert len(ingestion.reads) == 2
@@ -0,0 +1,142 @@
+import json
+import os
+
+import pytest
+
+from src.components.data_ingestion import DataIngestionConfig
+from src.exception import CustomException
+from src.pipeline.train_pipeline import Stage, StageRunner, TrainPipeline, TrainPipelineConfig
+
+## Names of the stages that ran, in order (the runner uses threads by default)
+calls = []
+## Stages that raise until they are removed from here
+failing = set()
+
+
+def _stage(name):
+    def func(*inputs):
+        calls.append(name)
+        if name in failing:
+            raise RuntimeError(f"{name} failed")
+        return [name, *inputs]
+    return func
+
+
+def _stages():
+    ## a -> (b, c) -> d
+    return [
+        Stage("a", _stage("a")),
+        Stage("b", _stage("b"), ("a",)),
+        Stage("c", _stage("c"), ("a",)),
+        Stage("d", _stage("d"), ("b", "c")),
+    ]
+
+
+@pytest.fixture
+def config(tmp_path):
+    calls.clear()
+    failing.clear()
+    return TrainPipelineConfig(
+        checkpoint_dir=str(tmp_path / "checkpoints"),
+        report_file_path=str(tmp_path / "report.json"),
+        max_workers=2,
+    )
+
+
+def test_stages_get_the_outputs_of_their_dependencies(config):
+    outputs = StageRunner(_stages(), config).run()
+
+    assert outputs["d"] == ["d", ["b", ["a"]], ["c", ["a"]]]
+    assert calls[0] == "a" and calls[-1] == "d"
+    with open(config.report_file_path) as file_obj:
+        assert list(json.load(file_obj)["stages"]) == ["a", "b", "c", "d"]
+    ## Nothing is left to resume after a successful run
+    assert not os.path.exists(config.checkpoint_dir)
+
+
+@pytest.mark.parametrize("stages, message", [
+    ([Stage("a", _stage("a"), ("missing",))], "unknown stage"),
+    ([Stage("a", _stage("a"), ("b",)), Stage("b", _stage("b"), ("a",))], "cycle"),
+])
+def test_invalid_graphs_are_rejected(stages, message):
+    with pytest.raises(ValueError, match=message):
+        StageRunner(stages)
+
+
+def test_resume_skips_the_completed_stages(config):
+    failing.add("d")
+    with pytest.raises(CustomException):
+        StageRunner(_stages(), config, inputs_key="v1").run()
+    assert sorted(calls) == ["a", "b", "c", "d"]
+
+    calls.clear()
+    failing.clear()
+    runner = StageRunner(_stages(), config, inputs_key="v1")
+    outputs = runner.run()
+
+    assert calls == ["d"]
+    assert outputs["d"] == ["d", ["b", ["a"]], ["c", ["a"]]]
+    assert {name: report["status"] for name, report in runner.stage_report.items()} == {
+        "a": "resumed", "b": "resumed", "c": "resumed", "d": "ran"
+    }
+
+
+def test_changed_inputs_rerun_the_stages(config):
+    failing.add("d")
+    with pytest.raises(CustomException):
+        StageRunner(_stages(), config, inputs_key="v1").run()
+
+    calls.clear()
+    failing.clear()
+    StageRunner(_stages(), config, inputs_key="v2").run()
+
+    assert sorted(calls) == ["a", "b", "c", "d"]
+
+
+def test_changed_graph_reruns_the_stages(config):
+    failing.add("d")
+    with pytest.raises(CustomException):
+        StageRunner(_stages(), config).run()
+
+    calls.clear()
+    failing.clear()
+    stages = _stages()[:3] + [Stage("d", _stage("d"), ("b",))]
+    StageRunner(stages, config).run()
+
+    assert sorted(calls) == ["a", "b", "c", "d"]
+
+
+def test_resume_can_be_turned_off(config):
+    failing.add("d")
+    with pytest.raises(CustomException):
+        StageRunner(_stages(), config).run()
+
+    calls.clear()
+    failing.clear()
+    config.resume = False
+    StageRunner(_stages(), config).run()
+
+    assert sorted(calls) == ["a", "b", "c", "d"]
+
+
+def test_restore_is_used_instead_of_a_pickle(config):
+    failing.add("b")
+    stages = [Stage("a", _stage("a"), restore=lambda: ["a", "restored"]), Stage("b", _stage("b"), ("a",))]
+    with pytest.raises(CustomException):
+        StageRunner(stages, config).run()
+    assert not os.path.exists(os.path.join(config.checkpoint_dir, "a.pkl"))
+
+    failing.clear()
+    assert StageRunner(stages, config).run()["b"] == ["b", ["a", "restored"]]
+
+
+def test_inputs_key_follows_the_source_data(tmp_path, monkeypatch, student_df):
+    monkeypatch.chdir(tmp_path)
+    source_path = DataIngestionConfig().source_data_path
+    os.makedirs(os.path.dirname(source_path))
+    student_df.head(100).to_csv(source_path, index=False)
+    key = TrainPipeline().inputs_key()
+
+    assert TrainPipeline().inputs_key() == key
+    student_df.head(101).to_csv(source_path, index=False)
+    assert TrainPipeline().inputs_key() != key